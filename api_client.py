@@ -0,0 +1,276 @@
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from http_cache import HttpCache
+from rate_limiter import AdaptiveTokenBucket
+
+# Statuses worth retrying, since they say nothing about the request itself
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses meaning the API is asking for fewer requests
+THROTTLE_STATUSES = {429, 503}
+
+
+def retry_after_seconds(response: requests.Response) -> float | None:
+    """Return the seconds a response asks to wait before retrying, from its Retry-After header.
+
+    Args:
+        response (requests.Response): Response from the API.
+
+    Returns:
+        float | None: Seconds to wait, or None if the header is missing or invalid.
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # Otherwise the header is an HTTP date
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def response_bytes(response: requests.Response) -> int:
+    """Return the size of a response body as sent by the server, from its Content-Length header.
+
+    Args:
+        response (requests.Response): Response from the API.
+
+    Returns:
+        int: Bytes received, or the size of the decoded body if the header is missing or invalid.
+    """
+    try:
+        return int(response.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return len(response.content)
+
+
+class ApiClient:
+    """Class for making GET requests to a rate-limited API, retrying failures.
+
+    Throttled (429, 503) and server error (5xx) responses are retried, as are connection errors, timeouts
+    and invalid JSON. Retries wait for the time in the Retry-After header if there is one, otherwise for an
+    exponential backoff with jitter. The request rate adapts to the throttling seen, see `AdaptiveTokenBucket`.
+    Other error responses are raised straight away, since retrying them would not help.
+
+    With a cache, JSON responses are kept and revalidated with conditional requests, see `HttpCache`.
+    """
+
+    def __init__(
+        self,
+        headers: Dict[str, str] | None = None,
+        rate_limiter: AdaptiveTokenBucket | None = None,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 30.0,
+        timeout: float = 30.0,
+        pool_size: int = 10,
+        cache: HttpCache | None = None,
+        on_transfer: Callable[[str, int], None] | None = None,
+    ):
+        """Create an API client.
+
+        Args:
+            headers (Dict[str, str] | None, optional): Headers sent with every request. Defaults to None.
+            rate_limiter (AdaptiveTokenBucket | None, optional): Rate limiter shared between all requests.
+                Defaults to no limit.
+            max_retries (int, optional): Times a failed request is retried. Defaults to 3.
+            backoff_seconds (float, optional): Longest wait before the first retry, doubled for each later
+                retry. Defaults to 0.5.
+            max_backoff_seconds (float, optional): Longest wait before any retry. Defaults to 30.0.
+            timeout (float, optional): Seconds to wait for the API to respond. Defaults to 30.0.
+            pool_size (int, optional): Connections kept open to the API, one per concurrent request.
+                Defaults to 10.
+            cache (HttpCache | None, optional): Cache for the responses of `get_json`. Defaults to no cache.
+            on_transfer (Callable[[str, int], None] | None, optional): Called with 'extract' and the bytes
+                received, for every response including the ones retried. Defaults to None.
+        """
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.on_transfer = on_transfer
+        self._max_retries = max_retries
+        self._backoff_seconds = backoff_seconds
+        self._max_backoff_seconds = max_backoff_seconds
+        self._timeout = timeout
+
+        # Reuse connections between requests
+        self._session = requests.Session()
+        self._session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def backoff(self, attempt: int) -> float:
+        """Return a random wait before a retry, up to a limit doubling with each attempt ("full jitter").
+
+        Args:
+            attempt (int): Number of the failed attempt, starting from 0.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        return random.uniform(0, min(self._max_backoff_seconds, self._backoff_seconds * 2 ** attempt))
+
+    def get(self, url: str, headers: Dict[str, str] | None = None) -> requests.Response:
+        """Send a GET request, retrying throttled and failed requests.
+
+        Args:
+            url (str): URL to request.
+            headers (Dict[str, str] | None, optional): Headers added to the client headers. Defaults to None.
+
+        Raises:
+            requests.HTTPError: If the API responded with an error that is not worth retrying, or still
+                responded with an error after all retries.
+            requests.RequestException: If the API could not be reached after all retries.
+
+        Returns:
+            requests.Response: Successful (or 304 Not Modified) response.
+        """
+        for attempt in range(self._max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire() # wait for a token to avoid rate limit
+            sent_at = time.monotonic()
+            try:
+                response = self._session.get(url, headers=headers, timeout=self._timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self._max_retries:
+                    raise
+                time.sleep(self.backoff(attempt))
+                continue
+            if self.on_transfer is not None:
+                self.on_transfer("extract", response_bytes(response))
+
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                if self.rate_limiter is not None:
+                    self.rate_limiter.on_success()
+                return response
+            if attempt == self._max_retries:
+                response.raise_for_status()
+
+            retry_after = retry_after_seconds(response)
+            wait = retry_after if retry_after is not None else self.backoff(attempt)
+            if response.status_code in THROTTLE_STATUSES and self.rate_limiter is not None:
+                # The rate limiter holds back every request until the API can be retried
+                self.rate_limiter.on_throttle(pause=wait, sent_at=sent_at)
+            else:
+                time.sleep(wait)
+
+    def get_json(self, url: str, headers: Dict[str, str] | None = None, cached: bool = True) -> dict:
+        """Send a GET request and return its JSON body, retrying responses that are not valid JSON.
+
+        With a cache, a fresh cached response is returned without sending a request, and a stale one is
+        revalidated with a conditional request.
+
+        Args:
+            url (str): URL to request.
+            headers (Dict[str, str] | None, optional): Headers added to the client headers. Defaults to None.
+            cached (bool, optional): Use the cache, if the client has one. Defaults to True.
+
+        Raises:
+            requests.HTTPError: If the API responded with an error, see `get`.
+            requests.RequestException: If the API could not be reached, see `get`.
+            requests.JSONDecodeError: If the body was still not valid JSON after all retries.
+
+        Returns:
+            dict: JSON body of the response.
+        """
+        cache = self.cache if cached else None
+        cached_response = cache.get(url) if cache is not None else None
+        if cached_response is not None and cache.is_fresh(cached_response):
+            return json.loads(cached_response.body)
+
+        for attempt in range(self._max_retries + 1):
+            if cached_response is not None:
+                response = self.get(url, {**(headers or {}), **cache.conditional_headers(cached_response)})
+                if response.status_code == 304:
+                    cache.revalidated(url)
+                    return json.loads(cached_response.body)
+            else:
+                response = self.get(url, headers)
+
+            try:
+                data = response.json()
+            except requests.JSONDecodeError:
+                if attempt == self._max_retries:
+                    raise
+                time.sleep(self.backoff(attempt))
+                continue
+
+            if cache is not None:
+                cache.store(
+                    url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified")
+                )
+            return data
+
+
+class IndexCheckpoint:
+    """Class for saving the results of numbered requests as they arrive, so a failed run can continue.
+
+    Results are appended to a JSON Lines file, one line per index. A line left partially written by a
+    crash is ignored when the checkpoint is loaded.
+    """
+
+    def __init__(self, path: str):
+        """Create a checkpoint.
+
+        Args:
+            path (str): Path of the checkpoint file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[int, dict]:
+        """Return the saved results, keyed by index.
+
+        Returns:
+            Dict[int, dict]: Result of each index saved so far.
+        """
+        results = {}
+        try:
+            with open(self.path, "r") as checkpoint_file:
+                for line in checkpoint_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    results[entry["index"]] = entry["result"]
+        except FileNotFoundError:
+            pass
+        return results
+
+    def save(self, index: int, result: dict):
+        """Save the result of an index.
+
+        Args:
+            index (int): Index of the request.
+            result (dict): Result of the request.
+        """
+        line = json.dumps({"index": index, "result": result}) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as checkpoint_file:
+                checkpoint_file.write(line)
+
+    def clear(self):
+        """Remove the checkpoint, once every result has been used."""
+        with self._lock:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
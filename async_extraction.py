@@ -0,0 +1,206 @@
+import asyncio
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Coroutine, Dict, Iterable, Iterator, Tuple
+
+import pandas as pd
+
+from data_extraction import DataExtractor
+
+# Marks the end of the chunks put in a channel
+_END = object()
+
+
+def _drain(channel: queue.Queue) -> Iterator[pd.DataFrame]:
+    """Yield the chunks put in a channel until the end, raising any exception put in it instead."""
+    while True:
+        item = channel.get()
+        if item is _END:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+async def _put(channel: queue.Queue, item):
+    """Put an item in a channel without blocking the event loop, waiting while it is full."""
+    while True:
+        try:
+            channel.put_nowait(item)
+            return
+        except queue.Full:
+            await asyncio.sleep(0.01)
+
+
+class AsyncDataExtractor:
+    """Async facade over a DataExtractor, for overlapping the I/O of every source in one event loop.
+
+    The extraction methods block on the network (requests, boto3, psycopg2), so each call runs in a
+    worker thread, and any number of them can be awaited at once. The rows, in-memory size and time
+    spent waiting on each source are recorded, see `throughput`.
+    """
+
+    def __init__(self, extractor: DataExtractor, max_workers: int = 16):
+        """Create an async extractor.
+
+        Args:
+            extractor (DataExtractor): Extractor whose methods are run in worker threads.
+            max_workers (int, optional): Most extractions running at once. The threads only wait on I/O,
+                so there can be more than CPUs. Defaults to 16.
+        """
+        self.extractor = extractor
+        self.sources: Dict[str, dict] = {}
+        self._max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Shut down the worker threads."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    async def _in_thread(self, function: Callable, *args, **kwargs):
+        """Run a blocking function in a worker thread."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="extract")
+            executor = self._executor
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(function, *args, **kwargs))
+
+    def _record(self, source: str, dataframe: pd.DataFrame, seconds: float):
+        """Add the rows, bytes and seconds of extracted data to the totals of a source."""
+        with self._lock:
+            totals = self.sources.setdefault(source, {"rows": 0, "bytes": 0, "seconds": 0.0})
+            totals["rows"] += len(dataframe)
+            totals["bytes"] += int(dataframe.memory_usage(deep=True).sum())
+            totals["seconds"] += seconds
+
+    async def extract(self, source: str, function: Callable[..., pd.DataFrame], *args, **kwargs) -> pd.DataFrame:
+        """Run a blocking extraction in a worker thread.
+
+        Args:
+            source (str): Name the extraction is recorded under.
+            function (Callable[..., pd.DataFrame]): Function returning the extracted data.
+            *args, **kwargs: Arguments for the function.
+
+        Returns:
+            pd.DataFrame: Extracted data.
+        """
+        start_time = time.perf_counter()
+        dataframe = await self._in_thread(function, *args, **kwargs)
+        self._record(source, dataframe, time.perf_counter() - start_time)
+        return dataframe
+
+    async def extract_chunks(
+        self, source: str, function: Callable[..., Iterable[pd.DataFrame]], *args, **kwargs
+    ) -> AsyncIterator[pd.DataFrame]:
+        """Run a blocking chunked extraction, fetching each chunk in a worker thread.
+
+        Only the time spent fetching chunks is recorded, not the time the caller spends on each one.
+
+        Args:
+            source (str): Name the extraction is recorded under.
+            function (Callable[..., Iterable[pd.DataFrame]]): Function returning the chunks.
+            *args, **kwargs: Arguments for the function.
+
+        Yields:
+            AsyncIterator[pd.DataFrame]: Chunks, in order.
+        """
+        start_time = time.perf_counter()
+        iterator = await self._in_thread(lambda: iter(function(*args, **kwargs)))
+        while True:
+            chunk = await self._in_thread(next, iterator, None)
+            if chunk is None:
+                return
+            self._record(source, chunk, time.perf_counter() - start_time)
+            yield chunk
+            start_time = time.perf_counter()
+
+    def prefetch(self, source: str, function: Callable[[], pd.DataFrame]) -> Tuple[Future, Coroutine]:
+        """Prepare an extraction whose result a thread outside the event loop waits for.
+
+        Args:
+            source (str): Name the extraction is recorded under.
+            function (Callable[[], pd.DataFrame]): Function returning the extracted data.
+
+        Returns:
+            Tuple[Future, Coroutine]: Future holding the extracted data or its exception, and the
+                coroutine to run in the event loop to extract it.
+        """
+        future = Future()
+
+        async def fill():
+            try:
+                future.set_result(await self.extract(source, function))
+            except Exception as error:
+                future.set_exception(error)
+
+        return future, fill()
+
+    def prefetch_chunks(
+        self, source: str, function: Callable[[], Iterable[pd.DataFrame]], max_chunks: int = 2
+    ) -> Tuple[Iterator[pd.DataFrame], Coroutine]:
+        """Prepare a chunked extraction whose chunks a thread outside the event loop iterates over.
+
+        At most `max_chunks` chunks are fetched ahead of the thread, so memory stays bounded.
+
+        Args:
+            source (str): Name the extraction is recorded under.
+            function (Callable[[], Iterable[pd.DataFrame]]): Function returning the chunks.
+            max_chunks (int, optional): Most chunks held waiting for the thread. Defaults to 2.
+
+        Returns:
+            Tuple[Iterator[pd.DataFrame], Coroutine]: Iterator over the chunks, raising any exception of
+                the extraction, and the coroutine to run in the event loop to extract them.
+        """
+        channel = queue.Queue(maxsize=max_chunks)
+
+        async def fill():
+            try:
+                async for chunk in self.extract_chunks(source, function):
+                    await _put(channel, chunk)
+            except Exception as error:
+                await _put(channel, error)
+                return
+            await _put(channel, _END)
+
+        return _drain(channel), fill()
+
+    async def read_rds_table(self, table_name: str, **kwargs) -> pd.DataFrame:
+        """Async version of `DataExtractor.read_rds_table`, recorded under the table name."""
+        return await self.extract(table_name, self.extractor.read_rds_table, table_name, **kwargs)
+
+    def read_rds_table_chunks(self, table_name: str, **kwargs) -> AsyncIterator[pd.DataFrame]:
+        """Async version of `DataExtractor.read_rds_table_chunks`, recorded under the table name."""
+        return self.extract_chunks(table_name, self.extractor.read_rds_table_chunks, table_name, **kwargs)
+
+    async def retrieve_pdf_data(self, url: str) -> pd.DataFrame:
+        """Async version of `DataExtractor.retrieve_pdf_data`, recorded under the URL."""
+        return await self.extract(url, self.extractor.retrieve_pdf_data, url)
+
+    async def retrieve_stores_data(self) -> pd.DataFrame:
+        """Async version of `DataExtractor.retrieve_stores_data`, recorded as 'stores_api'."""
+        return await self.extract("stores_api", self.extractor.retrieve_stores_data)
+
+    async def extract_from_s3(self, s3_url: str, **kwargs) -> pd.DataFrame:
+        """Async version of `DataExtractor.extract_from_s3`, recorded under the S3 URL."""
+        return await self.extract(s3_url, self.extractor.extract_from_s3, s3_url, **kwargs)
+
+    def throughput(self) -> Dict[str, float]:
+        """Return the bytes extracted per second for each source.
+
+        Bytes are the in-memory size of the extracted DataFrames, seconds are the time spent waiting on the source.
+
+        Returns:
+            Dict[str, float]: Bytes per second for each source.
+        """
+        with self._lock:
+            return {
+                source: totals["bytes"] / totals["seconds"] if totals["seconds"] else 0.0
+                for source, totals in self.sources.items()
+            }
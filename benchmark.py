@@ -0,0 +1,581 @@
+import argparse
+import cProfile
+import glob
+import json
+import os
+import pstats
+import statistics
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import pandas as pd
+import sqlalchemy
+import yaml
+
+from data_cleaning import DataCleaning
+from data_extraction import DataExtractor
+from database_utils import DatabaseConnector
+from partitioned_cleaning import PartitionedCleaner
+from tests.reference import (
+    REFERENCE_CLEANERS,
+    SyntheticData,
+    reference_parse_dates,
+    reference_parse_phones,
+    reference_retrieve_stores,
+    reference_split_card_data,
+    serve_store_api,
+    sqlite_connector,
+    store_api_config,
+)
+
+
+def benchmark_cleaners(cleaner: DataCleaning, data: SyntheticData) -> Dict[str, tuple[Callable, Callable]]:
+    """Return the generator and cleaning method to benchmark for each cleaner, keyed by cleaner name."""
+    return {
+        "clean_user_data": (data.users, cleaner.clean_user_data),
+        "clean_card_data": (data.cards, cleaner.clean_card_data),
+        "clean_store_data": (data.stores, cleaner.clean_store_data),
+        "clean_products_data": (data.products, cleaner.clean_products_data),
+        "clean_orders_data": (data.orders, cleaner.clean_orders_data),
+        "clean_date_details_data": (data.date_details, cleaner.clean_date_details_data),
+    }
+
+
+def time_cleaner(generate: Callable, clean: Callable, rows: int, repeats: int) -> dict:
+    """Time a cleaner on generated data, returning the timings of each repeat in seconds.
+
+    Cleaners may modify their input, so each repeat cleans a fresh copy, which is not timed.
+    """
+    dataframe = generate(rows)
+    timings = []
+    for _ in range(repeats):
+        dirty = dataframe.copy()
+        start_time = time.perf_counter()
+        cleaned = clean(dirty)
+        timings.append(time.perf_counter() - start_time)
+
+    return {"rows_out": len(cleaned), **summarise_timings(rows, timings)}
+
+
+def summarise_timings(rows: int, timings: List[float]) -> dict:
+    """Return the timings of a benchmark with their best and median, and the best rows per second."""
+    best = min(timings)
+    return {
+        "rows": rows,
+        "timings": timings,
+        "best_seconds": best,
+        "median_seconds": statistics.median(timings),
+        "rows_per_second": rows / best if best else None,
+    }
+
+
+def time_function(function: Callable, repeats: int) -> tuple[List[float], object]:
+    """Time a function, returning the timings of each repeat in seconds and the result of the last one."""
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start_time)
+    return timings, result
+
+
+def run_benchmarks(scales: List[int], repeats: int = 3, cleaners: List[str] | None = None, seed: int = 0) -> dict:
+    """Benchmark each cleaner at each scale.
+
+    Args:
+        scales (List[int]): Numbers of rows to benchmark with.
+        repeats (int, optional): Number of times each benchmark is repeated. Defaults to 3.
+        cleaners (List[str] | None, optional): Names of the cleaners to benchmark. Defaults to all of them.
+        seed (int, optional): Seed for the synthetic data. Defaults to 0.
+
+    Returns:
+        dict: Results keyed by cleaner name, then number of rows.
+    """
+    benchmarks = benchmark_cleaners(DataCleaning(), SyntheticData(seed))
+    results = {}
+    for name, (generate, clean) in benchmarks.items():
+        if cleaners and name not in cleaners:
+            continue
+        results[name] = {}
+        for rows in scales:
+            result = time_cleaner(generate, clean, rows, repeats)
+            results[name][str(rows)] = result
+            print(f"{name} {rows} rows: {result['best_seconds']:.3f} seconds ({result['rows_per_second']:.0f} rows/second).")
+    return results
+
+
+def run_scaling_benchmark(
+    scales: List[int], workers: List[int], repeats: int = 3, cleaners: List[str] | None = None, seed: int = 0
+) -> dict:
+    """Benchmark cleaning partitioned across each number of worker processes.
+
+    The first repeat includes starting the workers, so the best time shows the cleaning alone.
+
+    Args:
+        scales (List[int]): Numbers of rows to benchmark with.
+        workers (List[int]): Numbers of worker processes to benchmark with. 1 cleans in this process.
+        repeats (int, optional): Number of times each benchmark is repeated. Defaults to 3.
+        cleaners (List[str] | None, optional): Names of the cleaners to benchmark. Defaults to the
+            cleaners of the largest tables, orders_table and legacy_users.
+        seed (int, optional): Seed for the synthetic data. Defaults to 0.
+
+    Returns:
+        dict: Results keyed by cleaner name, then number of rows, then number of workers.
+    """
+    cleaners = cleaners or ["clean_orders_data", "clean_user_data"]
+    generators = {name: generate for name, (generate, _) in benchmark_cleaners(DataCleaning(), SyntheticData(seed)).items()}
+    results = {}
+    for name in cleaners:
+        results[name] = {}
+        for rows in scales:
+            results[name][str(rows)] = {}
+            for worker_count in workers:
+                with PartitionedCleaner(DataCleaning(), worker_count) as partitioned_cleaner:
+                    clean = partial(partitioned_cleaner.clean, name)
+                    result = time_cleaner(generators[name], clean, rows, repeats)
+                results[name][str(rows)][str(worker_count)] = result
+                print(f"{name} {rows} rows, {worker_count} workers: {result['best_seconds']:.3f} seconds.")
+    return results
+
+
+def peak_traced_memory(function: Callable, *args) -> tuple[int, object]:
+    """Run a function, returning the peak memory it allocated in bytes, as traced by tracemalloc, and its result."""
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def run_spec_benchmark(scales: List[int], repeats: int = 3, cleaners: List[str] | None = None, seed: int = 0) -> dict:
+    """Benchmark each cleaner against the cleaner it replaced before the table specs, in time and memory.
+
+    Every run cleans a fresh copy with a new DataCleaning, and the parsed date and phone number caches are
+    cleared first, so no run reuses the cached values of another.
+    Memory is measured in a separate run, since tracing allocations slows the cleaning down.
+
+    Args:
+        scales (List[int]): Numbers of rows to benchmark with.
+        repeats (int, optional): Number of times each cleaner is timed. Defaults to 3.
+        cleaners (List[str] | None, optional): Names of the cleaners to benchmark. Defaults to all of them.
+        seed (int, optional): Seed for the synthetic data. Defaults to 0.
+
+    Returns:
+        dict: Results keyed by cleaner name, then number of rows, then by cleaner, with whether both
+            cleaners gave identical output.
+    """
+    generators = {name: generate for name, (generate, _) in benchmark_cleaners(DataCleaning(), SyntheticData(seed)).items()}
+    def clear_caches():
+        DataCleaning._parse_date_string.cache_clear()
+        DataCleaning._parse_normalized_phone.cache_clear()
+
+    versions = {
+        "reference": lambda name, dataframe: REFERENCE_CLEANERS[name](dataframe, DataCleaning()),
+        "spec": lambda name, dataframe: getattr(DataCleaning(), name)(dataframe),
+    }
+    results = {}
+    for name, generate in generators.items():
+        if cleaners and name not in cleaners:
+            continue
+        results[name] = {}
+        for rows in scales:
+            dataframe = generate(rows)
+            result = {}
+            cleaned = {}
+            for version, clean in versions.items():
+                timings = []
+                for _ in range(repeats):
+                    dirty = dataframe.copy()
+                    clear_caches()
+                    start_time = time.perf_counter()
+                    clean(name, dirty)
+                    timings.append(time.perf_counter() - start_time)
+                dirty = dataframe.copy()
+                clear_caches()
+                peak, cleaned[version] = peak_traced_memory(clean, name, dirty)
+                result[version] = {**summarise_timings(rows, timings), "peak_traced_bytes": peak}
+            result["identical"] = cleaned["spec"].equals(cleaned["reference"])
+            results[name][str(rows)] = result
+            print(
+                f"{name} {rows} rows: {result['reference']['best_seconds']:.3f} -> {result['spec']['best_seconds']:.3f} "
+                f"seconds, peak {result['reference']['peak_traced_bytes'] / 2**20:.0f} -> "
+                f"{result['spec']['peak_traced_bytes'] / 2**20:.0f} MiB, identical output: {result['identical']}."
+            )
+    return results
+
+
+def run_date_parsing_benchmark(scales: List[int], repeats: int = 3, seed: int = 0) -> dict:
+    """Benchmark `parse_date_column` against the row-wise parser it replaced, on mixed-format dates.
+
+    The row-wise parser is slow, so it is only run once at each scale. The dateutil cache is cleared
+    before each repeat, so every repeat parses the dates from scratch.
+
+    Args:
+        scales (List[int]): Numbers of dates to benchmark with.
+        repeats (int, optional): Number of times the vectorised parser is repeated. Defaults to 3.
+        seed (int, optional): Seed for the synthetic data. Defaults to 0.
+
+    Returns:
+        dict: Results keyed by number of dates, with whether both parsers gave identical output.
+    """
+    cleaner = DataCleaning()
+    data = SyntheticData(seed)
+    results = {}
+    for rows in scales:
+        values = pd.Series(data.dates(rows), name="date")
+
+        def parse_dates() -> pd.Series:
+            DataCleaning._parse_date_string.cache_clear()
+            return cleaner.parse_date_column(values)
+
+        reference_timings, reference = time_function(partial(reference_parse_dates, values, cleaner), 1)
+        timings, parsed = time_function(parse_dates, repeats)
+        result = {
+            "reference": summarise_timings(rows, reference_timings),
+            "vectorised": summarise_timings(rows, timings),
+            "identical": parsed.equals(reference) and parsed.dtype == reference.dtype,
+        }
+        results[str(rows)] = result
+        print(
+            f"Dates {rows} rows: {result['reference']['best_seconds']:.3f} -> "
+            f"{result['vectorised']['best_seconds']:.3f} seconds, identical output: {result['identical']}."
+        )
+    return results
+
+
+def run_phone_parsing_benchmark(
+    scales: List[int], repeats: int = 3, seed: int = 0, phone_workers: int | None = None
+) -> dict:
+    """Benchmark `parse_phone_numbers` against the row-wise parser it replaced, on GB, DE and US phone numbers.
+
+    The row-wise parser is slow, so it is only run once at each scale. Each repeat of the fast path uses a
+    new DataCleaning and clears the parsed number cache, so every repeat parses the numbers from scratch.
+
+    Args:
+        scales (List[int]): Numbers of phone numbers to benchmark with.
+        repeats (int, optional): Number of times the fast path is repeated. Defaults to 3.
+        seed (int, optional): Seed for the synthetic data. Defaults to 0.
+        phone_workers (int | None, optional): Worker processes for the fast path. Defaults to None.
+
+    Returns:
+        dict: Results keyed by number of phone numbers, with whether both parsers gave identical output.
+    """
+    data = SyntheticData(seed)
+    results = {}
+    for rows in scales:
+        phones = data.phones(rows)
+        regions = phones["country_code"].replace(DataCleaning().country_code_corrections)
+
+        def parse_phones() -> pd.Series:
+            DataCleaning._parse_normalized_phone.cache_clear()
+            return DataCleaning(phone_workers=phone_workers).parse_phone_numbers(phones["phone_number"], regions)
+
+        reference_timings, reference = time_function(partial(reference_parse_phones, phones["phone_number"], regions), 1)
+        timings, parsed = time_function(parse_phones, repeats)
+        result = {
+            "reference": summarise_timings(rows, reference_timings),
+            "vectorised": summarise_timings(rows, timings),
+            "unique_numbers": int(phones.drop_duplicates().shape[0]),
+            "kept_raw": int((parsed == phones["phone_number"]).sum()),
+            "identical": parsed.equals(reference),
+        }
+        results[str(rows)] = result
+        print(
+            f"Phones {rows} rows ({result['unique_numbers']} unique): {result['reference']['best_seconds']:.3f} -> "
+            f"{result['vectorised']['best_seconds']:.3f} seconds, identical output: {result['identical']}."
+        )
+    return results
+
+
+def count_dataframe_apply_calls(function: Callable, *args) -> int:
+    """Profile a function, returning the number of calls it made to `DataFrame.apply`."""
+    profiler = cProfile.Profile()
+    profiler.runcall(function, *args)
+    return sum(
+        calls
+        for (filename, _, function_name), (_, calls, *_) in pstats.Stats(profiler).stats.items()
+        if function_name == "apply" and filename.endswith(os.path.join("pandas", "core", "frame.py"))
+    )
+
+
+def run_card_split_benchmark(scales: List[int], repeats: int = 3, seed: int = 0) -> dict:
+    """Benchmark `split_combined_card_data` against the row-wise apply it replaced, on PDF card data.
+
+    The row-wise apply is slow, so it is only run once at each scale. `clean_card_data` is also profiled,
+    to check it no longer calls `DataFrame.apply`.
+
+    Args:
+        scales (List[int]): Numbers of rows to benchmark with.
+        repeats (int, optional): Number of times the vectorised split is repeated. Defaults to 3.
+        seed (int, optional): Seed for the synthetic data. Defaults to 0.
+
+    Returns:
+        dict: Results keyed by number of rows, with whether both splits gave identical output and the
+            number of `DataFrame.apply` calls made by `clean_card_data`.
+    """
+    cleaner = DataCleaning()
+    data = SyntheticData(seed)
+    results = {}
+    for rows in scales:
+        cards = data.cards(rows)
+        reference_timings, reference = time_function(partial(reference_split_card_data, cards), 1)
+        timings, split = time_function(partial(DataCleaning.split_combined_card_data, cards), repeats)
+        result = {
+            "reference": summarise_timings(rows, reference_timings),
+            "vectorised": summarise_timings(rows, timings),
+            "identical": split.equals(reference),
+            "apply_calls": count_dataframe_apply_calls(cleaner.clean_card_data, cards.copy()),
+        }
+        results[str(rows)] = result
+        print(
+            f"Card split {rows} rows: {result['reference']['best_seconds']:.3f} -> "
+            f"{result['vectorised']['best_seconds']:.3f} seconds, identical output: {result['identical']}, "
+            f"DataFrame.apply calls in clean_card_data: {result['apply_calls']}."
+        )
+    return results
+
+
+def run_store_benchmark(
+    scales: List[int],
+    repeats: int = 3,
+    seed: int = 0,
+    max_concurrent_requests: int = 8,
+    latency: float = 0.02,
+    request_delay: float = 0.01,
+) -> dict:
+    """Benchmark fetching stores from a local stand-in of the store API, one at a time and concurrently.
+
+    The serial fetch is the original loop, sleeping `request_delay` after each store. The concurrent fetch is
+    `retrieve_stores_data`, whose rate limit starts at one request per `request_delay` and rises while the
+    API keeps up. Responses are not cached, so every repeat fetches every store.
+
+    Args:
+        scales (List[int]): Numbers of stores to benchmark with.
+        repeats (int, optional): Number of times each fetch is repeated. Defaults to 3.
+        seed (int, optional): Seed for the synthetic data. Defaults to 0.
+        max_concurrent_requests (int, optional): Requests sent at once by the concurrent fetch. Defaults to 8.
+        latency (float, optional): Seconds the stand-in API takes to answer each request. Defaults to 0.02.
+        request_delay (float, optional): Seconds between requests at the starting rate. Defaults to 0.01.
+
+    Returns:
+        dict: Results keyed by number of stores, then by fetch.
+    """
+    data = SyntheticData(seed)
+    results = {}
+    for rows in scales:
+        server = serve_store_api(data.stores(rows), latency)
+        config = store_api_config(
+            server,
+            request_delay=request_delay,
+            requests_per_second=1 / request_delay,
+            max_concurrent_requests=max_concurrent_requests,
+            cache_ttl_seconds=0,
+        )
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                config_path = os.path.join(directory, "api_creds.yaml")
+                with open(config_path, "w") as config_file:
+                    yaml.safe_dump(config, config_file)
+
+                def fetch_concurrently() -> pd.DataFrame:
+                    # A new extractor per repeat, so the rate limiter starts from scratch
+                    extractor = DataExtractor(DatabaseConnector(), cache_dir=directory, api_config_path=config_path)
+                    return extractor.retrieve_stores_data()
+
+                serial_timings, serial = time_function(partial(reference_retrieve_stores, config), repeats)
+                timings, concurrent = time_function(fetch_concurrently, repeats)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        result = {
+            "serial": summarise_timings(rows, serial_timings),
+            "concurrent": summarise_timings(rows, timings),
+            "identical": concurrent.equals(serial),
+        }
+        results[str(rows)] = result
+        print(
+            f"Stores {rows}: {result['serial']['best_seconds']:.3f} -> {result['concurrent']['best_seconds']:.3f} "
+            f"seconds with {max_concurrent_requests} concurrent requests, identical output: {result['identical']}."
+        )
+    return results
+
+
+def run_upload_benchmark(
+    scales: List[int], repeats: int = 3, credential_path: str | None = None, seed: int = 0
+) -> dict:
+    """Benchmark loading the cleaned orders table into a database and reading it back, in rows per second.
+
+    On Postgres, the upload with `COPY FROM STDIN` is compared with the plain INSERTs `to_sql` uses by default.
+    Other databases always use INSERTs, so only the upload is timed. The table is dropped afterwards.
+
+    Args:
+        scales (List[int]): Numbers of rows to benchmark with.
+        repeats (int, optional): Number of times each benchmark is repeated. Defaults to 3.
+        credential_path (str | None, optional): Credentials of the database, see `DatabaseConnector`.
+            Defaults to a temporary SQLite database.
+        seed (int, optional): Seed for the synthetic data. Defaults to 0.
+
+    Returns:
+        dict: Results keyed by number of rows, then by the upload or read being timed.
+    """
+    table_name = "benchmark_orders_table"
+    data = SyntheticData(seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        connector = DatabaseConnector(credential_path) if credential_path else sqlite_connector(directory)
+        extractor = DataExtractor(connector, cache_dir=directory)
+        is_postgres = connector.engine.dialect.name == "postgresql"
+        try:
+            for rows in scales:
+                orders = DataCleaning().clean_orders_data(data.orders(rows))
+                timed = {"upload": lambda: connector.upload_to_db(orders, table_name)}
+                if is_postgres:
+                    timed["insert"] = lambda: orders.to_sql(
+                        table_name, connector.engine, if_exists="replace", chunksize=100_000
+                    )
+                timed["read"] = lambda: extractor.read_rds_table(table_name)
+                timed["read_chunks"] = lambda: sum(len(chunk) for chunk in extractor.read_rds_table_chunks(table_name))
+
+                results[str(rows)] = {"database": connector.engine.dialect.name}
+                for name, function in timed.items():
+                    timings, _ = time_function(function, repeats)
+                    result = summarise_timings(rows, timings)
+                    results[str(rows)][name] = result
+                    print(f"{name} {rows} rows: {result['best_seconds']:.3f} seconds ({result['rows_per_second']:.0f} rows/second).")
+        finally:
+            with connector.engine.begin() as connection:
+                connection.execute(sqlalchemy.text(f'DROP TABLE IF EXISTS "{table_name}"'))
+            connector.invalidate_tables()
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Compare results with a baseline, returning a description of each benchmark that got slower.
+
+    Args:
+        results (dict): Results of this run.
+        baseline (dict): Results of an earlier run.
+        tolerance (float): Fraction a benchmark may slow down by before it is a regression.
+
+    Returns:
+        List[str]: Description of each regression.
+    """
+    regressions = []
+    for name, scales in results.items():
+        for rows, result in scales.items():
+            previous = baseline.get(name, {}).get(rows)
+            if previous and result["best_seconds"] > previous["best_seconds"] * (1 + tolerance):
+                regressions.append(
+                    f"{name} {rows} rows: {previous['best_seconds']:.3f} -> {result['best_seconds']:.3f} seconds."
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the DataCleaning cleaners on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--cleaners", nargs="+", help="Only run these cleaners.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results-dir", default="benchmark_results")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slow down before failing.")
+    parser.add_argument("--workers", type=int, nargs="+", help="Benchmark partitioned cleaning with these numbers of workers.")
+    parser.add_argument("--specs", action="store_true", help="Benchmark each cleaner against the cleaner it replaced before the table specs instead.")
+    parser.add_argument("--dates", action="store_true", help="Benchmark date parsing against the row-wise parser instead.")
+    parser.add_argument("--phones", action="store_true", help="Benchmark phone number parsing against the row-wise parser instead.")
+    parser.add_argument("--phone-workers", type=int, help="Worker processes to parse phone numbers on, for --phones.")
+    parser.add_argument("--card-split", action="store_true", help="Benchmark splitting card data against the row-wise apply instead.")
+    parser.add_argument("--stores", action="store_true", help="Benchmark fetching stores from a local stand-in API instead.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds the stand-in API takes to answer, for --stores.")
+    parser.add_argument("--upload", action="store_true", help="Benchmark loading and reading the orders table instead.")
+    parser.add_argument("--credentials", help="Database credentials for --upload. Defaults to a temporary SQLite database.")
+    args = parser.parse_args()
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    run_name = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    if args.workers:
+        scaling = run_scaling_benchmark(args.scales, args.workers, args.repeats, args.cleaners, args.seed)
+        results_path = os.path.join(args.results_dir, f"scaling-{run_name}.json")
+        with open(results_path, "w") as results_file:
+            json.dump({"seed": args.seed, "repeats": args.repeats, "cpus": os.cpu_count(), "scaling": scaling}, results_file, indent=2)
+        print(f"Results saved to {results_path}.")
+        raise SystemExit(0)
+
+    if args.specs:
+        specs = run_spec_benchmark(args.scales, args.repeats, args.cleaners, args.seed)
+        results_path = os.path.join(args.results_dir, f"specs-{run_name}.json")
+        with open(results_path, "w") as results_file:
+            json.dump({"seed": args.seed, "repeats": args.repeats, "specs": specs}, results_file, indent=2)
+        print(f"Results saved to {results_path}.")
+        passed = all(result["identical"] for scales in specs.values() for result in scales.values())
+        raise SystemExit(0 if passed else 1)
+
+    if args.dates:
+        dates = run_date_parsing_benchmark(args.scales, args.repeats, args.seed)
+        results_path = os.path.join(args.results_dir, f"dates-{run_name}.json")
+        with open(results_path, "w") as results_file:
+            json.dump({"seed": args.seed, "repeats": args.repeats, "dates": dates}, results_file, indent=2)
+        print(f"Results saved to {results_path}.")
+        # Fail if the parsers disagree, since the vectorised parser must not change the output
+        raise SystemExit(0 if all(result["identical"] for result in dates.values()) else 1)
+
+    if args.phones:
+        phones = run_phone_parsing_benchmark(args.scales, args.repeats, args.seed, args.phone_workers)
+        results_path = os.path.join(args.results_dir, f"phones-{run_name}.json")
+        with open(results_path, "w") as results_file:
+            json.dump({"seed": args.seed, "repeats": args.repeats, "phone_workers": args.phone_workers, "phones": phones}, results_file, indent=2)
+        print(f"Results saved to {results_path}.")
+        raise SystemExit(0 if all(result["identical"] for result in phones.values()) else 1)
+
+    if args.card_split:
+        card_split = run_card_split_benchmark(args.scales, args.repeats, args.seed)
+        results_path = os.path.join(args.results_dir, f"card_split-{run_name}.json")
+        with open(results_path, "w") as results_file:
+            json.dump({"seed": args.seed, "repeats": args.repeats, "card_split": card_split}, results_file, indent=2)
+        print(f"Results saved to {results_path}.")
+        passed = all(result["identical"] and result["apply_calls"] == 0 for result in card_split.values())
+        raise SystemExit(0 if passed else 1)
+
+    if args.stores:
+        stores = run_store_benchmark(args.scales, args.repeats, args.seed, latency=args.latency)
+        results_path = os.path.join(args.results_dir, f"stores-{run_name}.json")
+        with open(results_path, "w") as results_file:
+            json.dump({"seed": args.seed, "repeats": args.repeats, "latency": args.latency, "stores": stores}, results_file, indent=2)
+        print(f"Results saved to {results_path}.")
+        raise SystemExit(0 if all(result["identical"] for result in stores.values()) else 1)
+
+    if args.upload:
+        upload = run_upload_benchmark(args.scales, args.repeats, args.credentials, args.seed)
+        results_path = os.path.join(args.results_dir, f"upload-{run_name}.json")
+        with open(results_path, "w") as results_file:
+            json.dump({"seed": args.seed, "repeats": args.repeats, "upload": upload}, results_file, indent=2)
+        print(f"Results saved to {results_path}.")
+        raise SystemExit(0)
+
+    results = run_benchmarks(args.scales, args.repeats, args.cleaners, args.seed)
+
+    # Compare with the latest earlier results before saving these
+    earlier_runs = sorted(glob.glob(os.path.join(args.results_dir, "[0-9]*.json")))
+    regressions = []
+    if earlier_runs:
+        with open(earlier_runs[-1]) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file)["results"], args.tolerance)
+
+    results_path = os.path.join(args.results_dir, f"{run_name}.json")
+    with open(results_path, "w") as results_file:
+        json.dump({"seed": args.seed, "repeats": args.repeats, "results": results}, results_file, indent=2)
+    print(f"Results saved to {results_path}.")
+
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        raise SystemExit(1)
@@ -0,0 +1,294 @@
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+
+@dataclass
+class ColumnSpec:
+    """Declarative cleaning rules for one column of a table.
+
+    The rules are always applied in the same order. Conversion to the "string" dtype comes first, so
+    later rules see strings. Then null tokens, substitutions, empty strings, extraction, replacements,
+    the value map, validation and parsing are applied. Conversion to any other dtype comes last.
+
+    Attributes:
+        dtype (str | None): Type of the cleaned column, such as "string" or "Int64".
+        null_tokens (Tuple[str, ...]): Values meaning null, in addition to those of the table.
+        substitutions (List[Tuple[str, str]]): Regex patterns and their replacements.
+        empty_as_null (bool): Make empty strings null, after substitutions.
+        extract (str | None): Regex whose first group is extracted from each value.
+        replace (Dict): Values to replace, other values are kept.
+        value_map (Dict | None): Values to map, other values become null.
+        pattern (str | None): Regex each value must match from the start, otherwise it becomes null.
+        parse (Callable[[pd.Series], pd.Series] | None): Function converting the values, such as a date parser.
+        derive (Callable[[pd.DataFrame], pd.Series] | None): Function computing the raw values from the
+            whole table, for columns made from other columns.
+        sources (List[str] | None): Columns read by `derive`. Without them, no column can be left out
+            when the table is extracted.
+        required (bool): Drop rows where the cleaned value is null.
+    """
+
+    dtype: str | None = None
+    null_tokens: Tuple[str, ...] = ()
+    substitutions: List[Tuple[str, str]] = field(default_factory=list)
+    empty_as_null: bool = False
+    extract: str | None = None
+    replace: Dict = field(default_factory=dict)
+    value_map: Dict | None = None
+    pattern: str | None = None
+    parse: Callable[[pd.Series], pd.Series] | None = None
+    derive: Callable[[pd.DataFrame], pd.Series] | None = None
+    sources: List[str] | None = None
+    required: bool = True
+
+
+@dataclass
+class RowRule:
+    """Rule for rows whose raw value in a column is not one of the allowed values.
+
+    Attributes:
+        column (str): Column to check.
+        allowed (List): Allowed values.
+        action (str): "drop" to drop the rows, or "null" to make every value in the rows null.
+        rule (str): Name of the rule, reported with the number of rows it dropped.
+    """
+
+    column: str
+    allowed: List
+    action: str = "drop"
+    rule: str = "invalid_values"
+
+
+@dataclass
+class TableSpec:
+    """Declarative cleaning rules for a table.
+
+    Columns without a ColumnSpec are kept as they are, apart from the null tokens of the table.
+
+    Attributes:
+        columns (Dict[str, ColumnSpec]): Rules for each column. Derived columns not in the table are
+            added after the other columns.
+        drop_columns (List[str]): Columns that are not kept.
+        null_tokens (Tuple[str, ...]): Values meaning null in every string column.
+        row_rules (List[RowRule]): Rules applied to whole rows.
+        keep_incomplete (Dict[str, List]): Rows with one of these values in a column are kept even if
+            they have null values.
+        drop_nulls (bool): Drop rows with null values in any required column.
+        index_column (str | None): Column identifying each row at the source. It becomes the index of the
+            cleaned table instead of a column, so it is loaded as the table's index column.
+    """
+
+    columns: Dict[str, ColumnSpec] = field(default_factory=dict)
+    drop_columns: List[str] = field(default_factory=list)
+    null_tokens: Tuple[str, ...] = ()
+    row_rules: List[RowRule] = field(default_factory=list)
+    keep_incomplete: Dict[str, List] = field(default_factory=dict)
+    drop_nulls: bool = True
+    index_column: str | None = None
+
+
+def _to_dtype(values: pd.Series, dtype: str) -> pd.Series:
+    return values.astype(dtype)
+
+
+def _replace_null_tokens(values: pd.Series, tokens: Tuple[str, ...]) -> pd.Series:
+    # Only string columns can hold the tokens
+    if values.dtype != object and not isinstance(values.dtype, pd.StringDtype):
+        return values
+    is_token = values.isin(tokens)
+    return values.mask(is_token, pd.NA) if is_token.any() else values
+
+
+def _substitute(values: pd.Series, pattern: str, replacement: str) -> pd.Series:
+    return values.str.replace(pattern, replacement, regex=True)
+
+
+def _empty_as_null(values: pd.Series) -> pd.Series:
+    return values.mask(values.isin([""]), pd.NA)
+
+
+def _extract(values: pd.Series, pattern: str) -> pd.Series:
+    return values.str.extract(pattern, expand=False)
+
+
+def _replace(values: pd.Series, replacements: Dict) -> pd.Series:
+    return values.replace(replacements)
+
+
+def _map(values: pd.Series, value_map: Dict) -> pd.Series:
+    return values.map(value_map)
+
+
+def _validate(values: pd.Series, pattern: str) -> pd.Series:
+    return values.where(values.str.match(pattern, na=False), pd.NA)
+
+
+class CleaningPlan:
+    """A TableSpec compiled into the operations needed to clean each column.
+
+    Each column is cleaned on its own, and the cleaned columns are put together once at the end, so
+    no operation copies the whole table. Rows dropped by a RowRule are removed before the columns are
+    cleaned, and rows with null values are removed once after.
+    """
+
+    def __init__(self, spec: TableSpec):
+        """Compile a table spec.
+
+        Args:
+            spec (TableSpec): Rules for the table.
+
+        Raises:
+            ValueError: If a row rule action is not valid.
+        """
+        for row_rule in spec.row_rules:
+            if row_rule.action not in ("drop", "null"):
+                raise ValueError(f"{row_rule.action} is not a valid row rule action.")
+
+        self.spec = spec
+        self._operations = {name: self._compile_column(column_spec) for name, column_spec in spec.columns.items()}
+        self._default_operations = self._compile_column(ColumnSpec())
+
+    def _compile_column(self, column_spec: ColumnSpec) -> List[Callable[[pd.Series], pd.Series]]:
+        """Return the operations for the rules of a column that are set, in the order they are applied."""
+        operations = []
+        if column_spec.dtype == "string":
+            operations.append(partial(_to_dtype, dtype="string"))
+        null_tokens = self.spec.null_tokens + column_spec.null_tokens
+        if null_tokens:
+            operations.append(partial(_replace_null_tokens, tokens=null_tokens))
+        for pattern, replacement in column_spec.substitutions:
+            operations.append(partial(_substitute, pattern=pattern, replacement=replacement))
+        if column_spec.empty_as_null:
+            operations.append(_empty_as_null)
+        if column_spec.extract:
+            operations.append(partial(_extract, pattern=column_spec.extract))
+        if column_spec.replace:
+            operations.append(partial(_replace, replacements=column_spec.replace))
+        if column_spec.value_map is not None:
+            operations.append(partial(_map, value_map=column_spec.value_map))
+        if column_spec.pattern:
+            operations.append(partial(_validate, pattern=column_spec.pattern))
+        if column_spec.parse:
+            operations.append(column_spec.parse)
+        if column_spec.dtype and column_spec.dtype != "string":
+            operations.append(partial(_to_dtype, dtype=column_spec.dtype))
+        return operations
+
+    def pushdown(self) -> Dict[str, List]:
+        """Return the columns and rows a database can leave out when the table is extracted.
+
+        Rows are only left out when cleaning would drop them anyway, so the cleaned table is the same.
+        Row rules can always be pushed down. A required column whose raw value must match a pattern can be
+        pushed down when rows with null values are dropped, and no earlier rule changes its values. Such
+        patterns only accept values that a database regex would also accept.
+
+        Returns:
+            Dict[str, List]: Keyword arguments for `DataExtractor.read_rds_table`, the columns to exclude
+                and the SQL predicates rows must meet.
+        """
+        spec = self.spec
+        derived = [column_spec for column_spec in spec.columns.values() if column_spec.derive]
+        exclude = []
+        if all(column_spec.sources is not None for column_spec in derived):
+            sources = {source for column_spec in derived for source in column_spec.sources}
+            exclude = [column for column in spec.drop_columns if column not in sources]
+        exclude = [column for column in exclude if column != spec.index_column]
+
+        where = []
+        drops_incomplete_rows = spec.drop_nulls and not spec.keep_incomplete
+        for row_rule in spec.row_rules:
+            if row_rule.action == "drop" or drops_incomplete_rows:
+                where.append(sqlalchemy.column(row_rule.column).in_(row_rule.allowed))
+
+        for name, column_spec in spec.columns.items():
+            changes_values = (
+                column_spec.derive or column_spec.substitutions or column_spec.empty_as_null or column_spec.extract
+                or column_spec.replace or column_spec.value_map is not None
+            )
+            if (
+                column_spec.pattern and column_spec.dtype == "string" and column_spec.required
+                and drops_incomplete_rows and not changes_values
+            ):
+                where.append(sqlalchemy.column(name).regexp_match(column_spec.pattern))
+
+        return {"exclude": exclude, "where": where}
+
+    def output_columns(self, dataframe: pd.DataFrame) -> List[str]:
+        """Return the names of the cleaned columns of a table, in order."""
+        kept = [
+            column for column in dataframe.columns
+            if column not in self.spec.drop_columns and column != self.spec.index_column
+        ]
+        derived = [column for column in self.spec.columns if column not in dataframe.columns]
+        return kept + derived
+
+    def apply(
+        self, dataframe: pd.DataFrame, record_dropped: Callable[[str, int, int], None] | None = None
+    ) -> pd.DataFrame:
+        """Clean a table. The input DataFrame is not modified.
+
+        Args:
+            dataframe (pd.DataFrame): Table to clean.
+            record_dropped (Callable[[str, int, int], None] | None, optional): Called with the name of a
+                rule and the number of rows before and after it was applied. Defaults to None.
+
+        Returns:
+            pd.DataFrame: Cleaned table.
+        """
+        record_dropped = record_dropped or (lambda rule, rows_before, rows_after: None)
+
+        kept_rows = None
+        null_rows = None
+        for row_rule in self.spec.row_rules:
+            invalid = ~dataframe[row_rule.column].isin(row_rule.allowed).to_numpy()
+            if row_rule.action == "null":
+                null_rows = invalid if null_rows is None else null_rows | invalid
+                continue
+            rows_before = len(dataframe) if kept_rows is None else int(kept_rows.sum())
+            kept_rows = ~invalid if kept_rows is None else kept_rows & ~invalid
+            record_dropped(row_rule.rule, rows_before, int(kept_rows.sum()))
+
+        if null_rows is not None:
+            if kept_rows is not None:
+                null_rows = null_rows[kept_rows]
+            if not null_rows.any():
+                null_rows = None
+
+        columns = {}
+        for name in self.output_columns(dataframe):
+            column_spec = self.spec.columns.get(name)
+            values = column_spec.derive(dataframe) if column_spec and column_spec.derive else dataframe[name]
+            if kept_rows is not None:
+                values = values[kept_rows]
+            if null_rows is not None:
+                values = values.where(~null_rows)
+            for operation in self._operations.get(name, self._default_operations):
+                values = operation(values)
+            columns[name] = values.rename(name)
+
+        cleaned = pd.DataFrame(columns, copy=False)
+        if self.spec.index_column is not None:
+            # Rows keep their labels through every rule, so the identity of each remaining row can be looked up
+            cleaned.index = pd.Index(
+                dataframe[self.spec.index_column].loc[cleaned.index], name=self.spec.index_column
+            )
+        if not self.spec.drop_nulls:
+            return cleaned
+
+        complete = np.ones(len(cleaned), dtype=bool)
+        for name, values in columns.items():
+            column_spec = self.spec.columns.get(name)
+            if column_spec is None or column_spec.required:
+                complete &= values.notna().to_numpy()
+        for name, allowed in self.spec.keep_incomplete.items():
+            complete |= columns[name].isin(allowed).to_numpy()
+
+        rows_before = len(cleaned)
+        if not complete.all():
+            cleaned = cleaned[complete]
+        record_dropped("null_values", rows_before, len(cleaned))
+        return cleaned
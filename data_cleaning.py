@@ -1,25 +1,207 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+import multiprocessing
+import threading
+from typing import Callable, List, Tuple
 from dateutil.parser import parse
 from dateutil.parser._parser import ParserError
 import phonenumbers
 import re
+import numpy as np
 import pandas as pd
 
+from cleaning_spec import CleaningPlan, ColumnSpec, RowRule, TableSpec
+
 class DataCleaning:
     """Class for cleaning data in a DataFrame"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        on_drop: Callable[[str, int], None] | None = None,
+        phone_workers: int | None = None,
+        unique_cache_size: int = 100_000,
+    ):
+        """Create a data cleaner.
+
+        Args:
+            on_drop (Callable[[str, int], None] | None, optional): Called with the name of a cleaning rule
+                and the number of rows it dropped, each time rows are dropped. Defaults to None.
+            phone_workers (int | None, optional): Number of worker processes to parse unique phone numbers
+                on. Defaults to None, parsing them in this process.
+            unique_cache_size (int, optional): Most results kept by each cache of `map_unique` between
+                calls. 0 disables the caches. Defaults to 100000.
+        """
+        self.on_drop = on_drop
+        self.phone_workers = phone_workers
+        self.unique_cache_size = unique_cache_size
+        # Results of map_unique by cache name, least recently used first
+        self._unique_caches = {}
+        # Stages run on several threads share one cleaner
+        self._unique_caches_lock = threading.Lock()
         self.date_format = "%Y-%m-%d"
         self.date_format_alt = "%Y %B %d"
+        # Explicit formats tried in order before falling back to dateutil, most common first
+        self.date_formats = [self.date_format, self.date_format_alt, "%B %Y %d", "%Y/%m/%d"]
 
         # Regex patterns from https://regexr.com Community Patterns
         self.uuid_regex = r'^[0-9A-Za-z]{8}-[0-9A-Za-z]{4}-4[0-9A-Za-z]{3}-[89ABab][0-9A-Za-z]{3}-[0-9A-Za-z]{12}$'
         self.email_regex = r"^.+@.+\..+$"
         self.currency_regex = r"(\d*\.\d+|\d+)"
+        # Removes (0), extensions (for example x1234), and any other characters except digits and +
+        self.phone_noise_regex = re.compile(r"\(0\)|x.*$|[^\d+]")
+        # Fewest unique phone numbers worth sending to worker processes
+        self.min_phone_worker_numbers = 50_000
         self.expiry_date_format = "%m/%y"
         self.payment_date_format = "%Y-%m-%d"
         self.store_date_format = "%Y-%m-%d"
         self.product_date_format = "%Y-%m-%d"
+        # Value in each unit is divided by these to get kilograms
+        self.weight_unit_divisors = {"g": 1000.0, "ml": 1000.0, "kg": 1.0, "oz": 35.274}
+        # Some country codes are wrong
+        self.country_code_corrections = {"GGB": "GB"}
+
+        self.build_plans()
+
+    def build_plans(self):
+        """Build the cleaning plan of each table from the table specs.
+
+        Specs take some settings, such as `uuid_regex`, when they are built, so call this again after changing them.
+        """
+        self.user_plan = CleaningPlan(self.user_data_spec())
+        self.card_plan = CleaningPlan(self.card_data_spec())
+        self.store_plan = CleaningPlan(self.store_data_spec())
+        self.products_plan = CleaningPlan(self.products_data_spec())
+        self.orders_plan = CleaningPlan(self.orders_data_spec())
+        self.date_details_plan = CleaningPlan(self.date_details_data_spec())
+
+    def settings(self) -> dict:
+        """Return the settings of this cleaner, such as its date formats and cache size.
+
+        Returns:
+            dict: Settings to pass to `from_settings`, which can be pickled to another process.
+        """
+        return {
+            name: value for name, value in vars(self).items()
+            if not name.startswith("_") and name != "on_drop" and not isinstance(value, CleaningPlan)
+        }
+
+    @classmethod
+    def from_settings(cls, settings: dict, on_drop: Callable[[str, int], None] | None = None) -> "DataCleaning":
+        """Create a cleaner with the settings of another cleaner.
+
+        Args:
+            settings (dict): Settings returned by `settings`.
+            on_drop (Callable[[str, int], None] | None, optional): Called with the rows dropped by each
+                cleaning rule. Defaults to None.
+
+        Returns:
+            DataCleaning: Cleaner that cleans data the same way as the one the settings came from.
+        """
+        cleaner = cls(on_drop=on_drop)
+        vars(cleaner).update(settings)
+        # Specs may read the settings when they are built
+        cleaner.build_plans()
+        return cleaner
+
+    def record_dropped(self, rule: str, rows_before: int, rows_after: int):
+        """Report the number of rows dropped by a cleaning rule to `on_drop`.
+
+        Args:
+            rule (str): Name of the cleaning rule.
+            rows_before (int): Number of rows before the rule was applied.
+            rows_after (int): Number of rows after the rule was applied.
+        """
+        if self.on_drop is not None:
+            self.on_drop(rule, rows_before - rows_after)
+
+    @staticmethod
+    def factorize_columns(columns: Tuple[pd.Series, ...]) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Encode each row of one or more Series as the code of its unique combination of values.
+
+        Args:
+            columns (Tuple[pd.Series, ...]): Series of the same length.
+
+        Returns:
+            Tuple[np.ndarray, List[np.ndarray]]: Code of each row, and for each Series the value in each
+                unique combination. Null values are None.
+        """
+        codes = None
+        unique_columns = []
+        for values in columns:
+            column_codes, column_uniques = pd.factorize(values)
+            column_uniques = np.asarray(column_uniques, dtype="object")
+            # Null values have a code of -1, give them the code of a None added after the unique values
+            if (column_codes < 0).any():
+                column_uniques = np.append(column_uniques, None)
+                column_codes = np.where(column_codes < 0, len(column_uniques) - 1, column_codes)
+
+            if codes is None:
+                codes, unique_columns = column_codes, [column_uniques]
+                continue
+
+            # Combine with the codes so far, then number the combinations that occur
+            radix = max(len(column_uniques), 1)
+            codes, combinations = pd.factorize(codes.astype("int64") * radix + column_codes)
+            previous_codes, column_codes = np.divmod(combinations, radix)
+            unique_columns = [uniques[previous_codes] for uniques in unique_columns] + [column_uniques[column_codes]]
+        return codes, unique_columns
+
+    def map_unique(
+        self, function: Callable, *columns: pd.Series, vectorized: bool = False, cache: str | None = None
+    ) -> pd.Series:
+        """Apply a function once per unique value of a Series, or unique combination of values of several Series.
+
+        The results are broadcast back to every row, so the cost depends on the number of unique values
+        rather than the number of rows. Null values are passed to the function as None.
+
+        Args:
+            function (Callable): Called with a value from each Series. If vectorized, called once with a
+                Series of the unique values from each Series instead, returning the results in order.
+            *columns (pd.Series): Series of the same length to take the values from.
+            vectorized (bool, optional): Call the function with all the unique values at once. Defaults to False.
+            cache (str | None, optional): Name of a cache to keep the results in, so values seen by
+                earlier calls, such as earlier chunks or runs, are not computed again. Defaults to None.
+
+        Returns:
+            pd.Series: The result for each row, with the index of the first Series.
+        """
+        codes, unique_columns = self.factorize_columns(columns)
+        keys = list(zip(*unique_columns))
+
+        results = [None] * len(keys)
+        missing = list(range(len(keys)))
+        if cache and self.unique_cache_size:
+            with self._unique_caches_lock:
+                cached = self._unique_caches.setdefault(cache, OrderedDict())
+                missing = []
+                for position, key in enumerate(keys):
+                    if key in cached:
+                        cached.move_to_end(key)
+                        results[position] = cached[key]
+                    else:
+                        missing.append(position)
+
+        if missing:
+            missing_columns = [uniques[missing] for uniques in unique_columns]
+            if vectorized:
+                computed = list(function(*(pd.Series(uniques, dtype="object") for uniques in missing_columns)))
+            else:
+                computed = list(map(function, *missing_columns))
+            for position, result in zip(missing, computed):
+                results[position] = result
+
+            if cache and self.unique_cache_size:
+                with self._unique_caches_lock:
+                    cached = self._unique_caches[cache]
+                    cached.update((keys[position], result) for position, result in zip(missing, computed))
+                    while len(cached) > self.unique_cache_size:
+                        cached.popitem(last=False)
+
+        # Let pandas infer the type of the results, then broadcast them back to every row
+        unique_results = pd.Series(results).to_numpy()
+        return pd.Series(unique_results.take(codes), index=columns[0].index)
 
     def parse_phone_number(self, phone: str, region: str) -> str | None:
         """Parse a phone number from a string, given the region for the number.
@@ -39,10 +221,14 @@ class DataCleaning:
             phone = "+" + phone[2:]
 
         # Clean the phone number by removing (0), extensions, and other unnecessary characters
-        phone = re.sub(r'\(0\)', '', phone)  # Remove (0)
-        phone = phone.replace("(", "").replace(")", "")  # Remove parentheses
-        phone = re.sub(r'x.*$', '', phone)  # Remove extensions (for example x1234)
-        phone = re.sub(r'[^\d+]', '', phone)  # Remove non-numeric characters except for +
+        return DataCleaning._parse_normalized_phone(self.phone_noise_regex.sub("", phone), region)
+
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def _parse_normalized_phone(phone: str, region: str | None) -> str | None:
+        """Parse a phone number that only has digits and +, caching the result for repeated numbers."""
+        if type(phone) is not str:
+            return None
 
         try:
             # Attempt to parse the number with the phonenumbers library
@@ -59,6 +245,67 @@ class DataCleaning:
             # Number could not be parsed
             return None
 
+    def normalize_phone_numbers(self, phones: pd.Series) -> pd.Series:
+        """Remove everything except digits and + from a Series of phone numbers, as `parse_phone_number` does.
+
+        Args:
+            phones (pd.Series): Series of phone number strings
+
+        Returns:
+            pd.Series: Normalized phone numbers, NaN where a value is not a string
+        """
+        phones = phones.where(DataCleaning.string_mask(phones)).astype("object")
+        phones = phones.str.replace(r"^00", "+", regex=True)
+        return phones.str.replace(self.phone_noise_regex, "", regex=True)
+
+    def parse_phone_numbers(self, phones: pd.Series, regions: pd.Series) -> pd.Series:
+        """Parse a Series of phone numbers to international format, given the region of each number.
+
+        Each unique pair of number and region is only parsed once. Numbers that cannot be parsed are
+        kept as they are, so the row is not lost.
+
+        Args:
+            phones (pd.Series): Series of phone number strings
+            regions (pd.Series): Series of the region of each phone number owner
+
+        Returns:
+            pd.Series: Parsed phone numbers
+        """
+        phones = phones.where(DataCleaning.string_mask(phones))
+        return self.map_unique(self._parse_unique_phone_numbers, phones, regions, vectorized=True).astype("object")
+
+    def _parse_unique_phone_numbers(self, phones: pd.Series, regions: pd.Series) -> List[str | None]:
+        """Parse phone numbers given their regions, keeping the numbers that cannot be parsed as they are."""
+        normalized = self.normalize_phone_numbers(phones)
+
+        if self.phone_workers and len(normalized) >= self.min_phone_worker_numbers:
+            with ProcessPoolExecutor(self.phone_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                parsed = executor.map(
+                    DataCleaning._parse_normalized_phone,
+                    normalized,
+                    regions,
+                    chunksize=max(len(normalized) // (self.phone_workers * 4), 1),
+                )
+                parsed = list(parsed)
+        else:
+            parsed = list(map(DataCleaning._parse_normalized_phone, normalized, regions))
+
+        return [phone if parsed_phone is None else parsed_phone for phone, parsed_phone in zip(phones, parsed)]
+
+    @staticmethod
+    def string_mask(values: pd.Series) -> pd.Series:
+        """Get a boolean mask of the values in a Series that are strings.
+
+        Args:
+            values (pd.Series): Series to check
+
+        Returns:
+            pd.Series: True where the value is a string
+        """
+        if isinstance(values.dtype, pd.StringDtype):
+            return values.notna()
+        return values.map(type).eq(str)
+
     @staticmethod
     def try_parse_date(date: str) -> datetime | None:
         """Try to parse a date string using dateutils.parser
@@ -72,6 +319,12 @@ class DataCleaning:
         if type(date) is not str:
             return None
 
+        return DataCleaning._parse_date_string(date)
+
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def _parse_date_string(date: str) -> datetime | None:
+        """Parse a date string using dateutils.parser, caching the result for repeated strings."""
         try:
             return parse(date)
         except ParserError:
@@ -87,195 +340,195 @@ class DataCleaning:
         Returns:
             pd.DataFrame: Parsed DataFrame
         """
-        # First pass
-        dataframe[column] = dataframe[column].apply(DataCleaning.try_parse_date)
-
-        # Second pass
-        parsed_dates = pd.to_datetime(
-            dataframe[column], errors="coerce", format=self.date_format
-        )
-        # Third pass to capture other format
-        mask = parsed_dates.isna()
-        dataframe.loc[mask, column] = pd.to_datetime(
-            dataframe.loc[mask, column] , errors="coerce", format=self.date_format_alt
-        )
-        # Combine results
-        dataframe[column] = dataframe[column].combine_first(parsed_dates)
+        dataframe[column] = self.parse_date_column(dataframe[column])
         return dataframe
 
-    def clean_user_data(self, dataframe: pd.DataFrame) -> pd.DataFrame:
-        """Clean data for the user DataFrame from the database.
+    def parse_date_column(self, values: pd.Series) -> pd.Series:
+        """Parse a Series of dates that has multiple formats
+
+        Each format in `date_formats` is tried in turn on the values not yet parsed.
+        Only the strings left after that are parsed by dateutil, once per unique string.
 
         Args:
-            dataframe (pd.DataFrame): The DataFrame that represents the user data
+            values (pd.Series): Series of date strings
 
         Returns:
-            DataFrame: Cleaned DataFrame
+            pd.Series: Parsed dates, NaT where a value could not be parsed
         """
-        # Convert object columns to their respective type
-        cleaned_df = dataframe.astype(
-            {
-                "first_name": "string",
-                "last_name": "string",
-                "company": "string",
-                "email_address": "string",
-                "address": "string",
-                "country_code": "string",
-                "country": "string",
-                "user_uuid": "string",
-            }
-        )
-
-        # Convert object date columns to the datetime type
-        # Some of these dates are in different formats, need to perform two passes
-        cleaned_df = self.parse_multiple_date_formats(cleaned_df, "date_of_birth")
-        cleaned_df = self.parse_multiple_date_formats(cleaned_df, "join_date")
-
-        # Null invalid UUID values
-        # Pandas suggest using pd.NA over numpy.nan for string type columns.
-        cleaned_df.loc[~cleaned_df.user_uuid.str.match(self.uuid_regex, na=False), "user_uuid"] = pd.NA
+        # Only strings can be parsed, anything else becomes NaT
+        remaining = DataCleaning.string_mask(values)
 
-        # Some values are NULL which is not a pandas NaN. Replace those
-        cleaned_df = cleaned_df.replace("NULL", pd.NA)
+        parsed_dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+        for date_format in self.date_formats:
+            if not remaining.any():
+                break
+            parsed_dates[remaining] = pd.to_datetime(values[remaining], errors="coerce", format=date_format)
+            remaining &= parsed_dates.isna()
 
-        # Some country codes are wrong
-        cleaned_df.country_code = cleaned_df.country_code.replace("GGB", "GB")
+        # Fall back to dateutil for the strings that matched none of the formats
+        if remaining.any():
+            parsed_dates[remaining] = pd.to_datetime(self.map_unique(DataCleaning._parse_date_string, values[remaining]))
 
-        # Disabled phone number parsing for now... too many edge cases.
+        return parsed_dates
 
-        # Using country code to parse phone number column to international format
-        # phonenumbers library helps here but still not perfectly...
-        # apply parse_phone_number on each row so we have access to country_code column
-        #cleaned_df.phone_number = cleaned_df.apply(
-        #    lambda row: self.parse_phone_number(row["phone_number"], row["country_code"]), axis=1 # type: ignore
-        #)
-        #cleaned_df.phone_number = cleaned_df.phone_number.astype("string") # Change column back to string from object
+    def user_data_spec(self) -> TableSpec:
+        """Get the cleaning rules for the user data.
 
+        Returns:
+            TableSpec: Cleaning rules for the user DataFrame
+        """
+        return TableSpec(
+            # Some values are NULL which is not a pandas NaN
+            null_tokens=("NULL",),
+            columns={
+                "first_name": ColumnSpec("string"),
+                "last_name": ColumnSpec("string"),
+                "company": ColumnSpec("string"),
+                # Some contain double @, remove duplicates then match basic email regex
+                "email_address": ColumnSpec("string", substitutions=[(r"@+", "@")], pattern=self.email_regex),
+                "address": ColumnSpec("string"),
+                "country": ColumnSpec("string"),
+                "country_code": ColumnSpec("string", replace=self.country_code_corrections),
+                # Null invalid UUID values
+                "user_uuid": ColumnSpec("string", pattern=self.uuid_regex),
+                # Some of these dates are in different formats
+                "date_of_birth": ColumnSpec(parse=self.parse_date_column),
+                "join_date": ColumnSpec(parse=self.parse_date_column),
+                # Using country code to parse phone number column to international format
+                "phone_number": ColumnSpec(
+                    "string",
+                    derive=lambda dataframe: self.parse_phone_numbers(
+                        dataframe.phone_number, dataframe.country_code.replace(self.country_code_corrections)
+                    ),
+                    sources=["phone_number", "country_code"],
+                ),
+            },
+        )
 
-        # Ensure email addresses are valid
-        # Some contain double @, remove duplicates
-        cleaned_df.email_address = cleaned_df.email_address.str.replace(r'@+', '@', regex=True)
-        # Match basic email regex
-        cleaned_df.loc[~cleaned_df.email_address.str.match(self.email_regex, na=False), "email_address"] = pd.NA
+    def clean_user_data(self, dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Clean data for the user DataFrame from the database.
 
-        # Some rows contain NULL which is not a valid pandas NA value, so replace them
-        cleaned_df = cleaned_df.replace("NULL", pd.NA)
+        Rows with any null values are dropped.
 
-        # Finally drop rows that have any null values
-        cleaned_df = cleaned_df.dropna(how='any', axis='index')
+        Args:
+            dataframe (pd.DataFrame): The DataFrame that represents the user data
 
-        return cleaned_df
+        Returns:
+            DataFrame: Cleaned DataFrame
+        """
+        return self.user_plan.apply(dataframe, self.record_dropped)
 
     @staticmethod
-    def extract_from_combined_card_data(row: pd.Series) -> pd.Series:
-        """Get card number and expiry date from the combined column
+    def split_combined_card_data(dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Get card number and expiry date, taking them from the combined column where both are missing
 
         Args:
-            row (pd.Series): Row from card DataFrame
+            dataframe (pd.DataFrame): Card DataFrame
 
         Returns:
-            pd.Series: Extracted card number and expiry date
+            pd.DataFrame: Card number and expiry date columns
         """
-        if pd.isna(row["card_number"]) and pd.isna(row["expiry_date"]):
-            split_parts = row["card_number expiry_date"].split(' ', 1)
-            return pd.Series([split_parts[0], split_parts[1]])
-        else:
-            return pd.Series([row["card_number"], row["expiry_date"]])
+        card_data = dataframe[["card_number", "expiry_date"]].astype("object")
+
+        combined = card_data["card_number"].isna() & card_data["expiry_date"].isna()
+        if combined.any():
+            split_parts = dataframe.loc[combined, "card_number expiry_date"].str.split(' ', n=1, expand=True)
+            card_data.loc[combined, "card_number"] = split_parts[0]
+            card_data.loc[combined, "expiry_date"] = split_parts[1]
+
+        return card_data
 
+    def card_data_spec(self) -> TableSpec:
+        """Get the cleaning rules for the card data.
+
+        Returns:
+            TableSpec: Cleaning rules for the card DataFrame
+        """
+        return TableSpec(
+            drop_columns=["card_number expiry_date", "Unnamed: 0"],
+            null_tokens=("NULL",),
+            columns={
+                # Get data from combined column and split
+                # Remove any non-numeric characters from card_number
+                "card_number": ColumnSpec(
+                    "string",
+                    substitutions=[(r"[^0-9]+", "")],
+                    empty_as_null=True,
+                    derive=lambda dataframe: self.split_combined_card_data(dataframe)["card_number"],
+                    sources=["card_number", "expiry_date", "card_number expiry_date"],
+                ),
+                "expiry_date": ColumnSpec(
+                    parse=lambda values: pd.to_datetime(values, errors="coerce", format=self.expiry_date_format),
+                    derive=lambda dataframe: self.split_combined_card_data(dataframe)["expiry_date"],
+                    sources=["card_number", "expiry_date", "card_number expiry_date"],
+                ),
+                "card_provider": ColumnSpec("string"),
+                "date_payment_confirmed": ColumnSpec(parse=self.parse_date_column),
+            },
+        )
 
     def clean_card_data(self, dataframe: pd.DataFrame) -> pd.DataFrame:
         """Clean data for the card DataFrame.
 
+        Rows with any null values are dropped.
+
         Args:
             dataframe (pd.DataFrame): The DataFrame that represents card data
 
         Returns:
             pd.DataFrame: Cleaned DataFrame
         """
-        # Get data from combined column and split
-        dataframe[["card_number", "expiry_date"]] = dataframe.apply(DataCleaning.extract_from_combined_card_data, axis=1)
-
-        # Drop columns that are not required
-        cleaned_df = dataframe.drop(columns=['card_number expiry_date', 'Unnamed: 0'])
-        cleaned_df.card_number = cleaned_df.card_number.astype("string")
-
-        # replace NULL with panda NA
-        cleaned_df = cleaned_df.replace("NULL", pd.NA)
+        return self.card_plan.apply(dataframe, self.record_dropped)
 
-        # Remove any non-numeric characters from card_number
-        cleaned_df.card_number = cleaned_df.card_number.replace(r'[^0-9]+', '', regex=True)
-        cleaned_df.card_number = cleaned_df.card_number.replace('', pd.NA, regex=True)
+    def store_data_spec(self) -> TableSpec:
+        """Get the cleaning rules for the store data.
 
-        # Convert column to their respective types
-        #cleaned_df.card_number = pd.to_numeric(cleaned_df.card_number, errors='coerce').astype("Int64") # This Dtype allows null values
-        cleaned_df.card_provider = cleaned_df.card_provider.astype("string")
-        cleaned_df.expiry_date = pd.to_datetime(
-    cleaned_df.expiry_date, errors="coerce", format=self.expiry_date_format
+        Returns:
+            TableSpec: Cleaning rules for the store DataFrame
+        """
+        # Convert long/latitude to float
+        to_float = ColumnSpec(parse=lambda values: pd.to_numeric(values, errors="coerce"), dtype="float")
+        return TableSpec(
+            # Noticed the lat column appears useless, since latitude exists with values. So drop it
+            drop_columns=["lat"],
+            null_tokens=("N/A",),
+            # Only get rows whose country_code is a valid one
+            row_rules=[RowRule("country_code", ["GB", "DE", "US"], rule="invalid_country_code")],
+            # Web Portal has NA values but we want to keep it
+            keep_incomplete={"store_type": ["Web Portal"]},
+            columns={
+                "address": ColumnSpec("string"),
+                "locality": ColumnSpec("string"),
+                "store_code": ColumnSpec("string"),
+                "store_type": ColumnSpec("string", required=False),
+                "country_code": ColumnSpec("string"),
+                # Correct some mistyped continent names
+                "continent": ColumnSpec("string", substitutions=[("ee", "")]),
+                # Remove letters from any numbers in staff numbers
+                "staff_numbers": ColumnSpec(
+                    substitutions=[(r"[^0-9]+", "")],
+                    empty_as_null=True,
+                    parse=lambda values: pd.to_numeric(values, errors="coerce"),
+                    dtype="Int64",
+                ),
+                "longitude": to_float,
+                "latitude": to_float,
+                "opening_date": ColumnSpec(parse=self.parse_date_column),
+            },
         )
 
-        # Parse payment confirmed date
-        cleaned_df = self.parse_multiple_date_formats(cleaned_df, "date_payment_confirmed")
-
-        # Finally drop any rows that have null values
-        cleaned_df = cleaned_df.dropna(how='any', axis='index')
-        return cleaned_df
-
     def clean_store_data(self, dataframe: pd.DataFrame) -> pd.DataFrame:
         """Clean data for the store DataFrame
 
+        Rows with an invalid country code are dropped, as are rows with null values other than the Web Portal.
+
         Args:
             dataframe (pd.DataFrame): The DataFrame that represents store data
 
         Returns:
             pd.DataFrame: Cleaned DataFrame
         """
-        # Replace N/A string with pandas NA
-        cleaned_store_df = dataframe.replace('N/A', pd.NA)
-
-        # Replace pythonic None from json response to pandas NA
-        cleaned_store_df = cleaned_store_df.replace([None], pd.NA)
-
-        # Noticed the lat column appears useless, since latitude exists with values. So drop it
-        cleaned_store_df = cleaned_store_df.drop(columns=['lat'])
-
-        # Change column types
-        cleaned_store_df = cleaned_store_df.astype(
-            {
-                "address": "string",
-                "locality": "string",
-                "store_code": "string",
-                "store_type": "string",
-                "country_code": "string",
-                "continent": "string"
-            }
-        )
-
-        # Remove letters from any numbers in staff numbers
-        cleaned_store_df.staff_numbers = cleaned_store_df.staff_numbers.replace(r'[^0-9]+', '', regex=True)
-        cleaned_store_df.staff_numbers = cleaned_store_df.staff_numbers.replace('', pd.NA, regex=True)
-        cleaned_store_df.staff_numbers = pd.to_numeric(cleaned_store_df.staff_numbers, errors="coerce").astype("Int64")
-
-        # Convert long/latitude to float
-        cleaned_store_df.longitude = pd.to_numeric(cleaned_store_df.longitude, errors="coerce").astype("float")
-        cleaned_store_df.latitude = pd.to_numeric(cleaned_store_df.latitude, errors="coerce").astype("float")
-
-        # Convert opening date
-        cleaned_store_df = self.parse_multiple_date_formats(cleaned_store_df, "opening_date")
-
-        # Only get rows whose country_code is a valid one
-        country_codes = ["GB", "DE", "US"]
-        mask = cleaned_store_df.country_code.isin(country_codes)
-        cleaned_store_df = cleaned_store_df[mask]
-
-        # Correct some mistyped continent names
-        cleaned_store_df.loc[:, "continent"] = cleaned_store_df["continent"].str.replace("ee", "")
-
-        # Web Portal has NA values but we want to keep it
-        # Drop other rows that have NA values
-        web_mask = cleaned_store_df["store_type"] == "Web Portal"
-        cleaned_store_df = cleaned_store_df[web_mask | cleaned_store_df.drop(columns=["store_type"]).notna().all(axis=1)]
-
-        return cleaned_store_df
+        return self.store_plan.apply(dataframe, self.record_dropped)
 
     def convert_product_weights(self, weight: str) -> float | None:
         """Convert a string weight value to kilograms.
@@ -342,59 +595,116 @@ class DataCleaning:
         # Unknown unit or other
         return
 
+    def convert_product_weights_column(self, weights: pd.Series) -> pd.Series:
+        """Convert a Series of string weight values to kilograms.
+
+        Vectorised equivalent of `convert_product_weights`, applying the same rules to the whole Series.
+        Values with a malformed multiplier, such as '12 x 2 x 125g', become NaN.
+
+        Args:
+            weights (pd.Series): Series of strings representing weights to be parsed.
+
+        Returns:
+            pd.Series: The weights, in kilograms, as floats. NaN where a weight could not be parsed.
+        """
+        # Non-string values are N/A. Weights repeat a lot, so only parse each unique string once
+        strings = weights.where(DataCleaning.string_mask(weights))
+        return self.map_unique(self._convert_unique_weights, strings, vectorized=True, cache="weights").astype("float")
+
+    def _convert_unique_weights(self, text: pd.Series) -> np.ndarray:
+        """Convert a Series of unique string weight values to kilograms, for `convert_product_weights_column`."""
+        # Some weights have multipliers, like 12 x 250g
+        has_multiplier = text.str.contains("x", regex=False, na=False)
+        multiplier_parts = text[has_multiplier].str.extract(r"^\s*(\d+)\s*x([^x]*)$")
+        multiplier = pd.to_numeric(multiplier_parts[0], errors="coerce").reindex(text.index, fill_value=1)
+        # Like convert_product_weights, only the weight after a multiplier is stripped
+        weight = text.mask(has_multiplier, multiplier_parts[1].str.strip())
+
+        # Same pattern as convert_product_weights, a float value followed by the unit
+        pattern_matches = weight.str.extract(r"^([\d.]+)([a-zA-Z]+)")
+        value = pd.to_numeric(pattern_matches[0], errors="coerce").astype("float")
+        unit = pattern_matches[1].str.lower()
+
+        # Kilograms per unit is 1 / divisor, unknown units are NaN
+        divisor = unit.map(self.weight_unit_divisors).astype("float")
+        # Some gram values are meant to be kg, denoted by decimal i.e 1.2g should be 1.2kg
+        divisor = divisor.mask((unit == "g") & (value % 1 != 0), 1.0)
+
+        return (multiplier.astype("float") * value / divisor).to_numpy(dtype="float")
+
+    @staticmethod
+    def to_integers(values: pd.Series) -> pd.Series:
+        """Convert a Series to numbers, as integers unless any value is not a number.
+
+        Args:
+            values (pd.Series): Series to convert
+
+        Returns:
+            pd.Series: Integers, or floats with NaN where a value is not a number
+        """
+        numbers = pd.to_numeric(values, errors="coerce")
+        return numbers if numbers.hasnans else numbers.astype("int64")
+
+    def products_data_spec(self) -> TableSpec:
+        """Get the cleaning rules for the products data.
+
+        Returns:
+            TableSpec: Cleaning rules for the products DataFrame
+        """
+        return TableSpec(
+            # Drop additional index column
+            drop_columns=["Unnamed: 0"],
+            # Only allow removed or still_available, null other options
+            row_rules=[RowRule("removed", ["Removed", "Still_avaliable"], action="null")],
+            columns={
+                # Convert weights to floats
+                "weight": ColumnSpec(parse=self.convert_product_weights_column, dtype="float"),
+                # Convert to boolean since less storage
+                "removed": ColumnSpec(value_map={"Removed": True, "Still_avaliable": False}, dtype="boolean"),
+                # Check UUID format is correct
+                "uuid": ColumnSpec("string", pattern=self.uuid_regex),
+                # Convert product_price to float, remove any characters before the number
+                "product_price": ColumnSpec(extract=self.currency_regex, dtype="Float64"),
+                "product_name": ColumnSpec("string"),
+                "category": ColumnSpec("string"),
+                "product_code": ColumnSpec("string"),
+                "EAN": ColumnSpec(parse=self.to_integers),
+                "date_added": ColumnSpec(parse=self.parse_date_column),
+            },
+        )
+
     def clean_products_data(self, dataframe: pd.DataFrame) -> pd.DataFrame:
         """Clean data for the Products DataFrame
 
+        Rows with any null values are dropped.
+
         Args:
             dataframe (pd.DataFrame): DataFrame representing products data
 
         Returns:
             pd.DataFrame: Cleaned Products DataFrame
         """
-        # Drop additional index column
-        cleaned_csv_data = dataframe.drop(columns=["Unnamed: 0"])
-        product_code_test = "A8-4686892S"
-        print("------------ BEFORE ------------")
-        print(cleaned_csv_data[cleaned_csv_data.product_code == product_code_test])
-
-        # Convert weights to floats
-        cleaned_csv_data.weight = cleaned_csv_data.weight.apply(self.convert_product_weights)
-        cleaned_csv_data.weight = pd.to_numeric(cleaned_csv_data.weight, errors="coerce").astype("float")
-
-        # Only allow removed or still_available, null other options
-        valid_removed_values = ["Removed", "Still_avaliable"]
-        cleaned_csv_data.loc[~cleaned_csv_data.removed.isin(valid_removed_values)] = pd.NA
-        # Convert to boolean since less storage
-        cleaned_csv_data.removed = cleaned_csv_data.removed.map({"Removed": True, "Still_avaliable": False}).astype("boolean")
-
-        # Check UUID format is correct
-        cleaned_csv_data.loc[~cleaned_csv_data.uuid.str.match(self.uuid_regex, na=False), "uuid"] = pd.NA
-
-        # Convert product_price to float, remove any characters before the number
-        cleaned_csv_data.product_price = cleaned_csv_data.product_price.str.extract(self.currency_regex)
-        cleaned_csv_data.product_price = cleaned_csv_data.product_price.astype("Float64")
-
-        # Convert column types
-        cleaned_csv_data = cleaned_csv_data.astype(
-            {
-                "product_name": "string",
-                "category": "string",
-                "product_code": "string",
-                "uuid": "string"
-            }
-        )
-        cleaned_csv_data.EAN = pd.to_numeric(cleaned_csv_data.EAN, errors="coerce").astype("int64", errors="ignore")
+        return self.products_plan.apply(dataframe, self.record_dropped)
 
-        # Convert date column
-        cleaned_csv_data = self.parse_multiple_date_formats(cleaned_csv_data, "date_added")
+    def orders_data_spec(self) -> TableSpec:
+        """Get the cleaning rules for the orders data.
 
-        print("------------ AFTER ------------")
-        print(cleaned_csv_data[cleaned_csv_data.product_code == product_code_test])
-
-        # Finally drop any rows with NA values
-        cleaned_csv_data = cleaned_csv_data.dropna(how="any", axis="index")
-
-        return cleaned_csv_data
+        Returns:
+            TableSpec: Cleaning rules for the orders DataFrame
+        """
+        return TableSpec(
+            # Drop unnecessary columns
+            drop_columns=["level_0", "first_name", "last_name", "1"],
+            # Two order lines can share every other value, so rows are told apart by their source index
+            index_column="index",
+            columns={
+                "date_uuid": ColumnSpec("string"),
+                "user_uuid": ColumnSpec("string"),
+                "store_code": ColumnSpec("string"),
+                "product_code": ColumnSpec("string"),
+            },
+            drop_nulls=False,
+        )
 
     def clean_orders_data(self, dataframe: pd.DataFrame) -> pd.DataFrame:
         """Clean data for the Orders DataFrame
@@ -405,39 +715,19 @@ class DataCleaning:
         Returns:
             pd.DataFrame: Cleaned Orders DataFrame
         """
-        # Drop unnecessary columns
-        cleaned_orders_df = dataframe.drop(columns=["level_0", "index", "first_name", "last_name", "1"])
-        # Ensure columns are correct type
-        cleaned_orders_df = cleaned_orders_df.astype(
-            {
-                "date_uuid": "string",
-                "user_uuid": "string",
-                "store_code": "string",
-                "product_code": "string"
-            }
-        )
-        return cleaned_orders_df
+        return self.orders_plan.apply(dataframe, self.record_dropped)
 
-    def clean_date_details_data(self, dataframe: pd.DataFrame) -> pd.DataFrame:
-        """Clean data for the Date Details DataFrame
+    @staticmethod
+    def combine_date_parts(dataframe: pd.DataFrame) -> pd.Series:
+        """Combine the day, month, year and timestamp columns of the date details into datetimes.
 
         Args:
             dataframe (pd.DataFrame): DataFrame representing Date Details data
 
         Returns:
-            pd.DataFrame: Cleaned Date Details DataFrame
+            pd.Series: Datetimes, NaT where the parts are not a valid datetime
         """
-        valid_time_periods = [
-            "Morning",
-            "Midday",
-            "Evening",
-            "Late_Hours"
-        ]
-        # Ensure time_period values are those that are valid
-        dataframe.loc[~dataframe.time_period.isin(valid_time_periods)] = pd.NA
-
-        # Combine date data into one column
-        dataframe["datetime_str"] = (
+        datetime_str = (
             dataframe.day.astype("str")
             + "-"
             + dataframe.month.astype("str")
@@ -446,24 +736,41 @@ class DataCleaning:
             + " "
             + dataframe.timestamp
         )
-        # Convert combined column into datetime
-        dataframe["datetime"] = pd.to_datetime(dataframe["datetime_str"], format="%d-%m-%Y %H:%M:%S", errors="coerce")
-        dataframe = dataframe.drop(columns=["datetime_str", "day", "month", "year", "timestamp"])
-
-        # Check UUID format
-        dataframe.loc[~dataframe.date_uuid.str.match(self.uuid_regex, na=False), "date_uuid"] = pd.NA
-
-        # Convert types
-        dataframe = dataframe.astype(
-            {
-                "time_period": "string",
-                "date_uuid": "string"
-            }
+        return pd.to_datetime(datetime_str, format="%d-%m-%Y %H:%M:%S", errors="coerce")
+
+    def date_details_data_spec(self) -> TableSpec:
+        """Get the cleaning rules for the date details data.
+
+        Returns:
+            TableSpec: Cleaning rules for the date details DataFrame
+        """
+        return TableSpec(
+            drop_columns=["day", "month", "year", "timestamp"],
+            # Ensure time_period values are those that are valid
+            row_rules=[RowRule("time_period", ["Morning", "Midday", "Evening", "Late_Hours"], action="null")],
+            columns={
+                "time_period": ColumnSpec("string"),
+                # Check UUID format
+                "date_uuid": ColumnSpec("string", pattern=self.uuid_regex),
+                # Combine date data into one column
+                "datetime": ColumnSpec(
+                    derive=self.combine_date_parts, sources=["day", "month", "year", "timestamp"]
+                ),
+            },
         )
 
-        # Drop any rows with null values
-        dataframe = dataframe.dropna(how="any", axis="index")
-        return dataframe
+    def clean_date_details_data(self, dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Clean data for the Date Details DataFrame
+
+        Rows with any null values are dropped.
+
+        Args:
+            dataframe (pd.DataFrame): DataFrame representing Date Details data
+
+        Returns:
+            pd.DataFrame: Cleaned Date Details DataFrame
+        """
+        return self.date_details_plan.apply(dataframe, self.record_dropped)
 
 
 if __name__ == "__main__":
@@ -1,26 +1,134 @@
 import pandas as pd
+import sqlalchemy
 import tabula
 import yaml
 import requests
-import time
 import boto3
+import codecs
+import contextvars
 import json
-from typing import List
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterator, List, Sequence
+from api_client import ApiClient, IndexCheckpoint, response_bytes
 from database_utils import DatabaseConnector
+from data_staging import DataStaging
+from file_cache import FileCache
+from http_cache import HttpCache
+from rate_limiter import AdaptiveTokenBucket
+
+
+def read_pdf_pages(path: str, pages: str) -> List[pd.DataFrame]:
+    """Read the tables from a range of pages in a PDF file. Module level so it can run in a worker process.
+
+    Args:
+        path (str): Path to the PDF file.
+        pages (str): Pages to read, such as '1-10' or 'all'.
+
+    Returns:
+        List[pd.DataFrame]: DataFrames of the tables on the pages.
+    """
+    return tabula.read_pdf(path, stream=True, pages=pages)
 
 
 class DataExtractor:
     """Class to handle data extraction from various sources."""
 
-    def __init__(self, connector: DatabaseConnector):
+    def __init__(
+        self,
+        connector: DatabaseConnector,
+        cache_dir: str = ".cache",
+        pdf_workers: int | None = None,
+        s3_endpoint_url: str | None = None,
+        api_config_path: str = "api_creds.yaml",
+        on_transfer: Callable[[str, int], None] | None = None,
+    ):
         self._connector = connector
-        self._api_config = self.load_api_config()
+        # Called with 'extract' and the bytes downloaded from the PDF, API and S3 sources. The database
+        # driver does not report the bytes it reads, so RDS tables are not counted
+        self._on_transfer = on_transfer
+        self._api_config_path = api_config_path
+        self._api_config: dict | None = None
+        self._api_client: ApiClient | None = None
+        self._api_lock = threading.Lock()
+        self._cache_dir = cache_dir
+        self._cache = FileCache(cache_dir)
+        self._pdf_workers = pdf_workers or os.cpu_count() or 1
+        self._s3_endpoint_url = s3_endpoint_url
+        self._s3_client = None
+        self._s3_client_lock = threading.Lock()
+
+    @property
+    def s3_client(self):
+        """S3 client shared by all S3 extractions, created on first use."""
+        with self._s3_client_lock:
+            if self._s3_client is None:
+                self._s3_client = boto3.client('s3', endpoint_url=self._s3_endpoint_url)
+        return self._s3_client
 
-    def read_rds_table(self, table_name: str) -> pd.DataFrame:
+    @property
+    def api_config(self) -> dict:
+        """Store API configuration, loaded on first use, so only extracting stores needs api_creds.yaml."""
+        with self._api_lock:
+            if self._api_config is None:
+                self._api_config = self.load_api_config()
+        return self._api_config
+
+    @property
+    def api_client(self) -> ApiClient:
+        """API client shared by all store requests, created on first use."""
+        config = self.api_config
+        with self._api_lock:
+            if self._api_client is None:
+                self._api_client = self.create_api_client(config, self._cache_dir, self._on_transfer)
+        return self._api_client
+
+    def _table_query(
+        self,
+        table_name: str,
+        columns: List[str] | None = None,
+        exclude: List[str] | None = None,
+        where: Sequence[str | sqlalchemy.ColumnElement] | None = None,
+    ) -> sqlalchemy.Select:
+        """Build the query selecting the columns and rows of a table that are needed.
+
+        Raises:
+            ValueError: If the table does not exist.
+        """
+        if not self._connector.has_table(table_name):
+            raise ValueError(f"{table_name} table is not in the database.")
+
+        if columns is None and not exclude:
+            selected = [sqlalchemy.literal_column("*")]
+        else:
+            if columns is None:
+                # Only the names of the columns to exclude are known, so the others are looked up
+                columns = self._connector.list_table_columns(table_name)
+            selected = [sqlalchemy.column(column) for column in columns if column not in (exclude or [])]
+        query = sqlalchemy.select(*selected).select_from(sqlalchemy.table(table_name))
+        for predicate in where or []:
+            query = query.where(sqlalchemy.text(predicate) if isinstance(predicate, str) else predicate)
+        return query
+
+    def read_rds_table(
+        self,
+        table_name: str,
+        columns: List[str] | None = None,
+        exclude: List[str] | None = None,
+        where: Sequence[str | sqlalchemy.ColumnElement] | None = None,
+    ) -> pd.DataFrame:
         """Get a DataFrame representation of a table from the database.
 
+        Only the columns and rows that are needed are sent by the database, see `CleaningPlan.pushdown`.
+
         Args:
             table_name (str): Name of the table to fetch.
+            columns (List[str] | None, optional): Columns to fetch. Defaults to every column.
+            exclude (List[str] | None, optional): Columns not to fetch. Defaults to None.
+            where (Sequence[str | sqlalchemy.ColumnElement] | None, optional): SQL predicates every row
+                fetched must meet. Defaults to None.
 
         Raises:
             ValueError: If the table does not exist.
@@ -28,92 +136,307 @@ class DataExtractor:
         Returns:
             pd.DataFrame: DataFrame representation of the database table.
         """
-        tables = self._connector.list_db_tables()
-        if table_name not in tables:
-            raise ValueError(f"{table_name} table is not in the database.")
+        query = self._table_query(table_name, columns, exclude, where)
+        with self._connector.engine.connect() as connection:
+            return pd.read_sql_query(query, connection)
+
+    def read_rds_table_chunks(
+        self,
+        table_name: str,
+        chunksize: int = 100_000,
+        columns: List[str] | None = None,
+        exclude: List[str] | None = None,
+        where: Sequence[str | sqlalchemy.ColumnElement] | None = None,
+    ) -> Iterator[pd.DataFrame]:
+        """Get an iterator of DataFrames that together represent a table from the database.
+
+        Rows are streamed with a server-side cursor, so only one chunk is held in memory at a time.
+
+        Args:
+            table_name (str): Name of the table to fetch.
+            chunksize (int, optional): Number of rows in each DataFrame. Defaults to 100000.
+            columns (List[str] | None, optional): Columns to fetch. Defaults to every column.
+            exclude (List[str] | None, optional): Columns not to fetch. Defaults to None.
+            where (Sequence[str | sqlalchemy.ColumnElement] | None, optional): SQL predicates every row
+                fetched must meet. Defaults to None.
+
+        Raises:
+            ValueError: If the table does not exist.
+
+        Yields:
+            Iterator[pd.DataFrame]: DataFrames of up to `chunksize` rows, in table order.
+        """
+        query = self._table_query(table_name, columns, exclude, where)
+        with self._connector.engine.connect().execution_options(
+            stream_results=True, max_row_buffer=chunksize
+        ) as connection:
+            offset = 0
+            for chunk in pd.read_sql_query(query, connection, chunksize=chunksize):
+                # Continue the index across chunks, as if the table was read in one go
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield chunk
+
+    def _record_transfer(self, byte_count: int):
+        """Report bytes downloaded from a source to `on_transfer`."""
+        if self._on_transfer is not None:
+            self._on_transfer("extract", byte_count)
+
+    def download_pdf(self, url: str) -> str:
+        """Download a PDF file into the cache, unless the cached copy is still current.
+
+        The cached copy is revalidated with its ETag, so an unchanged file is not downloaded again.
+
+        Args:
+            url (str): The URL to the PDF file.
+
+        Returns:
+            str: Path to the cached PDF file.
+        """
+        metadata = self._cache.get_metadata("pdf", url)
+        headers = {"If-None-Match": metadata["etag"]} if metadata and metadata.get("etag") else {}
+
+        response = requests.get(url, headers=headers)
+        self._record_transfer(response_bytes(response))
+        if response.status_code == 304:
+            return self._cache.content_path("pdf", metadata["content_hash"], metadata["suffix"])
+        response.raise_for_status()
+
+        return self._cache.store("pdf", url, response.content, ".pdf", etag=response.headers.get("ETag"))
 
-        return pd.read_sql_table(table_name, self._connector.engine)
+    @staticmethod
+    def count_pdf_pages(path: str) -> int:
+        """Return the number of pages in a PDF file, or 0 if they could not be counted.
+
+        Args:
+            path (str): Path to the PDF file.
+
+        Returns:
+            int: Number of page objects in the file.
+        """
+        with open(path, "rb") as pdf_file:
+            # Page objects are '/Type /Page', the page tree is '/Type /Pages'
+            return len(re.findall(rb"/Type\s*/Page(?![a-zA-Z])", pdf_file.read()))
 
     def retrieve_pdf_data(self, url: str) -> pd.DataFrame:
         """Return a DataFrame from tables in a PDF file.
 
+        The PDF is cached on disk along with the parsed tables, so an unchanged PDF is not parsed again.
+        Otherwise, ranges of pages are parsed in parallel worker processes.
+
         Args:
             url (str): The URL to the PDF file.
 
         Returns:
             pd.DataFrame: DataFrame representing the tables data in the PDF file.
         """
-        dataframes: List[pd.DataFrame] = tabula.read_pdf(url, stream=True, pages='all')
+        pdf_path = self.download_pdf(url)
+        parsed_path = os.path.splitext(pdf_path)[0] + ".parquet"
+        if os.path.exists(parsed_path):
+            return pd.read_parquet(parsed_path)
+
+        page_count = self.count_pdf_pages(pdf_path)
+        if page_count == 0:
+            # Pages could not be counted, so parse the whole document in one go
+            page_ranges = ["all"]
+        else:
+            pages_per_worker = -(-page_count // self._pdf_workers) # ceiling division
+            page_ranges = [
+                f"{start}-{min(start + pages_per_worker - 1, page_count)}"
+                for start in range(1, page_count + 1, pages_per_worker)
+            ]
+
+        with ProcessPoolExecutor(max_workers=len(page_ranges)) as executor:
+            # map returns results in page order
+            dataframes: List[pd.DataFrame] = [
+                dataframe
+                for range_dataframes in executor.map(read_pdf_pages, [pdf_path] * len(page_ranges), page_ranges)
+                for dataframe in range_dataframes
+            ]
         merged_dfs = pd.concat(dataframes, ignore_index=True)
         merged_dfs.reset_index(inplace=True)
+
+        # Parquet needs a single type per column, so store mixed columns as strings
+        DataStaging.parquet_compatible(merged_dfs).to_parquet(parsed_path)
         return merged_dfs
 
     def load_api_config(self) -> dict:
-        """Load API configuration from file api_creds.yaml
+        """Load API configuration from file, api_creds.yaml by default
 
         Returns:
             dict: Dictionary of configuration values.
         """
-        with open("api_creds.yaml") as config:
+        with open(self._api_config_path) as config:
             config = yaml.safe_load(config)
         return config
 
+    @staticmethod
+    def create_api_client(
+        config: dict, cache_dir: str = ".cache", on_transfer: Callable[[str, int], None] | None = None
+    ) -> ApiClient:
+        """Create the client for the store API from the API configuration.
+
+        The request rate starts at `requests_per_second`, and adapts to throttling by the API up to
+        `max_requests_per_second`. Responses are cached for `cache_ttl_seconds`, then revalidated, and
+        the least recently used ones are evicted past `cache_max_bytes`.
+
+        Args:
+            config (dict): API configuration, see `load_api_config`.
+            cache_dir (str, optional): Directory of the response cache. Defaults to ".cache".
+            on_transfer (Callable[[str, int], None] | None, optional): Called with the bytes of every
+                response. Defaults to None.
+
+        Raises:
+            ValueError: If no rate is configured and `request_delay` is missing or not positive.
+
+        Returns:
+            ApiClient: Client shared by all store requests.
+        """
+        requests_per_second = config.get("requests_per_second")
+        if requests_per_second is None:
+            # Fall back to the fixed delay between requests if no rate is configured
+            request_delay = config.get("request_delay")
+            if request_delay is None or request_delay <= 0:
+                raise ValueError("api_creds.yaml must set requests_per_second, or a request_delay greater than zero.")
+            requests_per_second = 1 / request_delay
+        rate_limiter = AdaptiveTokenBucket(requests_per_second, max_rate=config.get("max_requests_per_second"))
+        return ApiClient(
+            headers=config["header"],
+            rate_limiter=rate_limiter,
+            max_retries=config.get("max_retries", 3),
+            backoff_seconds=config.get("backoff_seconds", 0.5),
+            max_backoff_seconds=config.get("max_backoff_seconds", 30.0),
+            pool_size=config.get("max_concurrent_requests", 1),
+            cache=HttpCache(
+                os.path.join(cache_dir, "api", "responses.sqlite"),
+                ttl_seconds=config.get("cache_ttl_seconds", 86_400),
+                max_bytes=config.get("cache_max_bytes", 64 * 1024 * 1024),
+            ),
+            on_transfer=on_transfer,
+        )
+
     def list_number_of_stores(self) -> int:
         """Return the number of stores in the API
 
         Returns:
             int: Store count
         """
-        headers = self._api_config["header"]
-        url = self._api_config["retrieve_store_count_url"]
+        url = self.api_config["retrieve_store_count_url"]
 
-        # Get the number of stores from the API
-        response = requests.get(url, headers=headers)
-        data = response.json()
+        # Get the number of stores from the API, never from the cache, so new stores are always fetched
+        data = self.api_client.get_json(url, cached=False)
         return int(data["number_stores"])
 
+    def retrieve_store(self, index: int) -> dict:
+        """Retrieve the JSON data for a single store from the API.
+
+        Args:
+            index (int): Index of the store to retrieve.
+
+        Raises:
+            requests.RequestException: If the store could not be retrieved after all retries.
+
+        Returns:
+            dict: JSON data of the store.
+        """
+        store_url = self.api_config["retrieve_store_url"] + str(index)
+        return self.api_client.get_json(store_url)
+
     def retrieve_stores_data(self) -> pd.DataFrame:
         """Retrieve a DataFrame that represents all the store data from the API.
 
+        Stores are fetched concurrently by up to `max_concurrent_requests` threads, with the
+        overall request rate adapting to throttling by the API. The order of the stores is kept.
+        Stores fetched recently are served from the response cache, and older ones are only downloaded
+        again if they have changed.
+
+        Each store is saved to a checkpoint as soon as it is fetched, so if a store cannot be fetched,
+        the next run only fetches the stores that are missing. The checkpoint is removed once every
+        store has been fetched, so later runs fetch the current data.
+
         Returns:
             pd.DataFrame: DataFrame representing all store data.
         """
         number_of_stores = self.list_number_of_stores()
-        headers = self._api_config["header"]
-        url = self._api_config["retrieve_store_url"]
 
-        store_jsons = []
-        for index in range(number_of_stores):
-            store_url = url + str(index)
-            response = requests.get(store_url, headers=headers)
-            store_jsons.append(response.json())
-            time.sleep(self._api_config["request_delay"]) # sleep to avoid rate limit
+        # A checkpoint for a different number of stores is not used
+        checkpoint = IndexCheckpoint(os.path.join(self._cache_dir, "api", f"stores-{number_of_stores}.jsonl"))
+        stores = checkpoint.load()
+        missing = [index for index in range(number_of_stores) if index not in stores]
+        if stores:
+            print(f"Stores: resuming from checkpoint, {len(missing)} of {number_of_stores} left to fetch.")
 
-        return pd.DataFrame(store_jsons)
+        def fetch(index: int):
+            stores[index] = self.retrieve_store(index)
+            checkpoint.save(index, stores[index])
 
-    def extract_from_s3(self, s3_url: str, data_type: str = "csv") -> pd.DataFrame:
+        max_workers = self.api_config.get("max_concurrent_requests", 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Raise the first failure once the other stores have been fetched and saved
+            # Each fetch runs in a copy of the context, so its transfers count towards the stage fetching the stores
+            for result in [executor.submit(contextvars.copy_context().run, fetch, index) for index in missing]:
+                result.result()
+
+        checkpoint.clear()
+        return pd.DataFrame([stores[index] for index in range(number_of_stores)])
+
+    def extract_from_s3(
+        self, s3_url: str, data_type: str = "csv", use_cache: bool = True, lines: bool = False
+    ) -> pd.DataFrame:
         """Download a CSV file from an S3 Bucket and parse it as a DataFrame
 
+        With `use_cache`, the file is kept in the local cache and only downloaded again when its ETag changes.
+        Otherwise it is parsed straight from the response stream without touching disk.
+
         Args:
             s3_url (str): Full URL of the file object.
             data_type (str, optional): Type of data to parse. Defaults to 'csv'. Valid is 'csv', 'json'
+            use_cache (bool, optional): Cache the file on disk. Defaults to True.
+            lines (bool, optional): JSON data is line-delimited, one record per line. Defaults to False.
+
+        Raises:
+            ValueError: If the data type is not valid.
 
         Returns:
             pd.DataFrame: DataFrame representing the CSV file.
         """
+        if data_type not in ("csv", "json"):
+            raise ValueError(f"{data_type} is not a valid data type.")
+
         # Get bucket and file key from s3 url
         bucket, object_key = s3_url[5:].split('/', maxsplit=1)
-        filename = object_key.split('/')[-1] # if nested, this gets file from end
-        s3_client = boto3.client('s3')
-        s3_client.download_file(bucket, object_key, filename)
 
-        with open(filename, "r") as data_file:
-            if data_type == "csv":
-                data = pd.read_csv(data_file)
-            elif data_type == "json":
-                data = pd.read_json(data_file)
+        if not use_cache:
+            response = self.s3_client.get_object(Bucket=bucket, Key=object_key)
+            self._record_transfer(response["ContentLength"])
+            return self._parse_data(response["Body"], data_type, lines)
+
+        source = f"{bucket}/{object_key}"
+        etag = self.s3_client.head_object(Bucket=bucket, Key=object_key)["ETag"]
+        metadata = self._cache.get_metadata("s3", source)
+        if metadata and metadata.get("etag") == etag:
+            path = self._cache.content_path("s3", metadata["content_hash"], metadata["suffix"])
+        else:
+            response = self.s3_client.get_object(Bucket=bucket, Key=object_key)
+            self._record_transfer(response["ContentLength"])
+            path = self._cache.store("s3", source, response["Body"].read(), f".{data_type}", etag=response["ETag"])
+
+        return self._parse_data(path, data_type, lines)
+
+    @staticmethod
+    def _parse_data(source, data_type: str, lines: bool, chunksize: int = 100_000) -> pd.DataFrame:
+        """Parse CSV or JSON data from a file path or a file-like stream."""
+        if data_type == "csv":
+            return pd.read_csv(source)
 
-        return data
+        if not lines:
+            return pd.read_json(source)
+        if isinstance(source, str):
+            # The pyarrow engine is much faster, but can only read line-delimited JSON from a file
+            return pd.read_json(source, lines=True, engine="pyarrow")
+        # Parse line-delimited streams a chunk at a time, decoding the bytes as they are read
+        with pd.read_json(codecs.getreader("utf-8")(source), lines=True, chunksize=chunksize) as reader:
+            return pd.concat(reader, ignore_index=True)
 
 if __name__ == "__main__":
     connector = DatabaseConnector()
@@ -0,0 +1,192 @@
+import os
+import shutil
+import uuid
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, List
+
+import pandas as pd
+
+
+class DataStaging:
+    """Class for persisting raw and cleaned DataFrames as Parquet between the extract, clean and upload steps.
+
+    Each run has its own directory, with a sub-directory per stage. When resuming, artifacts already
+    written by the latest run are loaded instead of being produced again, so a failed upload does not
+    need the sources to be extracted again. Older runs are removed with `prune`.
+    """
+
+    def __init__(
+        self,
+        staging_dir: str = "staging",
+        run_id: str | None = None,
+        resume: bool = False,
+        arrow_dtypes: bool = False,
+        on_transfer: Callable[[str, int], None] | None = None,
+    ):
+        """Create a staging area for a run.
+
+        Args:
+            staging_dir (str, optional): Directory containing the run directories. Defaults to "staging".
+            run_id (str | None, optional): Name of the run directory. Defaults to the latest run when
+                resuming, otherwise a new run named by the current time and a random suffix.
+            resume (bool, optional): Load existing artifacts instead of producing them again. Defaults to False.
+            arrow_dtypes (bool, optional): Load artifacts with pyarrow-backed dtypes instead of NumPy
+                dtypes. Defaults to False.
+            on_transfer (Callable[[str, int], None] | None, optional): Called with 'staging_write' or
+                'staging_read' and the size of each Parquet file written or read. Defaults to None.
+        """
+        self._resume = resume
+        self._arrow_dtypes = arrow_dtypes
+        self._on_transfer = on_transfer
+
+        self._staging_dir = staging_dir
+
+        if run_id is None:
+            existing_runs = self.list_runs()
+            if resume and existing_runs:
+                run_id = existing_runs[-1]
+            else:
+                # Runs started in the same second get different directories, and still sort by start time
+                run_id = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:8]}"
+        self.run_id = run_id
+        self.run_dir = os.path.join(staging_dir, run_id)
+
+    def list_runs(self) -> List[str]:
+        """Return the names of the runs in the staging directory, oldest first.
+
+        Returns:
+            List[str]: Names of the run directories.
+        """
+        if not os.path.isdir(self._staging_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self._staging_dir) if os.path.isdir(os.path.join(self._staging_dir, name))
+        )
+
+    def prune(self, keep_runs: int) -> List[str]:
+        """Remove all but the latest runs, never removing this run.
+
+        Args:
+            keep_runs (int): Number of runs to keep, including this one.
+
+        Returns:
+            List[str]: Names of the runs that were removed.
+        """
+        older_runs = [run_id for run_id in self.list_runs() if run_id != self.run_id]
+        keep_older = max(keep_runs - 1, 0)
+        removed = older_runs[:max(len(older_runs) - keep_older, 0)]
+        for run_id in removed:
+            shutil.rmtree(os.path.join(self._staging_dir, run_id), ignore_errors=True)
+        return removed
+
+    @staticmethod
+    def parquet_compatible(dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Convert object columns holding more than strings to strings, since Parquet needs one type per column.
+
+        Null values are kept as null.
+
+        Args:
+            dataframe (pd.DataFrame): DataFrame to convert. It is modified in place.
+
+        Returns:
+            pd.DataFrame: The converted DataFrame.
+        """
+        for column in dataframe.select_dtypes(include="object").columns:
+            values = dataframe[column]
+            dataframe[column] = values.where(values.isna(), values.astype(str))
+        return dataframe
+
+    def _stage_dir(self, stage: str) -> str:
+        directory = os.path.join(self.run_dir, stage)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def can_resume(self, stage: str, artifact: str) -> bool:
+        """Return whether an artifact of a stage, made of one DataFrame or of chunks, will be resumed.
+
+        Args:
+            stage (str): Name of the stage, such as 'dim_users'.
+            artifact (str): Name of the artifact, such as 'raw' or 'cleaned'.
+
+        Returns:
+            bool: True if resuming and the artifact was saved in full.
+        """
+        directory = os.path.join(self.run_dir, stage)
+        return self._resume and (
+            os.path.exists(os.path.join(directory, f"{artifact}.parquet"))
+            or os.path.exists(os.path.join(directory, artifact, "_COMPLETE"))
+        )
+
+    def _write(self, dataframe: pd.DataFrame, path: str):
+        """Write a Parquet artifact, leaving the DataFrame as it is for the next step."""
+        # Only a shallow copy is converted, so the next step gets the same values as a run without staging
+        self.parquet_compatible(dataframe.copy(deep=False)).to_parquet(path)
+        if self._on_transfer is not None:
+            self._on_transfer("staging_write", os.path.getsize(path))
+
+    def _read(self, path: str) -> pd.DataFrame:
+        """Read a Parquet artifact, memory-mapping the file."""
+        if self._on_transfer is not None:
+            self._on_transfer("staging_read", os.path.getsize(path))
+        if self._arrow_dtypes:
+            return pd.read_parquet(path, memory_map=True, dtype_backend="pyarrow")
+        return pd.read_parquet(path, memory_map=True)
+
+    def cached(self, stage: str, artifact: str, produce: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """Return an artifact of a stage, producing and saving it unless it can be resumed.
+
+        A produced artifact is returned as it was produced. A resumed one is read back from Parquet, where
+        object columns holding more than strings hold strings, see `parquet_compatible`.
+
+        Args:
+            stage (str): Name of the stage, such as 'dim_users'.
+            artifact (str): Name of the artifact, such as 'raw' or 'cleaned'.
+            produce (Callable[[], pd.DataFrame]): Function returning the artifact when it is not resumed.
+
+        Returns:
+            pd.DataFrame: The artifact.
+        """
+        path = os.path.join(self._stage_dir(stage), f"{artifact}.parquet")
+        if self._resume and os.path.exists(path):
+            return self._read(path)
+
+        dataframe = produce()
+        # Write to a temporary file first so a failure never leaves a partial artifact to resume from
+        self._write(dataframe, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return dataframe
+
+    def cached_chunks(
+        self, stage: str, artifact: str, produce: Callable[[], Iterable[pd.DataFrame]]
+    ) -> Iterator[pd.DataFrame]:
+        """Return an artifact of a stage made of chunks, producing and saving them unless they can be resumed.
+
+        Each chunk is saved as one part file as it is produced. The artifact can only be resumed once
+        every chunk has been saved.
+
+        Args:
+            stage (str): Name of the stage, such as 'orders_table'.
+            artifact (str): Name of the artifact, such as 'raw' or 'cleaned'.
+            produce (Callable[[], Iterable[pd.DataFrame]]): Function returning the chunks when they are not resumed.
+
+        Yields:
+            Iterator[pd.DataFrame]: Chunks of the artifact, in order.
+        """
+        directory = os.path.join(self._stage_dir(stage), artifact)
+        complete_marker = os.path.join(directory, "_COMPLETE")
+
+        if self._resume and os.path.exists(complete_marker):
+            for part in sorted(name for name in os.listdir(directory) if name.endswith(".parquet")):
+                yield self._read(os.path.join(directory, part))
+            return
+
+        os.makedirs(directory, exist_ok=True)
+        # Remove parts of an earlier incomplete attempt
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+        for part_number, chunk in enumerate(produce()):
+            self._write(chunk, os.path.join(directory, f"part-{part_number:05d}.parquet"))
+            yield chunk
+
+        open(complete_marker, "w").close()
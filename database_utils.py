@@ -1,7 +1,83 @@
+import csv
+import io
+import threading
+import time
+from functools import partial
 import yaml
 import sqlalchemy
 import pandas as pd
-from typing import List
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+from pandas.io.sql import SQLTable
+
+# Engines are shared by every connector with the same URL and options, so they share a connection pool
+_engines: Dict[Tuple[str, Tuple], sqlalchemy.Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(url: sqlalchemy.URL, **options) -> sqlalchemy.Engine:
+    """Return the engine for a database URL and engine options, creating it the first time.
+
+    Args:
+        url (sqlalchemy.URL): URL of the database.
+        **options: Options passed to `sqlalchemy.create_engine`, such as `pool_size`.
+
+    Returns:
+        sqlalchemy.Engine: Engine shared by every caller with the same URL and options.
+    """
+    key = (url.render_as_string(hide_password=False), tuple(sorted(options.items())))
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = sqlalchemy.create_engine(url, **options)
+        return _engines[key]
+
+
+def dispose_engines():
+    """Close the connections of every shared engine, and forget them."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def copy_insert(
+    table: SQLTable,
+    connection: sqlalchemy.Connection,
+    keys: List[str],
+    data_iter: Iterable,
+    on_transfer: Callable[[str, int], None] | None = None,
+):
+    """Insert method for `DataFrame.to_sql` that streams rows into Postgres with `COPY FROM STDIN`.
+
+    Rows are written to an in-memory UTF-8 CSV buffer, one buffer per chunk given by `to_sql`.
+
+    Args:
+        table (SQLTable): pandas table being written to.
+        connection (sqlalchemy.Connection): Connection the table is being written with.
+        keys (List[str]): Column names, in the order of the values in each row.
+        data_iter (Iterable): Rows of values to insert.
+        on_transfer (Callable[[str, int], None] | None, optional): Called with 'upload' and the bytes of
+            each buffer sent. Defaults to None.
+    """
+    buffer = io.BytesIO()
+    text = io.TextIOWrapper(buffer, encoding="utf-8", newline="")
+    writer = csv.writer(text, lineterminator="\n")
+    # Write nulls as \N so they can be told apart from empty strings
+    writer.writerows(
+        [r"\N" if value is None else value for value in row] for row in data_iter
+    )
+    # Detach, so the buffer stays open once the wrapper is gone
+    text.detach()
+    if on_transfer is not None:
+        on_transfer("upload", buffer.tell())
+    buffer.seek(0)
+
+    columns = ", ".join(f'"{key}"' for key in keys)
+    table_name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+    dbapi_connection = connection.connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N', ENCODING 'UTF8')", buffer
+        )
 
 
 class DatabaseConnector:
@@ -12,11 +88,52 @@ class DatabaseConnector:
         credential_path: str = "db_creds.yaml",
         db_type: str = "postgresql",
         db_api: str = "psycopg2",
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_pre_ping: bool = True,
+        pool_recycle: int = 1800,
+        executemany_mode: str | None = "values_plus_batch",
+        table_cache_ttl: float = 300.0,
+        on_transfer: Callable[[str, int], None] | None = None,
     ):
+        """Create a database connector. The engine is only created when first used.
+
+        Args:
+            credential_path (str, optional): Path to credentials file. Defaults to "db_creds.yaml".
+            db_type (str, optional): Type of database engine. Defaults to "postgresql".
+            db_api (str, optional): Type of Python API for database type. Defaults to "psycopg2".
+            pool_size (int, optional): Connections kept open in the pool. Defaults to 5.
+            max_overflow (int, optional): Connections opened beyond the pool size when it is busy. Defaults to 10.
+            pool_pre_ping (bool, optional): Test connections before using them, replacing ones the server
+                closed. Defaults to True.
+            pool_recycle (int, optional): Seconds after which a connection is replaced. Defaults to 1800.
+            executemany_mode (str | None, optional): Batching of multi-row statements for psycopg2.
+                With pyodbc, any value turns on `fast_executemany`. Defaults to "values_plus_batch".
+            table_cache_ttl (float, optional): Seconds the list of tables is cached for. Defaults to 300.
+            on_transfer (Callable[[str, int], None] | None, optional): Called with 'upload' and the bytes
+                sent with `COPY` on Postgres. Other databases do not report the bytes they are sent.
+                Defaults to None.
+        """
+        self.on_transfer = on_transfer
         self._engine: sqlalchemy.Engine | None = None
         self._credential_path = credential_path
         self._db_type = db_type
         self._db_api = db_api
+        self._pool_options = {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_pre_ping": pool_pre_ping,
+            "pool_recycle": pool_recycle,
+        }
+        self._executemany_mode = executemany_mode
+        self._table_cache_ttl = table_cache_ttl
+        self._tables: List[str] | None = None
+        self._tables_loaded_at = 0.0
+        self._tables_lock = threading.Lock()
+        # Column names of each table, with the time they were fetched, cached like the list of tables
+        self._columns: Dict[str, Tuple[List[str], float]] = {}
+        # Tables whose rows were written or changed by this connector, so what is built from them can be refreshed
+        self.changed_tables: Set[str] = set()
 
     @property
     def engine(self) -> sqlalchemy.Engine:
@@ -42,44 +159,275 @@ class DatabaseConnector:
     def init_db_engine(self) -> sqlalchemy.Engine:
         """Get an engine instance by connecting to a database instance
 
-        Args:
-            db_type (str, optional): Type of database engine. Defaults to "postgresql".
-            db_api (str, optional): Type of Python API for database type. Defaults to "psycopg2".
+        Connectors with the same credentials and options share one engine, and so one connection pool.
 
         Returns:
             sqlalchemy.Engine: SQLAlchemy engine to perform operations.
         """
 
         creds = self.read_db_creds()
-        return sqlalchemy.create_engine(
-            url=f"{self._db_type}+{self._db_api}://{creds['RDS_USER']}:{creds['RDS_PASSWORD']}@{creds['RDS_HOST']}:{creds['RDS_PORT']}/{creds['RDS_DATABASE']}",
+        url = sqlalchemy.URL.create(
+            f"{self._db_type}+{self._db_api}",
+            username=creds["RDS_USER"],
+            password=creds["RDS_PASSWORD"],
+            host=creds["RDS_HOST"],
+            port=creds["RDS_PORT"],
+            database=creds["RDS_DATABASE"],
         )
 
-    def list_db_tables(self) -> List[str]:
+        options = dict(self._pool_options)
+        if self._executemany_mode and self._db_api == "psycopg2":
+            options["executemany_mode"] = self._executemany_mode
+        elif self._executemany_mode and self._db_api == "pyodbc":
+            options["fast_executemany"] = True
+        return get_engine(url, **options)
+
+    def list_db_tables(self, refresh: bool = False) -> List[str]:
         """Return a list of tables in the database.
 
+        The list is cached for `table_cache_ttl` seconds, and refreshed when this connector creates a table.
+
+        Args:
+            refresh (bool, optional): Fetch the list from the database even if it is cached. Defaults to False.
+
         Returns:
             List[str]: List of tables, empty if none.
         """
-        inspector: sqlalchemy.Inspector | None = sqlalchemy.inspect(self.engine)
+        with self._tables_lock:
+            expired = time.monotonic() - self._tables_loaded_at > self._table_cache_ttl
+            if refresh or expired or self._tables is None:
+                self._tables = sqlalchemy.inspect(self.engine).get_table_names()
+                self._tables_loaded_at = time.monotonic()
+            return list(self._tables)
+
+    def has_table(self, table_name: str) -> bool:
+        """Return whether a table is in the database, using the cached list of tables.
+
+        A table missing from the cached list is checked against the database, since another process
+        may have created it.
+
+        Args:
+            table_name (str): Name of the table.
+
+        Returns:
+            bool: True if the table exists.
+        """
+        return table_name in self.list_db_tables() or table_name in self.list_db_tables(refresh=True)
+
+    def list_table_columns(self, table_name: str, refresh: bool = False) -> List[str]:
+        """Return the names of the columns of a table, in order.
 
-        if inspector:
-            return inspector.get_table_names()
+        The names are cached for `table_cache_ttl` seconds, and forgotten when this connector replaces the table.
+
+        Args:
+            table_name (str): Name of the table.
+            refresh (bool, optional): Fetch the names from the database even if they are cached. Defaults to False.
+
+        Returns:
+            List[str]: Column names.
+        """
+        with self._tables_lock:
+            cached = self._columns.get(table_name)
+            if refresh or cached is None or time.monotonic() - cached[1] > self._table_cache_ttl:
+                columns = [column["name"] for column in sqlalchemy.inspect(self.engine).get_columns(table_name)]
+                cached = self._columns[table_name] = (columns, time.monotonic())
+            return list(cached[0])
+
+    def invalidate_tables(self):
+        """Forget the cached list of tables and their columns, after tables were created or dropped by other means."""
+        with self._tables_lock:
+            self._tables = None
+            self._columns.clear()
+
+    def _update_cached_tables(self, created: str | None = None, dropped: str | None = None):
+        """Keep the cached list of tables up to date with a table this connector created or dropped."""
+        with self._tables_lock:
+            # A table written with if_exists="replace" may have new columns
+            self._columns.pop(created, None)
+            self._columns.pop(dropped, None)
+            if self._tables is None:
+                return
+            if created and created not in self._tables:
+                self._tables.append(created)
+            if dropped in self._tables:
+                self._tables.remove(dropped)
 
     def upload_to_db(
-        self, dataframe: pd.DataFrame, table_name: str, replace: bool = True
+        self,
+        dataframe: pd.DataFrame,
+        table_name: str,
+        replace: bool = True,
+        chunksize: int = 100_000,
+        key_columns: List[str] | None = None,
+        dtype: Dict[str, sqlalchemy.types.TypeEngine] | None = None,
     ):
         """Upload a DataFrame as a table to the database.
 
+        Postgres databases are loaded with `COPY FROM STDIN`, other databases use plain INSERTs.
+
         Args:
             dataframe (pd.DataFrame): The DataFrame to upload.
             table_name (str): The name of the table for the DataFrame data
             replace (bool, optional): Replace table if already exists. Defaults to True.
+            chunksize (int, optional): Number of rows written at a time. Defaults to 100000.
+            key_columns (List[str] | None, optional): Columns identifying a row. If given, the table is
+                loaded incrementally and `replace` is ignored, see `upsert_to_db`. Defaults to None.
+            dtype (Dict[str, sqlalchemy.types.TypeEngine] | None, optional): SQL types of columns when
+                the table is created. Defaults to types inferred by pandas.
+        """
+        self.upload_chunks_to_db([dataframe], table_name, replace, chunksize, key_columns, dtype)
+
+    def upload_chunks_to_db(
+        self,
+        chunks: Iterable[pd.DataFrame],
+        table_name: str,
+        replace: bool = True,
+        chunksize: int = 100_000,
+        key_columns: List[str] | None = None,
+        dtype: Dict[str, sqlalchemy.types.TypeEngine] | None = None,
+    ):
+        """Upload DataFrames that together represent one table to the database, one at a time.
+
+        Args:
+            chunks (Iterable[pd.DataFrame]): The DataFrames to upload, all with the same columns.
+            table_name (str): The name of the table for the DataFrame data
+            replace (bool, optional): Replace table if already exists. Defaults to True.
+            chunksize (int, optional): Number of rows written at a time. Defaults to 100000.
+            key_columns (List[str] | None, optional): Columns identifying a row. If given, the table is
+                loaded incrementally and `replace` is ignored, see `upsert_to_db`. Defaults to None.
+            dtype (Dict[str, sqlalchemy.types.TypeEngine] | None, optional): SQL types of columns when
+                the table is created. Defaults to types inferred by pandas.
+        """
+        if key_columns:
+            for dataframe in chunks:
+                self.upsert_to_db(dataframe, table_name, key_columns, chunksize, dtype)
+            return
+
+        if_exists = "replace" if replace else "fail"
+        for dataframe in chunks:
+            self._write_dataframe(dataframe, table_name, if_exists, chunksize, dtype)
+            self.changed_tables.add(table_name)
+            # Every chunk after the first adds to the table it created
+            if_exists = "append"
+
+    def upsert_to_db(
+        self,
+        dataframe: pd.DataFrame,
+        table_name: str,
+        key_columns: List[str],
+        chunksize: int = 100_000,
+        dtype: Dict[str, sqlalchemy.types.TypeEngine] | None = None,
+    ):
+        """Insert new rows and update changed rows of a table, leaving unchanged rows untouched.
+
+        The DataFrame is bulk loaded into a staging table, then merged into the target table with
+        `INSERT ... ON CONFLICT` on the key columns. Existing rows are only rewritten when a value differs,
+        so the table, its column types and its constraints are kept between runs.
+        Rows with a null key, or a key repeated later in the DataFrame, are skipped. A key column can be the
+        index of the DataFrame, which is loaded as a column named after it.
+
+        Rows are never deleted, so rows deleted at the source stay in the table until it is replaced.
+
+        Args:
+            dataframe (pd.DataFrame): The DataFrame to upload.
+            table_name (str): The name of the table for the DataFrame data
+            key_columns (List[str]): Columns that together uniquely identify a row.
+            chunksize (int, optional): Number of rows written at a time. Defaults to 100000.
+            dtype (Dict[str, sqlalchemy.types.TypeEngine] | None, optional): SQL types of columns when
+                the table is created. Defaults to types inferred by pandas.
+
+        Raises:
+            ValueError: If the database is not Postgres.
         """
+        if self.engine.dialect.name != "postgresql":
+            raise ValueError("Incremental loads are only supported for Postgres databases.")
+
+        keys = pd.DataFrame({
+            column: dataframe.index.to_numpy() if column == dataframe.index.name else dataframe[column].to_numpy()
+            for column in key_columns
+        })
+        dataframe = dataframe[(keys.notna().all(axis=1) & ~keys.duplicated(keep="last")).to_numpy()]
+
+        if not self.has_table(table_name):
+            # First load, so there is nothing to merge with
+            self._write_dataframe(dataframe, table_name, "fail", chunksize, dtype)
+            with self.engine.begin() as connection:
+                connection.execute(sqlalchemy.text(self._unique_key_sql(table_name, key_columns)))
+            self.changed_tables.add(table_name)
+            return
+
+        staging_table = f"_staging_{table_name}"
+        self._write_dataframe(dataframe, staging_table, "replace", chunksize, dtype)
+
+        with self.engine.begin() as connection:
+            # Cast staging values to the target types, which may have been changed by the db_schema scripts
+            column_types = dict(connection.execute(
+                sqlalchemy.text(
+                    "SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+                    "WHERE attrelid = CAST(:table_name AS regclass) AND attnum > 0 AND NOT attisdropped"
+                ),
+                {"table_name": f'"{table_name}"'},
+            ).all())
+            # Named the same way as pandas names the index column, which avoids a column called "index"
+            index_label = dataframe.index.name or ("level_0" if "index" in dataframe.columns else "index")
+            columns = [column for column in [index_label, *dataframe.columns] if column in column_types]
+            # The index is positional, so a row moving in the source is not a change
+            compared_columns = [
+                column for column in columns if column not in key_columns and column not in ("index", index_label)
+            ]
+
+            insert_columns = ", ".join(f'"{column}"' for column in columns)
+            select_columns = ", ".join(f'CAST("{column}" AS {column_types[column]})' for column in columns)
+            conflict_columns = ", ".join(f'"{column}"' for column in key_columns)
+            update_sql = "DO NOTHING"
+            if compared_columns:
+                assignments = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in compared_columns)
+                current_values = ", ".join(f'"{table_name}"."{column}"' for column in compared_columns)
+                new_values = ", ".join(f'EXCLUDED."{column}"' for column in compared_columns)
+                update_sql = (
+                    f"DO UPDATE SET {assignments} "
+                    f"WHERE ROW({current_values}) IS DISTINCT FROM ROW({new_values})"
+                )
+
+            connection.execute(sqlalchemy.text(self._unique_key_sql(table_name, key_columns)))
+            merged = connection.execute(sqlalchemy.text(
+                f'INSERT INTO "{table_name}" ({insert_columns}) '
+                f'SELECT {select_columns} FROM "{staging_table}" '
+                f"ON CONFLICT ({conflict_columns}) {update_sql}"
+            ))
+            connection.execute(sqlalchemy.text(f'DROP TABLE "{staging_table}"'))
+        self._update_cached_tables(dropped=staging_table)
+        # Only inserted and updated rows are counted, unchanged rows are skipped by the WHERE clause
+        if merged.rowcount > 0:
+            self.changed_tables.add(table_name)
+
+    @staticmethod
+    def _unique_key_sql(table_name: str, key_columns: List[str]) -> str:
+        """Return SQL creating the unique index that `INSERT ... ON CONFLICT` needs on the key columns."""
+        columns = ", ".join(f'"{column}"' for column in key_columns)
+        return f'CREATE UNIQUE INDEX IF NOT EXISTS "{table_name}_upsert_key" ON "{table_name}" ({columns})'
+
+    def _write_dataframe(
+        self,
+        dataframe: pd.DataFrame,
+        table_name: str,
+        if_exists: str,
+        chunksize: int,
+        dtype: Dict[str, sqlalchemy.types.TypeEngine] | None = None,
+    ):
+        """Write a DataFrame to a table, using COPY for Postgres databases."""
+        method = None
+        if self.engine.dialect.name == "postgresql":
+            method = partial(copy_insert, on_transfer=self.on_transfer)
         dataframe.to_sql(
-            table_name, self.engine, if_exists="replace" if replace else "fail"
+            table_name,
+            self.engine,
+            if_exists=if_exists,
+            chunksize=chunksize,
+            method=method,
+            dtype=dtype,
         )
-
+        self._update_cached_tables(created=table_name)
 
 if __name__ == "__main__":
     instance = DatabaseConnector()
@@ -0,0 +1,9 @@
+-- Q: Which locations currently have the most stores?
+-- dim_store_details is small, so it is queried directly
+
+SELECT
+	locality,
+	COUNT(locality) as total_no_stores
+FROM dim_store_details
+GROUP BY locality
+ORDER BY total_no_stores DESC;
@@ -0,0 +1,9 @@
+-- Q: Which months produced the largest amount of sales?
+
+SELECT
+	"month",
+	ROUND(SUM(total_sales), 2) AS total_sales
+FROM public.mv_sales_fact
+WHERE has_date AND has_product
+GROUP BY "month"
+ORDER BY total_sales DESC;
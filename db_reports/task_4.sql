@@ -0,0 +1,11 @@
+-- Q: How many sales are coming from online?
+
+SELECT
+	CAST(SUM(number_of_sales) AS BIGINT) AS number_of_sales,
+	CAST(SUM(product_quantity) AS BIGINT) AS product_quantity_count,
+	CASE
+		WHEN is_web THEN 'Web'
+		ELSE 'Offline'
+	END AS "location"
+FROM public.mv_sales_fact
+GROUP BY "location";
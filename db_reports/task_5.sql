@@ -0,0 +1,16 @@
+-- Q: What percentage of sales come through each type of store?
+-- Sales are already multiplied by quantity in the fact view, so only the store types are summed
+WITH total_sales_by_store_cte AS (
+    SELECT
+        store_type,
+        ROUND(SUM(total_sales), 2) AS total_sales
+    FROM public.mv_sales_fact
+    WHERE has_store AND has_product
+    GROUP BY store_type
+)
+SELECT
+    store_type,
+    total_sales,
+    ROUND(total_sales * 100.0 / (SELECT SUM(total_sales) FROM total_sales_by_store_cte), 2) AS percentage_total
+FROM total_sales_by_store_cte
+ORDER BY percentage_total DESC;
@@ -0,0 +1,9 @@
+-- Q: Which month in each year produced the highest cost of sales?
+SELECT
+	ROUND(SUM(total_sales), 2) AS total_sales,
+	"year",
+	"month"
+FROM public.mv_sales_fact
+WHERE has_date AND has_product
+GROUP BY "year", "month"
+ORDER BY total_sales DESC;
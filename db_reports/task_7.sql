@@ -0,0 +1,8 @@
+-- Q: What is our staff headcount?
+-- dim_store_details is small, so it is queried directly
+SELECT
+	SUM(staff_numbers) AS total_staff_numbers,
+	country_code
+FROM public.dim_store_details
+GROUP BY country_code
+ORDER BY total_staff_numbers DESC;
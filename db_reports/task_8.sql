@@ -0,0 +1,9 @@
+-- Q: Which German store type is selling the most?
+SELECT
+	ROUND(SUM(total_sales), 2) AS total_sales,
+	store_type,
+	country_code
+FROM public.mv_sales_fact
+WHERE has_store AND has_product AND country_code = 'DE'
+GROUP BY store_type, country_code
+ORDER BY total_sales;
@@ -0,0 +1,7 @@
+-- Q: How quickly is the company making sales?
+-- The gaps between sales are summed per year in the view, AVG is their sum divided by their count
+SELECT
+	"year",
+	total_time_taken / sales_intervals AS actual_time_taken
+FROM public.mv_sale_intervals
+ORDER BY actual_time_taken DESC;
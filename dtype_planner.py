@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from typing import Dict, Tuple
+
+
+class DtypePlanner:
+    """Class for choosing the most memory-compact safe dtype, and matching SQL type, for each column of a DataFrame."""
+
+    def __init__(self, max_categories: int = 256, category_ratio: float = 0.5, uuid_regex: str | None = None):
+        """Create a dtype planner.
+
+        Args:
+            max_categories (int, optional): String columns with at most this many unique values can be
+                stored as categoricals. Defaults to 256.
+            category_ratio (float, optional): String columns must also have fewer unique values than this
+                fraction of their rows to be stored as categoricals. Defaults to 0.5.
+            uuid_regex (str | None, optional): Pattern for UUID strings, which are given the SQL UUID type.
+                Defaults to any hyphenated 32 digit hexadecimal UUID.
+        """
+        self._max_categories = max_categories
+        self._category_ratio = category_ratio
+        self._uuid_regex = uuid_regex or r'^[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12}$'
+
+    def _plan_strings(self, values: pd.Series) -> Tuple[str, sqlalchemy.types.TypeEngine]:
+        """Plan a column of strings."""
+        non_null = values.dropna().astype(str)
+        if non_null.empty:
+            return "string[pyarrow]", sqlalchemy.Text()
+
+        if non_null.str.match(self._uuid_regex).all():
+            return "string[pyarrow]", sqlalchemy.Uuid(as_uuid=False)
+
+        unique_count = non_null.nunique()
+        is_category = unique_count <= self._max_categories and unique_count < self._category_ratio * len(non_null)
+        # The widest value seen so far says nothing about later loads, and Postgres silently truncates
+        # values cast to a narrower VARCHAR when loading incrementally, so columns get room to grow.
+        # Columns with a known width have it declared in table_schema.TABLE_SCHEMAS instead.
+        if non_null.str.len().max() <= 255:
+            sql_type = sqlalchemy.String(255)
+        else:
+            sql_type = sqlalchemy.Text()
+
+        return ("category" if is_category else "string[pyarrow]"), sql_type
+
+    @staticmethod
+    def _plan_integers(values: pd.Series) -> Tuple[str, sqlalchemy.types.TypeEngine]:
+        """Plan a column of integers, using the smallest type that holds every value."""
+        nullable = isinstance(values.dtype, pd.api.extensions.ExtensionDtype) or values.hasnans
+        minimum, maximum = values.min(), values.max()
+        if pd.isna(minimum):
+            minimum = maximum = 0
+
+        for dtype, sql_type in ((np.int16, sqlalchemy.SmallInteger()), (np.int32, sqlalchemy.Integer())):
+            limits = np.iinfo(dtype)
+            if limits.min <= minimum and maximum <= limits.max:
+                name = np.dtype(dtype).name
+                return (name.capitalize() if nullable else name), sql_type
+        return ("Int64" if nullable else "int64"), sqlalchemy.BigInteger()
+
+    @staticmethod
+    def _plan_floats(values: pd.Series) -> Tuple[str, sqlalchemy.types.TypeEngine]:
+        """Plan a column of floats, only using float32 when no value loses precision."""
+        as_float32 = values.astype("float32").astype(values.dtype)
+        lossless = ((as_float32 == values) | values.isna()).all()
+        return ("float32" if lossless else str(values.dtype)), sqlalchemy.Float()
+
+    @staticmethod
+    def _plan_datetimes(values: pd.Series) -> Tuple[str, sqlalchemy.types.TypeEngine]:
+        """Plan a column of datetimes, using the SQL DATE type when every value is at midnight."""
+        non_null = values.dropna()
+        if (non_null == non_null.dt.normalize()).all():
+            return str(values.dtype), sqlalchemy.Date()
+        return str(values.dtype), sqlalchemy.DateTime()
+
+    def plan(self, dataframe: pd.DataFrame) -> Dict[str, Tuple[str, sqlalchemy.types.TypeEngine]]:
+        """Choose the pandas dtype and SQL type for each column of a DataFrame.
+
+        Args:
+            dataframe (pd.DataFrame): Cleaned DataFrame to plan.
+
+        Returns:
+            Dict[str, Tuple[str, sqlalchemy.types.TypeEngine]]: Pandas dtype and SQL type for each column.
+        """
+        plan = {}
+        for column in dataframe.columns:
+            values = dataframe[column]
+            if pd.api.types.is_bool_dtype(values):
+                plan[column] = (str(values.dtype), sqlalchemy.Boolean())
+            elif pd.api.types.is_integer_dtype(values):
+                plan[column] = self._plan_integers(values)
+            elif pd.api.types.is_float_dtype(values):
+                plan[column] = self._plan_floats(values)
+            elif pd.api.types.is_datetime64_any_dtype(values):
+                plan[column] = self._plan_datetimes(values)
+            elif pd.api.types.is_string_dtype(values) or isinstance(values.dtype, pd.CategoricalDtype):
+                plan[column] = self._plan_strings(values)
+        return plan
+
+    def compact(
+        self, dataframe: pd.DataFrame
+    ) -> Tuple[pd.DataFrame, Dict[str, sqlalchemy.types.TypeEngine], Tuple[int, int]]:
+        """Convert a DataFrame to its planned dtypes.
+
+        Args:
+            dataframe (pd.DataFrame): Cleaned DataFrame to convert.
+
+        Returns:
+            Tuple[pd.DataFrame, Dict[str, sqlalchemy.types.TypeEngine], Tuple[int, int]]: The converted
+                DataFrame, the SQL type of each column, and the memory used in bytes before and after.
+        """
+        plan = self.plan(dataframe)
+        memory_before = int(dataframe.memory_usage(deep=True).sum())
+        compacted = dataframe.astype({column: dtype for column, (dtype, _) in plan.items()})
+        memory_after = int(compacted.memory_usage(deep=True).sum())
+        sql_types = {column: sql_type for column, (_, sql_type) in plan.items()}
+        return compacted, sql_types, (memory_before, memory_after)
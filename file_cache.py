@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import tempfile
+
+
+class FileCache:
+    """Class for caching downloaded files on disk, addressed by the hash of their content.
+
+    Metadata such as the ETag is stored per source (for example a URL), and points to the
+    content file that was last downloaded from it.
+    """
+
+    def __init__(self, cache_dir: str = ".cache"):
+        self._cache_dir = cache_dir
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        """Return the SHA-256 hex digest of some data."""
+        return hashlib.sha256(data).hexdigest()
+
+    def _namespace_dir(self, namespace: str) -> str:
+        directory = os.path.join(self._cache_dir, namespace)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _metadata_path(self, namespace: str, source: str) -> str:
+        return os.path.join(self._namespace_dir(namespace), self.hash_bytes(source.encode()) + ".meta.json")
+
+    def content_path(self, namespace: str, content_hash: str, suffix: str) -> str:
+        """Return the path of a cached file.
+
+        Args:
+            namespace (str): Sub-directory of the cache, such as 'pdf'.
+            content_hash (str): Hash of the content of the file.
+            suffix (str): File extension, such as '.pdf'.
+
+        Returns:
+            str: Path to the file, which may not exist yet.
+        """
+        return os.path.join(self._namespace_dir(namespace), content_hash + suffix)
+
+    def get_metadata(self, namespace: str, source: str) -> dict | None:
+        """Return the metadata stored for a source, or None if it has not been cached.
+
+        Metadata pointing to a content file that no longer exists is treated as not cached.
+        """
+        try:
+            with open(self._metadata_path(namespace, source), "r") as metadata_file:
+                metadata = json.load(metadata_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if not os.path.exists(self.content_path(namespace, metadata["content_hash"], metadata["suffix"])):
+            return None
+        return metadata
+
+    def store(self, namespace: str, source: str, data: bytes, suffix: str, **metadata) -> str:
+        """Store downloaded data and its metadata in the cache.
+
+        Args:
+            namespace (str): Sub-directory of the cache, such as 'pdf'.
+            source (str): Where the data came from, such as its URL.
+            data (bytes): Content to store.
+            suffix (str): File extension, such as '.pdf'.
+            **metadata: Additional metadata to store, such as the ETag.
+
+        Returns:
+            str: Path to the cached content file.
+        """
+        content_hash = self.hash_bytes(data)
+        path = self.content_path(namespace, content_hash, suffix)
+        if not os.path.exists(path):
+            self._atomic_write(path, data)
+
+        metadata.update(content_hash=content_hash, suffix=suffix)
+        self._atomic_write(self._metadata_path(namespace, source), json.dumps(metadata).encode())
+        return path
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        """Write data to a file so that readers never see it partially written."""
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(file_descriptor, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class CachedResponse:
+    """Body of a cached response, with the validators to revalidate it.
+
+    Attributes:
+        body (bytes): Body of the response.
+        etag (str | None): ETag header of the response.
+        last_modified (str | None): Last-Modified header of the response.
+        stored_at (float): Time the response was last fetched or revalidated, as `time.time()`.
+    """
+
+    body: bytes
+    etag: str | None
+    last_modified: str | None
+    stored_at: float
+
+
+class HttpCache:
+    """Class for caching API responses in a SQLite database, keyed by URL.
+
+    Responses younger than `ttl_seconds` are used without asking the API. Older responses are
+    revalidated with a conditional request (see `conditional_headers`), which the API answers with
+    304 Not Modified and no body if the response has not changed. When the bodies take more than
+    `max_bytes`, the least recently used responses are evicted.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 86_400, max_bytes: int = 64 * 1024 * 1024):
+        """Open a cache, creating it if needed.
+
+        Args:
+            path (str): Path of the SQLite database.
+            ttl_seconds (float, optional): Seconds a response is used without revalidating it. Defaults to a day.
+            max_bytes (int, optional): Most bytes of response bodies kept. Defaults to 64 MiB.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Requests are made from several threads, which share the connection under the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "url TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT, last_modified TEXT, "
+                "stored_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self._size = self._connection.execute("SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses").fetchone()[0]
+
+    def get(self, url: str) -> CachedResponse | None:
+        """Return the cached response for a URL, or None if it is not cached.
+
+        Args:
+            url (str): URL of the request.
+
+        Returns:
+            CachedResponse | None: Cached response, which may need revalidating, see `is_fresh`.
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT body, etag, last_modified, stored_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE responses SET used_at = ? WHERE url = ?", (time.time(), url))
+        return CachedResponse(*row)
+
+    def is_fresh(self, response: CachedResponse) -> bool:
+        """Return whether a cached response can be used without revalidating it."""
+        return time.time() - response.stored_at < self.ttl_seconds
+
+    @staticmethod
+    def conditional_headers(response: CachedResponse) -> dict:
+        """Return the headers asking the API to answer 304 Not Modified if a cached response has not changed.
+
+        Args:
+            response (CachedResponse): Cached response.
+
+        Returns:
+            dict: If-None-Match and If-Modified-Since headers, for the validators the response has.
+        """
+        headers = {}
+        if response.etag:
+            headers["If-None-Match"] = response.etag
+        if response.last_modified:
+            headers["If-Modified-Since"] = response.last_modified
+        return headers
+
+    def revalidated(self, url: str):
+        """Mark the cached response for a URL as current, after the API answered 304 Not Modified.
+
+        Args:
+            url (str): URL of the request.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE responses SET stored_at = ? WHERE url = ?", (time.time(), url))
+
+    def store(self, url: str, body: bytes, etag: str | None = None, last_modified: str | None = None):
+        """Cache the response for a URL, evicting the least recently used responses if the cache is full.
+
+        Args:
+            url (str): URL of the request.
+            body (bytes): Body of the response.
+            etag (str | None, optional): ETag header of the response. Defaults to None.
+            last_modified (str | None, optional): Last-Modified header of the response. Defaults to None.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            previous = self._connection.execute("SELECT LENGTH(body) FROM responses WHERE url = ?", (url,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (url, body, etag, last_modified, stored_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, now, now),
+            )
+            self._size += len(body) - (previous[0] if previous else 0)
+            self._evict()
+
+    def _evict(self):
+        """Delete the least recently used responses until the bodies fit in `max_bytes`. Must be called with the lock held."""
+        while self._size > self.max_bytes:
+            rows = self._connection.execute(
+                "SELECT url, LENGTH(body) FROM responses ORDER BY used_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                self._connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self._size -= size
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
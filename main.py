@@ -1,114 +1,425 @@
-import time
+import asyncio
+import threading
+from concurrent.futures import Future
 from functools import wraps
-from typing import Callable
+from typing import Callable, Dict, Iterable, Iterator
 
+import pandas as pd
+
+from async_extraction import AsyncDataExtractor
 from database_utils import DatabaseConnector
 from data_extraction import DataExtractor
 from data_cleaning import DataCleaning
+from data_staging import DataStaging
+from dtype_planner import DtypePlanner
+from partitioned_cleaning import PartitionedCleaner
+from pipeline_metrics import PipelineMetrics
+from report_runner import ReportRunner
+from stage_scheduler import StageScheduler
+from table_schema import SchemaManager
 
-def notify_time(func_name: str):
-    """Outputs when the function starts, and the duration it took for it to complete
+def record_stage(stage_name: str):
+    """Records metrics for a DataApplication method as a pipeline stage, outputting when it starts and its duration
 
     Args:
-        func_name (str): Friendly name of the function.
+        stage_name (str): Name of the stage.
     """
     def decorator(function: Callable):
         @wraps(function)
-        def wrapper(*args, **kwargs):
-            print(f"{func_name}: started.")
-            start_time = time.time()
-            return_val = function(*args, **kwargs)
-            end_time = time.time()
-            execution_time = end_time - start_time
-            print(f"{func_name} finished in {execution_time} seconds.")
-            return return_val
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.stage(stage_name):
+                return function(self, *args, **kwargs)
         return wrapper
     return decorator
 
 class DataApplication:
     """Class for handling order of data processing. Use `run()` method to execute correct order."""
 
-    def __init__(self, remote_credentials: str = "db_creds.yaml", local_credentials: str = "local_db_creds.yaml"):
+    # Columns that identify a row in each table, used for incremental loads. Order lines can repeat every
+    # other value, so they are identified by their index in the source table
+    TABLE_KEYS = {
+        "dim_users": ["user_uuid"],
+        "dim_card_details": ["card_number"],
+        "dim_store_details": ["store_code"],
+        "dim_products": ["product_code"],
+        "dim_date_times": ["date_uuid"],
+        "orders_table": ["index"],
+    }
+    # Stages whose source is extracted as chunks
+    CHUNKED_STAGES = {"orders_table"}
+
+    def __init__(
+        self,
+        remote_credentials: str = "db_creds.yaml",
+        local_credentials: str = "local_db_creds.yaml",
+        max_workers: int | None = None,
+        chunksize: int = 100_000,
+        incremental: bool = False,
+        staging_dir: str = "staging",
+        resume: bool = False,
+        profile: str | None = None,
+        metrics_dir: str = "metrics",
+        clean_workers: int | None = None,
+        keep_runs: int | None = 3,
+    ):
+        self.metrics = PipelineMetrics(profile=profile, output_dir=metrics_dir)
         #Create connector for AWS database and our local database
         self.rds_connector = DatabaseConnector(credential_path=remote_credentials)
-        self.local_connector = DatabaseConnector(credential_path=local_credentials)
+        self.local_connector = DatabaseConnector(
+            credential_path=local_credentials, on_transfer=self.metrics.add_transferred
+        )
+
+        self.extractor = DataExtractor(self.rds_connector, on_transfer=self.metrics.add_transferred)
+        self.cleaner = DataCleaning(on_drop=self.metrics.add_dropped)
+        # The largest tables can be cleaned on several cores
+        self.partitioned_cleaner = PartitionedCleaner(self.cleaner, clean_workers) if clean_workers else None
+        self.planner = DtypePlanner()
+        self.max_workers = max_workers
+        self.chunksize = chunksize
+        self.incremental = incremental
+        # Raw and cleaned data of every stage is kept, so a failed run can be resumed without extracting again
+        self.staging = DataStaging(staging_dir, resume=resume, on_transfer=self.metrics.add_transferred)
+        # Staged runs kept once a run succeeds, or None to keep every run
+        self.keep_runs = keep_runs
+        self.schema = SchemaManager(self.local_connector)
+        self.reports = ReportRunner(self.local_connector)
+        # Whether the foreign keys and report views still have to be dropped before a table is replaced
+        self._replace_pending = False
+        self._replace_lock = threading.Lock()
+        self.async_extractor = AsyncDataExtractor(self.extractor)
+        # Data of each stage already being extracted by `run_async`
+        self._prefetched = {}
 
-        self.extractor = DataExtractor(self.rds_connector)
-        self.cleaner = DataCleaning()
+        # Function extracting the raw data of each stage
+        self.sources: Dict[str, Callable] = {
+            # Only fetch the columns and rows the cleaner keeps
+            "dim_users": lambda: self.extractor.read_rds_table("legacy_users", **self.cleaner.user_plan.pushdown()),
+            "dim_card_details": lambda: self.extractor.retrieve_pdf_data(self.read_url_from_file("pdf_url.txt")),
+            "dim_store_details": lambda: self.extractor.retrieve_stores_data(),
+            "dim_products": lambda: self.extractor.extract_from_s3(self.read_url_from_file("product_bucket_url.txt")),
+            "dim_date_times": lambda: self.extractor.extract_from_s3(
+                self.read_url_from_file("date_bucket_url.txt"), data_type="json"
+            ),
+            "orders_table": lambda: self.extractor.read_rds_table_chunks(
+                "orders_table", chunksize=self.chunksize, **self.cleaner.orders_plan.pushdown()
+            ),
+        }
 
     def read_url_from_file(self, path: str) -> str:
         with open(path, "r") as url_file:
             url = url_file.readline().strip()
         return url
 
-    @notify_time("User Details")
+    def load_keys(self, table_name: str) -> list[str] | None:
+        """Return the key columns to upsert a table on, or None to replace the table."""
+        return self.TABLE_KEYS[table_name] if self.incremental else None
+
+    def prepare_replace(self):
+        """Drop the foreign keys and report views before the first table of the run is replaced.
+
+        Postgres cannot replace a table other objects depend on. They are only dropped once a table is
+        ready to be uploaded, so a run failing while extracting or cleaning leaves the database untouched.
+        """
+        with self._replace_lock:
+            if not self._replace_pending:
+                return
+            self.reports.drop_views()
+            self.schema.drop_foreign_keys()
+            self._replace_pending = False
+
+    def partitioned(self, method: str) -> Callable[[pd.DataFrame], pd.DataFrame]:
+        """Return a DataCleaning method, run across worker processes if `clean_workers` was set.
+
+        Args:
+            method (str): Name of the DataCleaning method, such as 'clean_user_data'.
+
+        Returns:
+            Callable[[pd.DataFrame], pd.DataFrame]: Function cleaning a DataFrame.
+        """
+        if self.partitioned_cleaner is None:
+            return getattr(self.cleaner, method)
+        return lambda dataframe: self.partitioned_cleaner.clean(method, dataframe)
+
+    def prefetched(self, stage: str, extract: Callable):
+        """Return the raw data of a stage, waiting for `run_async` to extract it if it is extracting it.
+
+        Args:
+            stage (str): Name of the stage.
+            extract (Callable): Function returning the raw data otherwise.
+
+        Returns:
+            The raw data, a DataFrame or an iterator over chunks.
+        """
+        prefetched = self._prefetched.pop(stage, None)
+        if prefetched is None:
+            return extract()
+        if isinstance(prefetched, Future):
+            return prefetched.result()
+        return prefetched
+
+    def extract_and_clean(self, stage: str, extract: Callable[[], pd.DataFrame], clean: Callable) -> pd.DataFrame:
+        """Return the cleaned data for a stage, resuming from its staged raw or cleaned data when possible.
+
+        Args:
+            stage (str): Name of the stage.
+            extract (Callable[[], pd.DataFrame]): Function returning the raw data.
+            clean (Callable): Cleaning method for the raw data.
+
+        Returns:
+            pd.DataFrame: Cleaned data.
+        """
+        def timed_extract() -> pd.DataFrame:
+            with self.metrics.phase("extract"):
+                return self.prefetched(stage, extract)
+
+        def timed_clean() -> pd.DataFrame:
+            raw = self.staging.cached(stage, "raw", timed_extract)
+            self.metrics.add_rows("in", raw)
+            with self.metrics.phase("clean"):
+                return clean(raw)
+
+        cleaned = self.staging.cached(stage, "cleaned", timed_clean)
+        self.metrics.add_rows("out", cleaned)
+        return cleaned
+
+    def extract_and_clean_chunks(
+        self, stage: str, extract: Callable[[], Iterable[pd.DataFrame]], clean: Callable
+    ) -> Iterator[pd.DataFrame]:
+        """Chunked version of `extract_and_clean`, for tables too large to hold in memory."""
+        def timed_clean() -> Iterator[pd.DataFrame]:
+            raw_chunks = self.staging.cached_chunks(
+                stage, "raw", lambda: self.metrics.timed_chunks("extract", self.prefetched(stage, extract))
+            )
+            for chunk in raw_chunks:
+                self.metrics.add_rows("in", chunk)
+                with self.metrics.phase("clean"):
+                    cleaned_chunk = clean(chunk)
+                yield cleaned_chunk
+
+        for cleaned_chunk in self.staging.cached_chunks(stage, "cleaned", timed_clean):
+            self.metrics.add_rows("out", cleaned_chunk)
+            yield cleaned_chunk
+
+    def compact(self, table_name: str, dataframe: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+        """Put cleaned data in the columns of its table, convert it to its most compact dtypes, and output
+        how much memory it saved.
+
+        Args:
+            table_name (str): Name of the table the data is for.
+            dataframe (pd.DataFrame): Cleaned data.
+
+        Returns:
+            tuple[pd.DataFrame, dict]: Compacted data, and the SQL type of each column to upload it with.
+        """
+        with self.metrics.phase("compact"):
+            prepared = self.schema.prepare(table_name, dataframe)
+            compacted, sql_types, (memory_before, memory_after) = self.planner.compact(prepared)
+        print(f"{table_name}: memory reduced from {memory_before} to {memory_after} bytes.")
+        return compacted, self.schema.sql_types(table_name, sql_types)
+
+    def compact_chunks(self, table_name: str, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """Chunked version of `compact`.
+
+        SQL types are not returned, since the first chunk does not show the range of values in later chunks.
+        The table schema sets the types instead.
+        """
+        total_before = total_after = 0
+        for chunk in chunks:
+            with self.metrics.phase("compact"):
+                prepared = self.schema.prepare(table_name, chunk)
+                compacted, _, (memory_before, memory_after) = self.planner.compact(prepared)
+            total_before += memory_before
+            total_after += memory_after
+            yield compacted
+        print(f"{table_name}: memory reduced from {total_before} to {total_after} bytes.")
+
+    @record_stage("dim_users")
     def clean_legacy_users(self):
         """Run extract and clean methods for user details data."""
         # Clean up legacy_users and upload to our local database as dim_users
-        user_df = self.extractor.read_rds_table("legacy_users")
-        cleaned_user_df = self.cleaner.clean_user_data(user_df)
-        self.local_connector.upload_to_db(cleaned_user_df, "dim_users")
+        cleaned_user_df = self.extract_and_clean(
+            "dim_users", self.sources["dim_users"], self.partitioned("clean_user_data")
+        )
+        cleaned_user_df, sql_types = self.compact("dim_users", cleaned_user_df)
+        with self.metrics.phase("upload"):
+            self.prepare_replace()
+            self.local_connector.upload_to_db(
+                cleaned_user_df, "dim_users", key_columns=self.load_keys("dim_users"), dtype=sql_types
+            )
 
-    @notify_time("Card Details")
+    @record_stage("dim_card_details")
     def clean_card_details(self):
         """Run extract and clean methods for card details data."""
-        # Get PDF url from file
-        url = self.read_url_from_file("pdf_url.txt")
-
         # Clean up card details PDF document and upload to our local database as dim_card_details
-        card_details = self.extractor.retrieve_pdf_data(url)
-        cleaned_card_details = self.cleaner.clean_card_data(card_details)
-        self.local_connector.upload_to_db(cleaned_card_details, "dim_card_details")
+        cleaned_card_details = self.extract_and_clean(
+            "dim_card_details", self.sources["dim_card_details"], self.cleaner.clean_card_data
+        )
+        cleaned_card_details, sql_types = self.compact("dim_card_details", cleaned_card_details)
+        with self.metrics.phase("upload"):
+            self.prepare_replace()
+            self.local_connector.upload_to_db(
+                cleaned_card_details, "dim_card_details", key_columns=self.load_keys("dim_card_details"), dtype=sql_types
+            )
 
-    @notify_time("Store Details")
+    @record_stage("dim_store_details")
     def clean_store_details(self):
         """Run extract and clean methods for store details data."""
         # Clean up store data and upload to our local database as dim_store_details
-        store_details = self.extractor.retrieve_stores_data()
-        cleaned_store_details = self.cleaner.clean_store_data(store_details)
-        self.local_connector.upload_to_db(cleaned_store_details, "dim_store_details")
+        cleaned_store_details = self.extract_and_clean(
+            "dim_store_details", self.sources["dim_store_details"], self.cleaner.clean_store_data
+        )
+        cleaned_store_details, sql_types = self.compact("dim_store_details", cleaned_store_details)
+        with self.metrics.phase("upload"):
+            self.prepare_replace()
+            self.local_connector.upload_to_db(
+                cleaned_store_details, "dim_store_details", key_columns=self.load_keys("dim_store_details"), dtype=sql_types
+            )
 
 
-    @notify_time("Product Details")
+    @record_stage("dim_products")
     def clean_product_details(self):
         """Run extract and clean methods for product details data."""
-        # Get S3 Bucket URL for CSV file
-        url = self.read_url_from_file("product_bucket_url.txt")
-
         # Clean up product data and upload to our local database as dim_products
-        product_details = self.extractor.extract_from_s3(url)
-        cleaned_product_details = self.cleaner.clean_products_data(product_details)
-        self.local_connector.upload_to_db(cleaned_product_details, "dim_products")
+        cleaned_product_details = self.extract_and_clean(
+            "dim_products", self.sources["dim_products"], self.cleaner.clean_products_data
+        )
+        cleaned_product_details, sql_types = self.compact("dim_products", cleaned_product_details)
+        with self.metrics.phase("upload"):
+            self.prepare_replace()
+            self.local_connector.upload_to_db(
+                cleaned_product_details, "dim_products", key_columns=self.load_keys("dim_products"), dtype=sql_types
+            )
 
-    @notify_time("Order Details")
+    @record_stage("orders_table")
     def clean_order_details(self):
         """Run extract and clean methods for order details data."""
         # Clean up order data and upload to our local database as orders_table
-        orders_details = self.extractor.read_rds_table("orders_table")
-        cleaned_order_details = self.cleaner.clean_orders_data(orders_details)
-        self.local_connector.upload_to_db(cleaned_order_details, "orders_table")
+        # The orders table is large, so stream it through in chunks to keep memory bounded
+        cleaned_order_chunks = self.extract_and_clean_chunks(
+            "orders_table", self.sources["orders_table"], self.partitioned("clean_orders_data")
+        )
+        cleaned_order_chunks = self.compact_chunks("orders_table", cleaned_order_chunks)
+        with self.metrics.phase("upload"):
+            self.prepare_replace()
+            self.local_connector.upload_chunks_to_db(
+                cleaned_order_chunks,
+                "orders_table",
+                key_columns=self.load_keys("orders_table"),
+                dtype=self.schema.sql_types("orders_table"),
+            )
 
 
-    @notify_time("Date Details")
+    @record_stage("dim_date_times")
     def clean_date_details(self):
         """Run extract and clean methods for date details data."""
-        # Get date details JSON URL from file
-        url = self.read_url_from_file("date_bucket_url.txt")
-
         # Clean up date details and upload to our local database as dim_date_times
-        date_details = self.extractor.extract_from_s3(url, data_type="json")
-        cleaned_date_details = self.cleaner.clean_date_details_data(date_details)
-        self.local_connector.upload_to_db(cleaned_date_details, "dim_date_times")
+        cleaned_date_details = self.extract_and_clean(
+            "dim_date_times", self.sources["dim_date_times"], self.cleaner.clean_date_details_data
+        )
+        cleaned_date_details, sql_types = self.compact("dim_date_times", cleaned_date_details)
+        with self.metrics.phase("upload"):
+            self.prepare_replace()
+            self.local_connector.upload_to_db(
+                cleaned_date_details, "dim_date_times", key_columns=self.load_keys("dim_date_times"), dtype=sql_types
+            )
 
-    @notify_time("Application")
     def run(self):
-        """Run each extraction and clean methods"""
-        self.clean_legacy_users()
-        self.clean_card_details()
-        self.clean_store_details()
-        self.clean_product_details()
-        self.clean_order_details()
-        self.clean_date_details()
+        """Run each extraction and clean methods.
+
+        The dimension tables share nothing, so they are run in parallel.
+        The orders table references every dimension table, so it waits for them to finish.
+
+        Metrics for each stage are written to the metrics directory as JSON and in the Prometheus textfile format.
+
+        On Postgres, tables are loaded straight into their final schema. Before the first table is replaced,
+        the foreign keys and the report views are dropped, see `prepare_replace`. Once every table is
+        loaded, the missing keys are added, and the missing report views are built again. When loading
+        incrementally, nothing is dropped, and only the report views built from changed tables are refreshed.
+
+        Once the run succeeds, only the latest `keep_runs` staged runs are kept.
+        """
+        is_postgres = self.local_connector.engine.dialect.name == "postgresql"
+        self._replace_pending = is_postgres and not self.incremental
+
+        # Stages are profiled individually, so the whole pipeline is not
+        with self.metrics.stage("pipeline", profile=False):
+            try:
+                self.run_stages()
+            finally:
+                if self.partitioned_cleaner is not None:
+                    self.partitioned_cleaner.close()
+
+        if is_postgres:
+            with self.metrics.stage("keys", profile=False):
+                added = self.schema.add_keys()
+            print(f"Keys added: {', '.join(added) or 'none'}.")
+            with self.metrics.stage("reports", profile=False):
+                refreshed = self.reports.refresh_views(self.local_connector.changed_tables)
+            print(f"Report views refreshed: {', '.join(refreshed) or 'none'}.")
+
+        for source, totals in self.async_extractor.sources.items():
+            self.metrics.add_source(source, totals["rows"], totals["bytes"], totals["seconds"])
+        self.metrics.write_json()
+        self.metrics.write_prometheus()
+
+        # Only a failed run needs its staged data to resume, so older runs can go once this one succeeded
+        if self.keep_runs is not None:
+            removed = self.staging.prune(self.keep_runs)
+            if removed:
+                print(f"Staged runs removed: {', '.join(removed)}.")
+
+    async def run_async(self):
+        """Async version of `run`, extracting from every source at once in one event loop.
+
+        Every source starts being extracted when the run starts, instead of when its stage starts, so the
+        orders table is read while the dimension tables are still being cleaned and loaded. Stages then run
+        as in `run`, each waiting for the data of its source. At most two chunks of the orders table are
+        fetched ahead of its stage, so memory stays bounded. Stages resumed from staged data are not extracted.
+
+        The bytes per second of each source are output and added to the metrics.
+        """
+        fills = []
+        for stage, extract in self.sources.items():
+            if self.staging.can_resume(stage, "raw") or self.staging.can_resume(stage, "cleaned"):
+                continue
+            # Extracted before its stage starts, so the bytes downloaded are counted towards it explicitly
+            extract = self.metrics.counting_transfers(stage, extract)
+            if stage in self.CHUNKED_STAGES:
+                self._prefetched[stage], fill = self.async_extractor.prefetch_chunks(stage, extract)
+            else:
+                self._prefetched[stage], fill = self.async_extractor.prefetch(stage, extract)
+            fills.append(asyncio.create_task(fill))
+
+        try:
+            await asyncio.to_thread(self.run)
+        finally:
+            # Extractions are left over when a stage failed before using its data
+            for task in fills:
+                task.cancel()
+            await asyncio.gather(*fills, return_exceptions=True)
+            self._prefetched.clear()
+            self.async_extractor.close()
+
+        for source, bytes_per_second in self.async_extractor.throughput().items():
+            print(f"{source}: extracted at {bytes_per_second / 1e6:.2f} MB/s.")
+
+    def run_stages(self):
+        """Run the stages of the pipeline in parallel, outputting the critical path."""
+        scheduler = StageScheduler(max_workers=self.max_workers)
+        scheduler.add_stage("dim_users", self.clean_legacy_users)
+        scheduler.add_stage("dim_card_details", self.clean_card_details)
+        scheduler.add_stage("dim_store_details", self.clean_store_details)
+        scheduler.add_stage("dim_products", self.clean_product_details)
+        scheduler.add_stage("dim_date_times", self.clean_date_details)
+        scheduler.add_stage(
+            "orders_table",
+            self.clean_order_details,
+            depends_on=["dim_users", "dim_card_details", "dim_store_details", "dim_products", "dim_date_times"],
+        )
+        scheduler.run()
+
+        path, path_time = scheduler.critical_path()
+        print(f"Critical path: {' -> '.join(path)} ({path_time} seconds).")
 
 if __name__ == "__main__":
     app = DataApplication()
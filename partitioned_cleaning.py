@@ -0,0 +1,189 @@
+import gc
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from data_cleaning import DataCleaning
+
+
+def _to_ipc(dataframe: pd.DataFrame) -> pa.Table:
+    """Convert a DataFrame to an Arrow table, keeping its index and pandas dtypes."""
+    return pa.Table.from_pandas(dataframe, preserve_index=True)
+
+
+def _ipc_size(table: pa.Table) -> int:
+    """Return the number of bytes of a table in the Arrow IPC stream format."""
+    sink = pa.MockOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.size()
+
+
+def _write_ipc(table: pa.Table, sink) -> None:
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _read_ipc(buffer) -> pd.DataFrame:
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+
+def _clean_in_worker(
+    settings: dict, method: str, partition: pd.DataFrame
+) -> Tuple[bytes | pd.DataFrame, List[Tuple[str, int]]]:
+    """Clean a partition with a new DataCleaning, returning the result as Arrow IPC bytes and the rows dropped."""
+    drops = []
+    cleaner = DataCleaning.from_settings(settings, on_drop=lambda rule, count: drops.append((rule, count)))
+    cleaned = getattr(cleaner, method)(partition)
+    try:
+        table = _to_ipc(cleaned)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Columns holding mixed types cannot be converted to Arrow, so are pickled instead.
+        # They are copied first, since they may point into the shared memory of the partition
+        return cleaned.copy(), drops
+    sink = pa.BufferOutputStream()
+    _write_ipc(table, sink)
+    return sink.getvalue().to_pybytes(), drops
+
+
+def _clean_partition(
+    settings: dict, method: str, source: Tuple[str, int] | pd.DataFrame
+) -> Tuple[bytes | pd.DataFrame, List[Tuple[str, int]]]:
+    """Clean one partition in a worker process.
+
+    Args:
+        settings (dict): Settings of the DataCleaning to clean with.
+        method (str): Name of the DataCleaning method, such as 'clean_user_data'.
+        source (Tuple[str, int] | pd.DataFrame): Name and size of the shared memory holding the
+            partition in the Arrow IPC format, or the partition itself.
+
+    Returns:
+        Tuple[bytes | pd.DataFrame, List[Tuple[str, int]]]: Cleaned partition, and the rows dropped by each rule.
+    """
+    if isinstance(source, pd.DataFrame):
+        return _clean_in_worker(settings, method, source)
+
+    name, size = source
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        return _clean_in_worker(settings, method, _read_ipc(pa.py_buffer(memory.buf[:size])))
+    finally:
+        # Columns of the partition may point into the shared memory, and reference cycles within
+        # pandas objects can keep them alive, so collect them before closing it
+        gc.collect()
+        try:
+            memory.close()
+        except BufferError:
+            # An exception is still holding the partition, the memory is released when the worker exits
+            pass
+
+
+class PartitionedCleaner:
+    """Class for cleaning large DataFrames on several cores.
+
+    The cleaning methods treat every row on its own, so a DataFrame is split into partitions which are
+    cleaned in a process pool and put back together in order. Partitions are handed to the workers in
+    shared memory in the Arrow IPC format, and returned as Arrow IPC bytes, which avoids pickling every
+    value. Each worker cleans with its own DataCleaning, created with the settings of `cleaner`.
+    """
+
+    def __init__(self, cleaner: DataCleaning, workers: int | None = None, min_partition_rows: int = 100_000):
+        """Create a partitioned cleaner.
+
+        Args:
+            cleaner (DataCleaning): Cleaner for DataFrames too small to split, whose settings the workers
+                clean with. Its `on_drop` is also called with the rows dropped in the workers.
+            workers (int | None, optional): Number of worker processes. Defaults to the number of CPUs.
+            min_partition_rows (int, optional): Fewest rows in a partition, so small DataFrames are not
+                split. Defaults to 100000.
+        """
+        self.cleaner = cleaner
+        self.workers = workers or os.cpu_count() or 1
+        self.min_partition_rows = min_partition_rows
+        self._executor = None
+        # Stages running on several threads share the pool
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shut down the worker processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a process whose other threads hold locks (stage threads, Arrow's thread pool) can
+                # deadlock the workers, so they are always spawned
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _share(self, partition: pd.DataFrame) -> Tuple[shared_memory.SharedMemory | None, Tuple[str, int] | pd.DataFrame]:
+        """Write a partition to shared memory, returning the shared memory and the source to give a worker.
+
+        Partitions that cannot be converted to Arrow are given to the worker as they are.
+        """
+        try:
+            table = _to_ipc(partition)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return None, partition
+
+        size = _ipc_size(table)
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        _write_ipc(table, pa.FixedSizeBufferWriter(pa.py_buffer(memory.buf)))
+        return memory, (memory.name, size)
+
+    def clean(self, method: str, dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Clean a DataFrame with a DataCleaning method, split across the worker processes.
+
+        Args:
+            method (str): Name of the DataCleaning method, such as 'clean_user_data'.
+            dataframe (pd.DataFrame): DataFrame to clean.
+
+        Returns:
+            pd.DataFrame: Cleaned DataFrame, the same as cleaning it in one go.
+        """
+        partitions = min(self.workers, math.ceil(len(dataframe) / self.min_partition_rows))
+        if partitions <= 1:
+            return getattr(self.cleaner, method)(dataframe)
+
+        settings = self.cleaner.settings()
+        bounds = [len(dataframe) * part // partitions for part in range(partitions + 1)]
+        shared = []
+        try:
+            futures = []
+            for start, end in zip(bounds, bounds[1:]):
+                memory, source = self._share(dataframe.iloc[start:end])
+                if memory is not None:
+                    shared.append(memory)
+                futures.append(self._get_executor().submit(_clean_partition, settings, method, source))
+
+            cleaned_partitions = []
+            for future in futures:
+                cleaned, drops = future.result()
+                cleaned_partitions.append(_read_ipc(pa.py_buffer(cleaned)) if isinstance(cleaned, bytes) else cleaned)
+                for rule, count in drops:
+                    if self.cleaner.on_drop is not None:
+                        self.cleaner.on_drop(rule, count)
+        finally:
+            for memory in shared:
+                memory.close()
+                memory.unlink()
+
+        return pd.concat(cleaned_partitions)
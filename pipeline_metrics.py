@@ -0,0 +1,292 @@
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak memory is not recorded
+    resource = None
+
+
+def process_peak_rss_bytes() -> int | None:
+    """Return the peak resident memory of this process so far in bytes, or None if it cannot be measured."""
+    if resource is None:
+        return None
+    # Linux reports kilobytes, macOS reports bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PipelineMetrics:
+    """Class for recording timings, row counts, dropped rows, memory, data sizes and bytes transferred for
+    each pipeline stage.
+
+    Stages run on their own threads, so the stage being recorded is tracked per thread. Memory can only
+    be measured for the whole process, so the peak memory of a stage is the peak of the process when
+    the stage finished, including any stage running at the same time. Data sizes are the in-memory
+    sizes of the DataFrames. Bytes transferred are the bytes actually read or written, reported by the
+    extractor, the database connector and the staging through `add_transferred`. Phases within a
+    stage (extract, clean, upload) can nest, for example when chunks are pulled through a generator, so
+    each phase only records the time not spent in a phase nested inside it.
+    """
+
+    def __init__(self, profile: str | None = None, output_dir: str = "metrics"):
+        """Create a metrics recorder.
+
+        Args:
+            profile (str | None, optional): Profile each stage with 'cprofile' or 'pyinstrument'. Profiled
+                stages run one at a time, since only one profiler can be active. Defaults to None.
+            output_dir (str, optional): Directory that metrics and profiles are written to. Defaults to "metrics".
+
+        Raises:
+            ValueError: If the profiler is not valid.
+        """
+        if profile not in (None, "cprofile", "pyinstrument"):
+            raise ValueError(f"{profile} is not a valid profiler.")
+
+        self._profile = profile
+        self._output_dir = output_dir
+        self._profile_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stages: dict = {}
+        # Throughput of each source, recorded by asynchronous extraction
+        self.sources: dict = {}
+        # Bytes transferred for each stage by kind. Transfers can happen on threads fetching the data of a
+        # stage, before the stage starts, so the stage they count towards is carried in the context
+        self._transferred: dict = defaultdict(lambda: defaultdict(int))
+        self._transfer_stage = contextvars.ContextVar("transfer_stage", default=None)
+
+    def _current(self) -> dict | None:
+        """Return the metrics of the stage running on this thread, or None if there is none."""
+        stage = getattr(self._local, "stage", None)
+        return self.stages[stage] if stage else None
+
+    @contextmanager
+    def stage(self, name: str, profile: bool = True):
+        """Record a stage, outputting when it starts and how long it took.
+
+        Args:
+            name (str): Name of the stage.
+            profile (bool, optional): Profile the stage, if a profiler is set. Defaults to True.
+        """
+        with self._lock:
+            self.stages[name] = {
+                "duration_seconds": 0.0,
+                "phase_seconds": defaultdict(float),
+                "rows": defaultdict(int),
+                "rows_dropped": defaultdict(int),
+                "dataframe_bytes": defaultdict(int),
+                "transferred_bytes": self._transferred[name],
+                "process_peak_rss_bytes": None,
+            }
+        self._local.stage = name
+        self._local.phase_stack = []
+        transfer_token = self._transfer_stage.set(name)
+
+        print(f"{name}: started.")
+        start_time = time.perf_counter()
+        try:
+            if self._profile and profile:
+                with self._profile_lock, self._profiled(name):
+                    yield
+            else:
+                yield
+        finally:
+            metrics = self.stages[name]
+            metrics["duration_seconds"] = time.perf_counter() - start_time
+            metrics["process_peak_rss_bytes"] = process_peak_rss_bytes()
+            self._local.stage = None
+            self._transfer_stage.reset(transfer_token)
+            print(f"{name} finished in {metrics['duration_seconds']} seconds.")
+
+    @contextmanager
+    def _profiled(self, name: str):
+        """Profile the code run inside the context, and write the report to the output directory."""
+        os.makedirs(self._output_dir, exist_ok=True)
+        if self._profile == "pyinstrument":
+            from pyinstrument import Profiler
+
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(os.path.join(self._output_dir, f"{name}.profile.html"), "w") as report:
+                    report.write(profiler.output_html())
+            return
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(self._output_dir, f"{name}.prof"))
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+            with open(os.path.join(self._output_dir, f"{name}.profile.txt"), "w") as report:
+                report.write(summary.getvalue())
+
+    @contextmanager
+    def phase(self, name: str):
+        """Record the time spent in a phase of the current stage, such as 'extract', 'clean' or 'upload'.
+
+        Args:
+            name (str): Name of the phase.
+        """
+        metrics = self._current()
+        if metrics is None:
+            yield
+            return
+
+        # Each entry is [start time, time spent in nested phases]
+        stack = self._local.phase_stack
+        stack.append([time.perf_counter(), 0.0])
+        try:
+            yield
+        finally:
+            start_time, nested_time = stack.pop()
+            elapsed = time.perf_counter() - start_time
+            metrics["phase_seconds"][name] += elapsed - nested_time
+            if stack:
+                stack[-1][1] += elapsed
+
+    def timed_chunks(self, name: str, chunks: Iterable[pd.DataFrame], rows: str | None = None) -> Iterator[pd.DataFrame]:
+        """Record the time spent producing each chunk of an iterable as a phase.
+
+        Args:
+            name (str): Name of the phase.
+            chunks (Iterable[pd.DataFrame]): Chunks to time.
+            rows (str | None, optional): Row count to add the rows of each chunk to. Defaults to None.
+
+        Yields:
+            Iterator[pd.DataFrame]: The chunks.
+        """
+        iterator = iter(chunks)
+        while True:
+            with self.phase(name):
+                chunk = next(iterator, None)
+            if chunk is None:
+                return
+            if rows:
+                self.add_rows(rows, chunk)
+            yield chunk
+
+    def add_rows(self, name: str, dataframe: pd.DataFrame):
+        """Add the rows and in-memory size of a DataFrame to a count of the current stage, such as 'in' or 'out'."""
+        metrics = self._current()
+        if metrics is not None:
+            metrics["rows"][name] += len(dataframe)
+            metrics["dataframe_bytes"][name] += int(dataframe.memory_usage(deep=True).sum())
+
+    def add_dropped(self, rule: str, count: int):
+        """Add to the number of rows dropped by a cleaning rule in the current stage."""
+        metrics = self._current()
+        if metrics is not None:
+            metrics["rows_dropped"][rule] += count
+
+    @contextmanager
+    def transfers(self, stage: str):
+        """Count the bytes transferred inside the context towards a stage, even if it is not running yet.
+
+        Threads started with a copy of the context, such as by `asyncio.to_thread`, count towards it too.
+
+        Args:
+            stage (str): Name of the stage.
+        """
+        token = self._transfer_stage.set(stage)
+        try:
+            yield
+        finally:
+            self._transfer_stage.reset(token)
+
+    def counting_transfers(self, stage: str, function: Callable) -> Callable:
+        """Return a function calling another inside `transfers`, so its transfers count towards a stage."""
+        def counted(*args, **kwargs):
+            with self.transfers(stage):
+                return function(*args, **kwargs)
+        return counted
+
+    def add_transferred(self, kind: str, byte_count: int):
+        """Add to the bytes transferred for the current stage, such as 'extract', 'upload' or 'staging_write'."""
+        stage = self._transfer_stage.get()
+        if stage is not None:
+            with self._lock:
+                self._transferred[stage][kind] += byte_count
+
+    def add_source(self, name: str, rows: int, data_bytes: int, seconds: float):
+        """Record the rows, in-memory bytes and time spent waiting on an extracted source.
+
+        Args:
+            name (str): Name of the source.
+            rows (int): Rows extracted.
+            data_bytes (int): In-memory size of the extracted data.
+            seconds (float): Time spent waiting on the source.
+        """
+        with self._lock:
+            self.sources[name] = {
+                "rows": rows,
+                "bytes": data_bytes,
+                "seconds": seconds,
+                "bytes_per_second": data_bytes / seconds if seconds else 0.0,
+            }
+
+    def to_dict(self) -> dict:
+        """Return the recorded metrics, keyed by stage."""
+        return json.loads(json.dumps(self.stages))
+
+    def write_json(self, path: str | None = None):
+        """Write the recorded metrics as JSON.
+
+        Args:
+            path (str | None, optional): File to write to. Defaults to metrics.json in the output directory.
+        """
+        path = path or os.path.join(self._output_dir, "metrics.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as metrics_file:
+            json.dump({"recorded_at": time.time(), "stages": self.to_dict(), "sources": self.sources}, metrics_file, indent=2)
+
+    def write_prometheus(self, path: str | None = None):
+        """Write the recorded metrics in the Prometheus textfile collector format.
+
+        Args:
+            path (str | None, optional): File to write to. Defaults to pipeline.prom in the output directory.
+        """
+        lines = []
+        for stage, metrics in self.stages.items():
+            lines.append(f'pipeline_stage_duration_seconds{{stage="{stage}"}} {metrics["duration_seconds"]}')
+            for phase, seconds in metrics["phase_seconds"].items():
+                lines.append(f'pipeline_phase_duration_seconds{{stage="{stage}",phase="{phase}"}} {seconds}')
+            for name, count in metrics["rows"].items():
+                lines.append(f'pipeline_rows{{stage="{stage}",direction="{name}"}} {count}')
+            for name, count in metrics["dataframe_bytes"].items():
+                lines.append(f'pipeline_dataframe_bytes{{stage="{stage}",direction="{name}"}} {count}')
+            for kind, count in metrics["transferred_bytes"].items():
+                lines.append(f'pipeline_transferred_bytes{{stage="{stage}",kind="{kind}"}} {count}')
+            for rule, count in metrics["rows_dropped"].items():
+                lines.append(f'pipeline_rows_dropped{{stage="{stage}",rule="{rule}"}} {count}')
+            if metrics["process_peak_rss_bytes"] is not None:
+                lines.append(f'pipeline_process_peak_rss_bytes{{stage="{stage}"}} {metrics["process_peak_rss_bytes"]}')
+        for source, metrics in self.sources.items():
+            lines.append(f'pipeline_source_bytes_per_second{{source="{source}"}} {metrics["bytes_per_second"]}')
+
+        path = path or os.path.join(self._output_dir, "pipeline.prom")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Write then rename, so the collector never reads a partial file
+        with open(path + ".tmp", "w") as metrics_file:
+            metrics_file.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,119 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket for limiting the rate of requests to an API."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        """Create a token bucket.
+
+        Args:
+            rate (float): Number of tokens added to the bucket per second.
+            capacity (float | None, optional): Maximum number of tokens the bucket can hold. Defaults to `rate`.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be greater than zero.")
+
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self._capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def _refill(self):
+        """Add the tokens accumulated since the last refill. Must be called with the lock held."""
+        now = time.monotonic()
+        if now <= self._last_refill:
+            # Paused, see AdaptiveTokenBucket.on_throttle
+            return
+        self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until the requested number of tokens are available, then consume them.
+
+        Args:
+            tokens (float, optional): Number of tokens to consume. Defaults to 1.0.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_time = (tokens - self._tokens) / self._rate
+            time.sleep(wait_time)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """Token bucket whose rate adapts to throttling by the API (additive increase, multiplicative decrease).
+
+    Each successful request raises the rate a little, by about `increase` requests per second for every
+    second of successful requests. A throttled request divides the rate, unless it was sent before the
+    rate was last lowered, and can pause every request for as long as the API asked.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        max_rate: float | None = None,
+        min_rate: float = 0.1,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        capacity: float | None = None,
+    ):
+        """Create an adaptive token bucket.
+
+        Args:
+            rate (float): Starting number of tokens added to the bucket per second.
+            max_rate (float | None, optional): Highest rate the bucket can reach. Defaults to four times `rate`.
+            min_rate (float, optional): Lowest rate the bucket can fall to. Defaults to 0.1.
+            increase (float, optional): Rate added for every second of successful requests. Defaults to 1.0.
+            decrease_factor (float, optional): Factor the rate is multiplied by when throttled. Defaults to 0.5.
+            capacity (float | None, optional): Maximum number of tokens the bucket can hold. Defaults to `rate`.
+        """
+        super().__init__(rate, capacity)
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between zero and one.")
+
+        self._max_rate = max_rate if max_rate is not None else rate * 4
+        self._min_rate = min(min_rate, rate)
+        self._increase = increase
+        self._decrease_factor = decrease_factor
+        self._last_decrease = float("-inf")
+
+    def _set_rate(self, rate: float):
+        """Change the rate, keeping the tokens accumulated at the old rate. Must be called with the lock held."""
+        self._refill()
+        self._rate = min(self._max_rate, max(self._min_rate, rate))
+
+    def on_success(self):
+        """Raise the rate after a request that was not throttled."""
+        with self._lock:
+            self._set_rate(self._rate + self._increase / self._rate)
+
+    def on_throttle(self, pause: float | None = None, sent_at: float | None = None):
+        """Lower the rate after a throttled request.
+
+        Args:
+            pause (float | None, optional): Seconds the API asked to wait before the next request, for
+                example from a Retry-After header. No request is let through until then. Defaults to None.
+            sent_at (float | None, optional): `time.monotonic()` when the request was sent. Requests sent
+                before the rate was last lowered were sent at the old rate, so they do not lower it again.
+                Defaults to now.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if sent_at is None or sent_at >= self._last_decrease:
+                self._set_rate(self._rate * self._decrease_factor)
+                self._last_decrease = now
+            # Drop the saved tokens so requests do not burst when the API is retried, and start
+            # refilling once the pause is over
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+            self._last_refill = max(self._last_refill, now + (pause or 0.0))
@@ -0,0 +1,243 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+from typing import Dict, Iterable, List
+
+import pandas as pd
+import sqlalchemy
+
+from database_utils import DatabaseConnector
+
+# Pre-aggregated views the reports are served from, with the tables each is built from.
+# Orders are grouped by every attribute a report filters or groups on, so a report only sums a few
+# thousand rows instead of joining the orders with the dimension tables. The dimension keys are
+# unique (see db_schema/task_8.sql), so the left joins do not repeat orders.
+VIEWS = {
+    "mv_sales_fact": {
+        "sources": ["orders_table", "dim_date_times", "dim_products", "dim_store_details"],
+        "query": """
+            SELECT
+                dim_date_times.date_uuid IS NOT NULL AS has_date,
+                dim_products.product_code IS NOT NULL AS has_product,
+                dim_store_details.store_code IS NOT NULL AS has_store,
+                date_part('year', dim_date_times.datetime) AS "year",
+                date_part('month', dim_date_times.datetime) AS "month",
+                dim_store_details.store_type,
+                dim_store_details.country_code,
+                orders_table.store_code LIKE 'WEB%' AS is_web,
+                COUNT(orders_table.product_code) AS number_of_sales,
+                SUM(orders_table.product_quantity) AS product_quantity,
+                SUM(CAST(dim_products.product_price * orders_table.product_quantity AS NUMERIC)) AS total_sales
+            FROM public.orders_table
+            LEFT JOIN public.dim_date_times ON dim_date_times.date_uuid = orders_table.date_uuid
+            LEFT JOIN public.dim_products ON dim_products.product_code = orders_table.product_code
+            LEFT JOIN public.dim_store_details ON dim_store_details.store_code = orders_table.store_code
+            GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+        """,
+        "key": ["has_date", "has_product", "has_store", "year", "month", "store_type", "country_code", "is_web"],
+    },
+    "mv_sale_intervals": {
+        "sources": ["dim_date_times"],
+        "query": """
+            WITH next_date_cte AS (
+                SELECT
+                    datetime,
+                    date_part('year', datetime) AS "year",
+                    LEAD(datetime) OVER (
+                        PARTITION BY date_part('year', datetime)
+                        ORDER BY datetime
+                    ) AS next_sale_date
+                FROM public.dim_date_times
+            )
+            SELECT
+                "year",
+                SUM(next_sale_date - datetime) AS total_time_taken,
+                COUNT(*) AS sales_intervals
+            FROM next_date_cte
+            WHERE next_sale_date IS NOT NULL
+            GROUP BY "year"
+        """,
+        "key": ["year"],
+    },
+}
+VIEWS_SOURCES = sorted({source for view in VIEWS.values() for source in view["sources"]})
+
+
+class ReportRunner:
+    """Class for serving the `db_queries` reports from pre-aggregated materialized views.
+
+    The views are built once the tables are loaded, see `build_views`. A load that replaces the tables
+    has to drop the views first, since Postgres does not drop a table other objects depend on, and then
+    builds them all again. After an incremental load, only the views built from changed tables are
+    refreshed, see `refresh_views`.
+    Postgres cannot maintain a view incrementally, but a concurrent refresh only writes the rows that
+    changed and does not block the reports.
+    """
+
+    def __init__(self, connector: DatabaseConnector, queries_dir: str = "db_queries", reports_dir: str = "db_reports"):
+        """Create a report runner.
+
+        Args:
+            connector (DatabaseConnector): Connector for the database holding the loaded tables.
+            queries_dir (str, optional): Directory of the reports querying the tables. Defaults to "db_queries".
+            reports_dir (str, optional): Directory of the same reports querying the views. Defaults to "db_reports".
+        """
+        self._connector = connector
+        self._queries_dir = queries_dir
+        self._reports_dir = reports_dir
+
+    def is_supported(self) -> bool:
+        """Return whether the database supports materialized views, which only Postgres does."""
+        return self._connector.engine.dialect.name == "postgresql"
+
+    def _check_supported(self):
+        if not self.is_supported():
+            raise ValueError("Reports are only supported for Postgres databases.")
+
+    def list_reports(self) -> List[str]:
+        """Return the names of the reports, such as 'task_1', in order."""
+        paths = glob.glob(os.path.join(self._reports_dir, "task_*.sql"))
+        return sorted((os.path.splitext(os.path.basename(path))[0] for path in paths), key=lambda name: int(name[5:]))
+
+    def build_views(self, views: Iterable[str] | None = None):
+        """Create the views, replacing any that already exist.
+
+        Args:
+            views (Iterable[str] | None, optional): Names of the views to build. Defaults to every view.
+
+        Raises:
+            ValueError: If the database is not Postgres.
+        """
+        self._check_supported()
+        with self._connector.engine.begin() as connection:
+            for name in views or VIEWS:
+                view = VIEWS[name]
+                key = ", ".join(f'"{column}"' for column in view["key"])
+                connection.execute(sqlalchemy.text(f'DROP MATERIALIZED VIEW IF EXISTS "{name}"'))
+                connection.execute(sqlalchemy.text(f'CREATE MATERIALIZED VIEW "{name}" AS {view["query"]}'))
+                # A concurrent refresh needs a unique index over every row
+                connection.execute(sqlalchemy.text(f'CREATE UNIQUE INDEX "{name}_key" ON "{name}" ({key})'))
+
+    def drop_views(self):
+        """Drop the views, so the tables they are built from can be replaced.
+
+        Raises:
+            ValueError: If the database is not Postgres.
+        """
+        self._check_supported()
+        with self._connector.engine.begin() as connection:
+            for name in VIEWS:
+                connection.execute(sqlalchemy.text(f'DROP MATERIALIZED VIEW IF EXISTS "{name}"'))
+
+    def refresh_views(self, changed_tables: Iterable[str] | None = None, build_missing: bool = True) -> List[str]:
+        """Refresh the views built from changed tables.
+
+        Args:
+            changed_tables (Iterable[str] | None, optional): Tables whose rows changed since the views
+                were refreshed. Defaults to every table.
+            build_missing (bool, optional): Build views that do not exist yet. Defaults to True.
+
+        Raises:
+            ValueError: If the database is not Postgres.
+
+        Returns:
+            List[str]: Names of the views that were built or refreshed.
+        """
+        self._check_supported()
+        with self._connector.engine.connect() as connection:
+            existing = set(connection.execute(sqlalchemy.text("SELECT matviewname FROM pg_matviews")).scalars())
+
+        missing = [name for name in VIEWS if name not in existing]
+        if missing and build_missing:
+            self.build_views(missing)
+
+        changed_tables = set(VIEWS_SOURCES if changed_tables is None else changed_tables)
+        refreshed = []
+        for name, view in VIEWS.items():
+            if name in missing or not changed_tables.intersection(view["sources"]):
+                continue
+            with self._connector.engine.begin() as connection:
+                connection.execute(sqlalchemy.text(f'REFRESH MATERIALIZED VIEW CONCURRENTLY "{name}"'))
+            refreshed.append(name)
+        return (missing if build_missing else []) + refreshed
+
+    def _read_sql(self, directory: str, report: str) -> str:
+        with open(os.path.join(directory, f"{report}.sql"), "r") as sql_file:
+            return sql_file.read()
+
+    def run_report(self, report: str, from_views: bool = True) -> pd.DataFrame:
+        """Run a report.
+
+        Args:
+            report (str): Name of the report, such as 'task_3'.
+            from_views (bool, optional): Query the views, or query the tables like `db_queries`. Defaults to True.
+
+        Returns:
+            pd.DataFrame: Result of the report.
+        """
+        sql = self._read_sql(self._reports_dir if from_views else self._queries_dir, report)
+        with self._connector.engine.connect() as connection:
+            return pd.read_sql_query(sqlalchemy.text(sql), connection)
+
+    def time_reports(self, repeats: int = 5) -> Dict[str, dict]:
+        """Time every report against the tables and against the views, checking both give the same result.
+
+        Args:
+            repeats (int, optional): Times each report is run, the median time is reported. Defaults to 5.
+
+        Raises:
+            ValueError: If a report gives a different result from the views.
+
+        Returns:
+            Dict[str, dict]: Median seconds before (tables) and after (views) for each report.
+        """
+        timings = {}
+        for report in self.list_reports():
+            results = {}
+            seconds = {}
+            for from_views in (False, True):
+                durations = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    results[from_views] = self.run_report(report, from_views)
+                    durations.append(time.perf_counter() - start)
+                seconds[from_views] = statistics.median(durations)
+
+            try:
+                pd.testing.assert_frame_equal(results[False], results[True], check_dtype=False)
+            except AssertionError as error:
+                raise ValueError(f"{report} gives a different result from the views: {error}")
+            timings[report] = {
+                "before_seconds": seconds[False],
+                "after_seconds": seconds[True],
+                "speedup": seconds[False] / seconds[True] if seconds[True] else None,
+            }
+        return timings
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the report views and time the reports before and after.")
+    parser.add_argument("--credentials", default="local_db_creds.yaml")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--rebuild", action="store_true", help="Build the views again instead of refreshing them.")
+    parser.add_argument("--output", default=os.path.join("metrics", "report_timings.json"))
+    args = parser.parse_args()
+
+    runner = ReportRunner(DatabaseConnector(credential_path=args.credentials))
+    if args.rebuild:
+        runner.build_views()
+    else:
+        runner.refresh_views()
+
+    timings = runner.time_reports(args.repeats)
+    for report, timing in timings.items():
+        print(f"{report}: {timing['before_seconds']:.4f}s -> {timing['after_seconds']:.4f}s")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as timings_file:
+        json.dump({"recorded_at": time.time(), "reports": timings}, timings_file, indent=2)
+    print(f"Timings saved to {args.output}.")
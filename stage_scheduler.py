@@ -0,0 +1,92 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List
+
+
+class StageScheduler:
+    """Class for running pipeline stages in parallel while respecting their dependencies."""
+
+    def __init__(self, max_workers: int | None = None):
+        """Create a stage scheduler.
+
+        Args:
+            max_workers (int | None, optional): Number of stages that can run at once. Defaults to one per stage.
+        """
+        self._max_workers = max_workers
+        self._stages: Dict[str, Callable] = {}
+        self._dependencies: Dict[str, List[str]] = {}
+        self.durations: Dict[str, float] = {}
+
+    def add_stage(self, name: str, function: Callable, depends_on: List[str] | None = None):
+        """Declare a stage to be run by the scheduler.
+
+        Args:
+            name (str): Unique name of the stage.
+            function (Callable): Function to call, with no arguments, to run the stage.
+            depends_on (List[str] | None, optional): Names of stages that must finish first. Defaults to None.
+
+        Raises:
+            ValueError: If the stage already exists or depends on an unknown stage.
+        """
+        if name in self._stages:
+            raise ValueError(f"{name} stage has already been added.")
+
+        depends_on = depends_on or []
+        for dependency in depends_on:
+            if dependency not in self._stages:
+                raise ValueError(f"{name} stage depends on unknown stage {dependency}.")
+
+        self._stages[name] = function
+        self._dependencies[name] = list(depends_on)
+
+    def _timed_stage(self, name: str):
+        """Run a stage and record how long it took."""
+        start_time = time.perf_counter()
+        self._stages[name]()
+        self.durations[name] = time.perf_counter() - start_time
+
+    def run(self):
+        """Run all stages, starting each one as soon as the stages it depends on have finished.
+
+        Raises:
+            Exception: The first exception raised by a stage. Stages not yet started are not run.
+        """
+        self.durations = {}
+        remaining = dict(self._dependencies)
+        finished: set = set()
+        running: Dict[Future, str] = {}
+
+        max_workers = self._max_workers or max(len(self._stages), 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while remaining or running:
+                # Start every stage whose dependencies have all finished
+                for name, dependencies in list(remaining.items()):
+                    if all(dependency in finished for dependency in dependencies):
+                        running[executor.submit(self._timed_stage, name)] = name
+                        del remaining[name]
+
+                # Wake up as soon as any stage finishes, so the stages waiting on it start straight away
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    future.result() # re-raise any exception from the stage
+                    finished.add(name)
+
+    def critical_path(self) -> tuple[List[str], float]:
+        """Return the chain of dependent stages with the longest total duration from the last run.
+
+        Returns:
+            tuple[List[str], float]: Names of the stages on the critical path, and its total duration in seconds.
+        """
+        # Stages are added after their dependencies, so insertion order is a topological order
+        path_times: Dict[str, tuple[List[str], float]] = {}
+        for name, dependencies in self._dependencies.items():
+            longest_path, longest_time = [], 0.0
+            for dependency in dependencies:
+                if path_times[dependency][1] > longest_time:
+                    longest_path, longest_time = path_times[dependency]
+            path_times[name] = (longest_path + [name], longest_time + self.durations.get(name, 0.0))
+
+        if not path_times:
+            return [], 0.0
+        return max(path_times.values(), key=lambda path_time: path_time[1])
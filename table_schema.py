@@ -0,0 +1,242 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from database_utils import DatabaseConnector
+
+
+@dataclass
+class TableSchema:
+    """Final schema of a loaded table, which the `db_schema` scripts used to apply after loading.
+
+    Attributes:
+        column_types (Dict[str, sqlalchemy.types.TypeEngine]): SQL types of columns, replacing the types
+            chosen for the data.
+        derived_columns (Dict[str, Callable[[pd.DataFrame], pd.Series]]): Columns computed from the cleaned
+            data before it is loaded, replacing any column of the same name.
+        drop_columns (List[str]): Columns of the cleaned data that are not loaded.
+        primary_key (List[str]): Columns of the primary key.
+        foreign_keys (Dict[str, Tuple[str, str]]): Referenced table and column for each foreign key column.
+    """
+
+    column_types: Dict[str, sqlalchemy.types.TypeEngine] = field(default_factory=dict)
+    derived_columns: Dict[str, Callable[[pd.DataFrame], pd.Series]] = field(default_factory=dict)
+    drop_columns: List[str] = field(default_factory=list)
+    primary_key: List[str] = field(default_factory=list)
+    foreign_keys: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+
+
+def weight_category(dataframe: pd.DataFrame) -> pd.Series:
+    """Categorise product weights in kg, as Light, Mid_Sized, Heavy or Truck_Required."""
+    categories = pd.cut(
+        dataframe["weight"],
+        bins=[-np.inf, 2, 40, 140, np.inf],
+        right=False,
+        labels=["Light", "Mid_Sized", "Heavy", "Truck_Required"],
+    )
+    return categories.astype("string")
+
+
+def still_available(dataframe: pd.DataFrame) -> pd.Series:
+    """Flip the removed flag of products to say whether they are still available."""
+    return ~dataframe["removed"]
+
+
+def ean_digits(dataframe: pd.DataFrame) -> pd.Series:
+    """Format EAN codes as digits, since as floats they would be written in scientific notation."""
+    return dataframe["EAN"].astype("Int64").astype("string")
+
+
+# The types, columns and keys set by the db_schema scripts
+TABLE_SCHEMAS = {
+    "dim_users": TableSchema(
+        column_types={
+            "first_name": sqlalchemy.String(255),
+            "last_name": sqlalchemy.String(255),
+            "country_code": sqlalchemy.String(2),
+            "user_uuid": sqlalchemy.Uuid(as_uuid=False),
+            "date_of_birth": sqlalchemy.Date(),
+            "join_date": sqlalchemy.Date(),
+        },
+        primary_key=["user_uuid"],
+    ),
+    "dim_card_details": TableSchema(
+        column_types={
+            "card_number": sqlalchemy.String(19),
+            "expiry_date": sqlalchemy.Date(),
+            "date_payment_confirmed": sqlalchemy.Date(),
+        },
+        primary_key=["card_number"],
+    ),
+    "dim_store_details": TableSchema(
+        column_types={
+            "locality": sqlalchemy.String(255),
+            # Long enough for the web store code, WEB-1388012W
+            "store_code": sqlalchemy.String(12),
+            "staff_numbers": sqlalchemy.SmallInteger(),
+            "store_type": sqlalchemy.String(255),
+            "country_code": sqlalchemy.String(2),
+            "continent": sqlalchemy.String(255),
+        },
+        primary_key=["store_code"],
+    ),
+    "dim_products": TableSchema(
+        column_types={
+            "product_price": sqlalchemy.Float(),
+            "weight": sqlalchemy.Float(),
+            "EAN": sqlalchemy.String(17),
+            "product_code": sqlalchemy.String(11),
+            "uuid": sqlalchemy.Uuid(as_uuid=False),
+            "weight_category": sqlalchemy.String(14),
+            "still_available": sqlalchemy.Boolean(),
+        },
+        derived_columns={"EAN": ean_digits, "weight_category": weight_category, "still_available": still_available},
+        drop_columns=["removed"],
+        primary_key=["product_code"],
+    ),
+    "dim_date_times": TableSchema(
+        column_types={"date_uuid": sqlalchemy.Uuid(as_uuid=False)},
+        primary_key=["date_uuid"],
+    ),
+    "orders_table": TableSchema(
+        column_types={
+            "date_uuid": sqlalchemy.Uuid(as_uuid=False),
+            "user_uuid": sqlalchemy.Uuid(as_uuid=False),
+            "card_number": sqlalchemy.String(19),
+            "store_code": sqlalchemy.String(12),
+            "product_code": sqlalchemy.String(11),
+            "product_quantity": sqlalchemy.SmallInteger(),
+        },
+        foreign_keys={
+            "date_uuid": ("dim_date_times", "date_uuid"),
+            "user_uuid": ("dim_users", "user_uuid"),
+            "card_number": ("dim_card_details", "card_number"),
+            "store_code": ("dim_store_details", "store_code"),
+            "product_code": ("dim_products", "product_code"),
+        },
+    ),
+}
+
+
+class SchemaManager:
+    """Class for loading tables straight into their final schema.
+
+    Tables are created with their final column types, with the derived columns already computed, so
+    no column has to be rewritten after loading. Keys are only added once every table is loaded, since
+    building an index or checking a foreign key once is faster than keeping them up to date row by row.
+    """
+
+    def __init__(self, connector: DatabaseConnector, schemas: Dict[str, TableSchema] | None = None):
+        """Create a schema manager.
+
+        Args:
+            connector (DatabaseConnector): Connector for the database the tables are loaded into.
+            schemas (Dict[str, TableSchema] | None, optional): Schema of each table. Defaults to TABLE_SCHEMAS.
+        """
+        self._connector = connector
+        self.schemas = TABLE_SCHEMAS if schemas is None else schemas
+
+    def prepare(self, table_name: str, dataframe: pd.DataFrame) -> pd.DataFrame:
+        """Add the derived columns of a table to its cleaned data, and remove the columns that are not loaded.
+
+        Args:
+            table_name (str): Name of the table.
+            dataframe (pd.DataFrame): Cleaned data. It is not modified.
+
+        Returns:
+            pd.DataFrame: Data in the columns of the table.
+        """
+        schema = self.schemas.get(table_name)
+        if schema is None:
+            return dataframe
+        derived = {name: derive(dataframe) for name, derive in schema.derived_columns.items()}
+        dropped = [column for column in schema.drop_columns if column in dataframe.columns]
+        return dataframe.drop(columns=dropped).assign(**derived)
+
+    def sql_types(
+        self, table_name: str, planned: Dict[str, sqlalchemy.types.TypeEngine] | None = None
+    ) -> Dict[str, sqlalchemy.types.TypeEngine]:
+        """Return the SQL types to create a table with.
+
+        Args:
+            table_name (str): Name of the table.
+            planned (Dict[str, sqlalchemy.types.TypeEngine] | None, optional): Types chosen for the data,
+                used for the columns the schema does not set. Defaults to None.
+
+        Returns:
+            Dict[str, sqlalchemy.types.TypeEngine]: SQL type of each column.
+        """
+        schema = self.schemas.get(table_name)
+        return {**(planned or {}), **(schema.column_types if schema else {})}
+
+    def _check_supported(self):
+        if self._connector.engine.dialect.name != "postgresql":
+            raise ValueError("Table schemas are only supported for Postgres databases.")
+
+    def drop_foreign_keys(self) -> List[str]:
+        """Drop the foreign keys between the tables, so each table can be replaced when it is loaded.
+
+        The tables and their rows are kept, and `add_keys` adds the keys again once every table is loaded.
+
+        Raises:
+            ValueError: If the database is not Postgres.
+
+        Returns:
+            List[str]: Names of the keys that were dropped.
+        """
+        self._check_supported()
+        inspector = sqlalchemy.inspect(self._connector.engine)
+        keys = [
+            (table_name, key["name"])
+            for table_name in self.schemas
+            if self._connector.has_table(table_name)
+            for key in inspector.get_foreign_keys(table_name)
+            if key["referred_table"] in self.schemas
+        ]
+        with self._connector.engine.begin() as connection:
+            for table_name, name in keys:
+                connection.execute(sqlalchemy.text(f'ALTER TABLE "{table_name}" DROP CONSTRAINT "{name}"'))
+        return [name for _, name in keys]
+
+    def add_keys(self) -> List[str]:
+        """Add the primary and foreign keys that are missing, once the tables are loaded.
+
+        Primary keys are added first, since foreign keys reference them.
+
+        Raises:
+            ValueError: If the database is not Postgres.
+
+        Returns:
+            List[str]: Names of the keys that were added.
+        """
+        self._check_supported()
+        inspector = sqlalchemy.inspect(self._connector.engine)
+        loaded = [table_name for table_name in self.schemas if self._connector.has_table(table_name)]
+        statements = []
+        for table_name in loaded:
+            schema = self.schemas[table_name]
+            if schema.primary_key and not inspector.get_pk_constraint(table_name)["constrained_columns"]:
+                columns = ", ".join(f'"{column}"' for column in schema.primary_key)
+                statements.append((
+                    f"{table_name}_pk",
+                    f'ALTER TABLE "{table_name}" ADD CONSTRAINT "{table_name}_pk" PRIMARY KEY ({columns})',
+                ))
+
+        for table_name in loaded:
+            existing = {tuple(key["constrained_columns"]) for key in inspector.get_foreign_keys(table_name)}
+            for column, (referenced_table, referenced_column) in self.schemas[table_name].foreign_keys.items():
+                if (column,) in existing or referenced_table not in loaded:
+                    continue
+                statements.append((
+                    f"fk_{column}",
+                    f'ALTER TABLE "{table_name}" ADD CONSTRAINT "fk_{column}" FOREIGN KEY ("{column}") '
+                    f'REFERENCES "{referenced_table}" ("{referenced_column}")',
+                ))
+
+        with self._connector.engine.begin() as connection:
+            for _, statement in statements:
+                connection.execute(sqlalchemy.text(statement))
+        return [name for name, _ in statements]
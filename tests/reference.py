@@ -0,0 +1,547 @@
+"""Synthetic data, row-wise reference implementations and stand-ins shared by the tests and `benchmark.py`."""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import numpy as np
+import pandas as pd
+import phonenumbers
+import re
+import requests
+import yaml
+from dateutil.parser import parse
+from dateutil.parser._parser import ParserError
+
+from data_cleaning import DataCleaning
+from database_utils import DatabaseConnector
+
+
+class SyntheticData:
+    """Class for generating seeded synthetic DataFrames with the same dirty shapes as each data source.
+
+    Values are drawn from pools of pre-generated values, so tables of millions of rows can be generated quickly.
+    """
+
+    def __init__(self, seed: int = 0, pool_size: int = 100_000):
+        """Create a synthetic data generator.
+
+        Args:
+            seed (int, optional): Seed for the random number generator. Defaults to 0.
+            pool_size (int, optional): Maximum number of distinct values in a generated column. Defaults to 100000.
+        """
+        self._seed = seed
+        self._pool_size = pool_size
+        self._rng = np.random.default_rng(seed)
+
+    def _choice(self, values, rows: int, probabilities=None) -> np.ndarray:
+        """Draw values for a column."""
+        return self._rng.choice(np.asarray(values, dtype=object), size=rows, p=probabilities)
+
+    def _dirty(self, values: np.ndarray, fraction: float, dirty_values: List) -> np.ndarray:
+        """Replace a fraction of the values in a column with dirty values."""
+        mask = self._rng.random(len(values)) < fraction
+        values[mask] = self._choice(dirty_values, int(mask.sum()))
+        return values
+
+    def uuids(self, rows: int, invalid_fraction: float = 0.01) -> np.ndarray:
+        """Generate UUID strings, some of which are invalid."""
+        pool_size = min(rows, self._pool_size)
+        pool = [
+            f"{a:08x}-{b:04x}-4{c:03x}-{d:04x}-{e:012x}"
+            for a, b, c, d, e in zip(
+                self._rng.integers(0, 16**8, pool_size),
+                self._rng.integers(0, 16**4, pool_size),
+                self._rng.integers(0, 16**3, pool_size),
+                self._rng.integers(0x8000, 0xC000, pool_size),
+                self._rng.integers(0, 16**12, pool_size),
+            )
+        ]
+        return self._dirty(self._choice(pool, rows), invalid_fraction, ["NULL", "GMKJXQ1Z", "1-2-3-4"])
+
+    def dates(self, rows: int) -> np.ndarray:
+        """Generate date strings in the mix of formats found in the sources."""
+        pool_size = min(rows, self._pool_size)
+        days = pd.to_datetime("1940-01-01") + pd.to_timedelta(self._rng.integers(0, 30_000, pool_size), unit="D")
+        formats = ["%Y-%m-%d", "%Y %B %d", "%B %Y %d", "%Y/%m/%d"]
+        chosen_formats = self._choice(formats, pool_size, [0.85, 0.05, 0.05, 0.05])
+        pool = [day.strftime(date_format) for day, date_format in zip(days, chosen_formats)]
+        return self._dirty(self._choice(pool, rows), 0.01, ["NULL", "GFKFDKSG", "March 2020"])
+
+    def countries(self, rows: int) -> tuple[np.ndarray, np.ndarray]:
+        """Generate matching country and country code columns, including the mistyped GGB code."""
+        index = self._rng.choice(4, size=rows, p=[0.5, 0.3, 0.18, 0.02])
+        countries = np.array(["United Kingdom", "Germany", "United States", "United Kingdom"], dtype=object)[index]
+        codes = np.array(["GB", "DE", "US", "GGB"], dtype=object)[index]
+        return countries, codes
+
+    def phone_numbers(self, country_codes: np.ndarray) -> np.ndarray:
+        """Generate phone numbers in the mix of formats used in each country, matching the country codes."""
+        pool_size = max(min(len(country_codes), self._pool_size) // 3, 1)
+        formats = {
+            "GB": ["+44(0){a}{b} {c}", "({a}{b}) {c}", "0{a}{b} {c}", "+44 {a}{b} {c}", "0{a}{b} {c}x{d}"],
+            "DE": ["+49(0){a}{b} {c}", "0{a}{b} {c}", "(0{a}{b}) {c}", "0049 {a}{b} {c}"],
+            "US": ["001-{a}{b}-555-{d}", "({a}{b}) 555-{d}", "{a}{b}.555.{d}x{d}", "+1-{a}{b}-555-{d}"],
+        }
+        pools = {}
+        for country, country_formats in formats.items():
+            chosen_formats = self._choice(country_formats, pool_size)
+            digits = self._rng.integers(0, 10**6, size=(pool_size, 4))
+            pools[country] = np.array([
+                number_format.format(a=20 + a % 79, b=b % 10, c=f"{c:06d}", d=f"{d % 10**4:04d}")
+                for number_format, (a, b, c, d) in zip(chosen_formats, digits)
+            ], dtype=object)
+
+        phones = np.empty(len(country_codes), dtype=object)
+        for country, pool in pools.items():
+            # The mistyped GGB code is a British number
+            mask = np.isin(country_codes, [country, "GGB"] if country == "GB" else [country])
+            phones[mask] = self._choice(pool, int(mask.sum()))
+        return phones
+
+    def phones(self, rows: int) -> pd.DataFrame:
+        """Generate phone numbers with the country code of their owner, including values that cannot be parsed."""
+        _, country_codes = self.countries(rows)
+        return pd.DataFrame({
+            "phone_number": self._dirty(self.phone_numbers(country_codes), 0.01, ["NULL", "123", "", "ext 42"]),
+            "country_code": country_codes,
+        })
+
+    def users(self, rows: int) -> pd.DataFrame:
+        """Generate legacy_users as read from the database."""
+        countries, country_codes = self.countries(rows)
+        names = [f"Name{i}" for i in range(min(rows, 5_000))]
+        emails = self._choice([f"user{i}@example.com" for i in range(min(rows, self._pool_size))], rows)
+        emails = self._dirty(emails, 0.05, ["double@@example.com", "not-an-email"])
+        phones = self._dirty(self.phone_numbers(country_codes), 0.01, ["NULL", "123"])
+        return pd.DataFrame({
+            "index": np.arange(rows),
+            "first_name": self._dirty(self._choice(names, rows), 0.01, ["NULL"]),
+            "last_name": self._choice(names, rows),
+            "date_of_birth": self.dates(rows),
+            "company": self._choice(["Acme", "Initech", "Globex"], rows),
+            "email_address": emails,
+            "address": self._choice(["1 High Street\nLondon", "2 Hauptstrasse\nBerlin"], rows),
+            "country": countries,
+            "country_code": country_codes,
+            "phone_number": phones,
+            "join_date": self.dates(rows),
+            "user_uuid": self.uuids(rows),
+        })
+
+    def cards(self, rows: int) -> pd.DataFrame:
+        """Generate card details as extracted from the PDF, including the combined column from some pages."""
+        pool_size = min(rows, self._pool_size)
+        numbers = self._choice([str(number) for number in self._rng.integers(10**14, 10**16, pool_size)], rows)
+        numbers = self._dirty(numbers, 0.02, ["??4971858637664481", "NULL"])
+        expiry = self._choice([f"{month:02d}/{year}" for month in range(1, 13) for year in range(22, 32)], rows)
+        combined = np.full(rows, np.nan, dtype=object)
+        # Some pages put the card number and expiry date in one column
+        is_combined = self._rng.random(rows) < 0.05
+        combined[is_combined] = numbers[is_combined] + " " + expiry[is_combined]
+        numbers[is_combined] = np.nan
+        expiry[is_combined] = np.nan
+        return pd.DataFrame({
+            "Unnamed: 0": np.arange(rows),
+            "card_number": numbers,
+            "expiry_date": expiry,
+            "card_provider": self._choice(["VISA 16 digit", "Mastercard", "American Express", "NULL"], rows),
+            "date_payment_confirmed": self.dates(rows),
+            "card_number expiry_date": combined,
+        })
+
+    def stores(self, rows: int) -> pd.DataFrame:
+        """Generate store details as returned by the API, including the Web Portal store."""
+        _, country_codes = self.countries(rows)
+        country_codes = self._dirty(country_codes, 0.01, ["YELVM536YT", "NULL"])
+        store_types = self._choice(["Local", "Super Store", "Mall Kiosk", "Outlet", "Web Portal"], rows)
+        is_web = store_types == "Web Portal"
+        data = pd.DataFrame({
+            "index": np.arange(rows),
+            "address": self._choice(["1 High Street\nLondon", "2 Hauptstrasse\nBerlin"], rows),
+            "longitude": self._choice(["-0.1276", "13.4050", "N/A"], rows),
+            "lat": self._choice([None, "N/A"], rows),
+            "locality": self._choice(["London", "Berlin", "New York"], rows),
+            "store_code": self._choice([f"ST-{code:07X}" for code in range(min(rows, self._pool_size))], rows),
+            "staff_numbers": self._dirty(self._choice([str(number) for number in range(1, 500)], rows), 0.02, ["3n9", "J78"]),
+            "opening_date": self.dates(rows),
+            "store_type": store_types,
+            "latitude": self._choice(["51.5072", "52.5200"], rows),
+            "country_code": country_codes,
+            "continent": self._dirty(self._choice(["Europe", "America"], rows), 0.02, ["eeEurope", "eeAmerica"]),
+        })
+        data.loc[is_web, ["address", "longitude", "locality", "latitude"]] = "N/A"
+        return data
+
+    def products(self, rows: int) -> pd.DataFrame:
+        """Generate product details as read from the S3 CSV file, including multiplier and ounce weights."""
+        weights = self._choice(
+            [f"{value}g" for value in range(1, 1000)] + ["1.2g", "0.5kg", "2kg", "500ml", "16oz", "12 x 125g", "3 x 2g", "77g ."],
+            rows,
+        )
+        return pd.DataFrame({
+            "Unnamed: 0": np.arange(rows),
+            "product_name": self._choice([f"Product {i}" for i in range(min(rows, 5_000))], rows),
+            "product_price": self._choice([f"£{price / 100:.2f}" for price in range(100, 10_000, 7)], rows),
+            "weight": self._dirty(weights, 0.01, [np.nan, "9GO", "ABC"]),
+            "category": self._choice(["toys-and-games", "sports-and-leisure", "pets", "homeware", "diy"], rows),
+            "EAN": self._choice([str(ean) for ean in self._rng.integers(10**12, 10**13, min(rows, self._pool_size))], rows),
+            "date_added": self.dates(rows),
+            "uuid": self.uuids(rows),
+            "removed": self._dirty(self._choice(["Still_avaliable", "Removed"], rows), 0.01, ["7QB0Z9EW1G", np.nan]),
+            "product_code": self._choice([f"A{i % 10}-{i:07d}S" for i in range(min(rows, self._pool_size))], rows),
+        })
+
+    def orders(self, rows: int) -> pd.DataFrame:
+        """Generate orders_table as read from the database, including the columns the cleaner drops."""
+        return pd.DataFrame({
+            "level_0": np.arange(rows),
+            "index": np.arange(rows),
+            "date_uuid": self.uuids(rows, invalid_fraction=0),
+            "first_name": None,
+            "last_name": None,
+            "user_uuid": self.uuids(rows, invalid_fraction=0),
+            "card_number": self._rng.integers(10**14, 10**16, rows),
+            "store_code": self._choice([f"ST-{code:07X}" for code in range(min(rows, 500))] + ["WEB-1388012W"], rows),
+            "product_code": self._choice([f"A{i % 10}-{i:07d}S" for i in range(min(rows, 2_000))], rows),
+            "1": np.nan,
+            "product_quantity": self._rng.integers(1, 20, rows),
+        })
+
+    def date_details(self, rows: int) -> pd.DataFrame:
+        """Generate date details as read from the S3 JSON file, including invalid rows."""
+        return pd.DataFrame({
+            "timestamp": self._choice([f"{hour:02d}:{minute:02d}:{second:02d}" for hour in range(24) for minute in range(0, 60, 7) for second in (0, 30)], rows),
+            "month": self._choice([str(month) for month in range(1, 13)], rows),
+            "year": self._choice([str(year) for year in range(1992, 2023)], rows),
+            "day": self._choice([str(day) for day in range(1, 29)], rows),
+            "time_period": self._dirty(self._choice(["Morning", "Midday", "Evening", "Late_Hours"], rows), 0.01, ["NULL", "SXBRWHA3F6"]),
+            "date_uuid": self.uuids(rows),
+        })
+
+
+def reference_parse_dates(values: pd.Series, cleaner: DataCleaning) -> pd.Series:
+    """Parse dates the way `parse_multiple_date_formats` did before it was vectorised, to compare with.
+
+    Every value is parsed by dateutil, then the results are parsed again with the two explicit formats.
+    """
+    def try_parse_date(date):
+        if type(date) is not str:
+            return None
+        try:
+            return parse(date)
+        except ParserError:
+            return None
+
+    dataframe = pd.DataFrame({"date": values})
+    dataframe["date"] = dataframe["date"].apply(try_parse_date)
+    parsed_dates = pd.to_datetime(dataframe["date"], errors="coerce", format=cleaner.date_format)
+    mask = parsed_dates.isna()
+    dataframe.loc[mask, "date"] = pd.to_datetime(
+        dataframe.loc[mask, "date"], errors="coerce", format=cleaner.date_format_alt
+    )
+    return dataframe["date"].combine_first(parsed_dates)
+
+
+def reference_parse_phone_number(phone: str, region: str) -> str | None:
+    """Parse a phone number the way `parse_phone_number` did before it was cached, to compare with.
+
+    Every number is cleaned with four uncompiled regex substitutions, then parsed by libphonenumber.
+    """
+    if type(phone) is not str:
+        return None
+
+    if phone.startswith("00"):
+        phone = "+" + phone[2:]
+
+    phone = re.sub(r'\(0\)', '', phone)
+    phone = phone.replace("(", "").replace(")", "")
+    phone = re.sub(r'x.*$', '', phone)
+    phone = re.sub(r'[^\d+]', '', phone)
+
+    try:
+        if not phone.startswith('+'):
+            parsed_number = phonenumbers.parse(phone, region)
+        else:
+            parsed_number = phonenumbers.parse(phone)
+        return phonenumbers.format_number(parsed_number, phonenumbers.PhoneNumberFormat.INTERNATIONAL)
+    except phonenumbers.phonenumberutil.NumberParseException:
+        return None
+
+
+def reference_parse_phones(phones: pd.Series, regions: pd.Series) -> pd.Series:
+    """Parse phone numbers row by row with `reference_parse_phone_number`, to compare with `parse_phone_numbers`.
+
+    As `parse_phone_numbers` does, strings that cannot be parsed are kept as they are.
+    """
+    dataframe = pd.DataFrame({"phone_number": phones, "country_code": regions})
+    parsed = dataframe.apply(
+        lambda row: reference_parse_phone_number(row["phone_number"], row["country_code"]), axis=1
+    )
+    return pd.Series(
+        [phone if parsed_phone is None and type(phone) is str else parsed_phone for phone, parsed_phone in zip(phones, parsed)],
+        index=phones.index,
+        dtype="object",
+    )
+
+
+def reference_split_card_data(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """Split the combined card column the way `clean_card_data` did before it was vectorised, to compare with.
+
+    A Series is built for every row by `DataFrame.apply`.
+    """
+    def extract_from_combined_card_data(row: pd.Series) -> pd.Series:
+        if pd.isna(row["card_number"]) and pd.isna(row["expiry_date"]):
+            split_parts = row["card_number expiry_date"].split(' ', 1)
+            return pd.Series([split_parts[0], split_parts[1]])
+        return pd.Series([row["card_number"], row["expiry_date"]])
+
+    card_data = dataframe.apply(extract_from_combined_card_data, axis=1)
+    card_data.columns = ["card_number", "expiry_date"]
+    return card_data
+
+
+def reference_clean_user_data(dataframe: pd.DataFrame, cleaner: DataCleaning) -> pd.DataFrame:
+    """Clean user data the way `clean_user_data` did before it used a table spec, to compare with.
+
+    Phone numbers are parsed as `clean_user_data` has done since, so only the cleaning engine differs.
+    """
+    cleaned_df = dataframe.astype(
+        {
+            "first_name": "string",
+            "last_name": "string",
+            "company": "string",
+            "email_address": "string",
+            "address": "string",
+            "country_code": "string",
+            "country": "string",
+            "user_uuid": "string",
+        }
+    )
+    cleaned_df = cleaner.parse_multiple_date_formats(cleaned_df, "date_of_birth")
+    cleaned_df = cleaner.parse_multiple_date_formats(cleaned_df, "join_date")
+    cleaned_df.loc[~cleaned_df.user_uuid.str.match(cleaner.uuid_regex, na=False), "user_uuid"] = pd.NA
+    cleaned_df = cleaned_df.replace("NULL", pd.NA)
+    cleaned_df.country_code = cleaned_df.country_code.replace("GGB", "GB")
+    cleaned_df.phone_number = cleaner.parse_phone_numbers(
+        dataframe.phone_number, dataframe.country_code.replace(cleaner.country_code_corrections)
+    ).astype("string")
+    cleaned_df.email_address = cleaned_df.email_address.str.replace(r'@+', '@', regex=True)
+    cleaned_df.loc[~cleaned_df.email_address.str.match(cleaner.email_regex, na=False), "email_address"] = pd.NA
+    cleaned_df = cleaned_df.replace("NULL", pd.NA)
+    rows_before = len(cleaned_df)
+    cleaned_df = cleaned_df.dropna(how='any', axis='index')
+    cleaner.record_dropped("null_values", rows_before, len(cleaned_df))
+    return cleaned_df
+
+
+def reference_clean_card_data(dataframe: pd.DataFrame, cleaner: DataCleaning) -> pd.DataFrame:
+    """Clean card data the way `clean_card_data` did before it used a table spec, to compare with."""
+    dataframe = dataframe.copy()
+    dataframe[["card_number", "expiry_date"]] = DataCleaning.split_combined_card_data(dataframe)
+    cleaned_df = dataframe.drop(columns=['card_number expiry_date', 'Unnamed: 0'])
+    cleaned_df.card_number = cleaned_df.card_number.astype("string")
+    cleaned_df = cleaned_df.replace("NULL", pd.NA)
+    cleaned_df.card_number = cleaned_df.card_number.replace(r'[^0-9]+', '', regex=True)
+    cleaned_df.card_number = cleaned_df.card_number.replace('', pd.NA, regex=True)
+    cleaned_df.card_provider = cleaned_df.card_provider.astype("string")
+    cleaned_df.expiry_date = pd.to_datetime(cleaned_df.expiry_date, errors="coerce", format=cleaner.expiry_date_format)
+    cleaned_df = cleaner.parse_multiple_date_formats(cleaned_df, "date_payment_confirmed")
+    rows_before = len(cleaned_df)
+    cleaned_df = cleaned_df.dropna(how='any', axis='index')
+    cleaner.record_dropped("null_values", rows_before, len(cleaned_df))
+    return cleaned_df
+
+
+def reference_clean_store_data(dataframe: pd.DataFrame, cleaner: DataCleaning) -> pd.DataFrame:
+    """Clean store data the way `clean_store_data` did before it used a table spec, to compare with."""
+    cleaned_store_df = dataframe.replace('N/A', pd.NA)
+    cleaned_store_df = cleaned_store_df.replace([None], pd.NA)
+    cleaned_store_df = cleaned_store_df.drop(columns=['lat'])
+    cleaned_store_df = cleaned_store_df.astype(
+        {
+            "address": "string",
+            "locality": "string",
+            "store_code": "string",
+            "store_type": "string",
+            "country_code": "string",
+            "continent": "string"
+        }
+    )
+    cleaned_store_df.staff_numbers = cleaned_store_df.staff_numbers.replace(r'[^0-9]+', '', regex=True)
+    cleaned_store_df.staff_numbers = cleaned_store_df.staff_numbers.replace('', pd.NA, regex=True)
+    cleaned_store_df.staff_numbers = pd.to_numeric(cleaned_store_df.staff_numbers, errors="coerce").astype("Int64")
+    cleaned_store_df.longitude = pd.to_numeric(cleaned_store_df.longitude, errors="coerce").astype("float")
+    cleaned_store_df.latitude = pd.to_numeric(cleaned_store_df.latitude, errors="coerce").astype("float")
+    cleaned_store_df = cleaner.parse_multiple_date_formats(cleaned_store_df, "opening_date")
+    mask = cleaned_store_df.country_code.isin(["GB", "DE", "US"])
+    cleaner.record_dropped("invalid_country_code", len(cleaned_store_df), int(mask.sum()))
+    cleaned_store_df = cleaned_store_df[mask]
+    cleaned_store_df.loc[:, "continent"] = cleaned_store_df["continent"].str.replace("ee", "")
+    web_mask = cleaned_store_df["store_type"] == "Web Portal"
+    rows_before = len(cleaned_store_df)
+    cleaned_store_df = cleaned_store_df[web_mask | cleaned_store_df.drop(columns=["store_type"]).notna().all(axis=1)]
+    cleaner.record_dropped("null_values", rows_before, len(cleaned_store_df))
+    return cleaned_store_df
+
+
+def reference_clean_products_data(dataframe: pd.DataFrame, cleaner: DataCleaning) -> pd.DataFrame:
+    """Clean products data the way `clean_products_data` did before it used a table spec, to compare with."""
+    cleaned_csv_data = dataframe.drop(columns=["Unnamed: 0"])
+    cleaned_csv_data.weight = cleaner.convert_product_weights_column(cleaned_csv_data.weight)
+    cleaned_csv_data.weight = pd.to_numeric(cleaned_csv_data.weight, errors="coerce").astype("float")
+    cleaned_csv_data.loc[~cleaned_csv_data.removed.isin(["Removed", "Still_avaliable"])] = pd.NA
+    cleaned_csv_data.removed = cleaned_csv_data.removed.map({"Removed": True, "Still_avaliable": False}).astype("boolean")
+    cleaned_csv_data.loc[~cleaned_csv_data.uuid.str.match(cleaner.uuid_regex, na=False), "uuid"] = pd.NA
+    cleaned_csv_data.product_price = cleaned_csv_data.product_price.str.extract(cleaner.currency_regex)
+    cleaned_csv_data.product_price = cleaned_csv_data.product_price.astype("Float64")
+    cleaned_csv_data = cleaned_csv_data.astype(
+        {
+            "product_name": "string",
+            "category": "string",
+            "product_code": "string",
+            "uuid": "string"
+        }
+    )
+    ean = pd.to_numeric(cleaned_csv_data.EAN, errors="coerce")
+    # Was astype("int64", errors="ignore"), which keeps the floats when any EAN is not a number
+    cleaned_csv_data.EAN = ean if ean.hasnans else ean.astype("int64")
+    cleaned_csv_data = cleaner.parse_multiple_date_formats(cleaned_csv_data, "date_added")
+    rows_before = len(cleaned_csv_data)
+    cleaned_csv_data = cleaned_csv_data.dropna(how="any", axis="index")
+    cleaner.record_dropped("null_values", rows_before, len(cleaned_csv_data))
+    return cleaned_csv_data
+
+
+def reference_clean_orders_data(dataframe: pd.DataFrame, cleaner: DataCleaning) -> pd.DataFrame:
+    """Clean orders data the way `clean_orders_data` did before it used a table spec, to compare with.
+
+    The source index becomes the index, as `clean_orders_data` has done since, instead of being dropped.
+    """
+    cleaned_orders_df = dataframe.set_index("index").drop(columns=["level_0", "first_name", "last_name", "1"])
+    return cleaned_orders_df.astype(
+        {
+            "date_uuid": "string",
+            "user_uuid": "string",
+            "store_code": "string",
+            "product_code": "string"
+        }
+    )
+
+
+def reference_clean_date_details_data(dataframe: pd.DataFrame, cleaner: DataCleaning) -> pd.DataFrame:
+    """Clean date details the way `clean_date_details_data` did before it used a table spec, to compare with."""
+    dataframe = dataframe.copy()
+    dataframe.loc[~dataframe.time_period.isin(["Morning", "Midday", "Evening", "Late_Hours"])] = pd.NA
+    dataframe["datetime_str"] = (
+        dataframe.day.astype("str")
+        + "-"
+        + dataframe.month.astype("str")
+        + "-"
+        + dataframe.year.astype("str")
+        + " "
+        + dataframe.timestamp
+    )
+    dataframe["datetime"] = pd.to_datetime(dataframe["datetime_str"], format="%d-%m-%Y %H:%M:%S", errors="coerce")
+    dataframe = dataframe.drop(columns=["datetime_str", "day", "month", "year", "timestamp"])
+    dataframe.loc[~dataframe.date_uuid.str.match(cleaner.uuid_regex, na=False), "date_uuid"] = pd.NA
+    dataframe = dataframe.astype({"time_period": "string", "date_uuid": "string"})
+    rows_before = len(dataframe)
+    dataframe = dataframe.dropna(how="any", axis="index")
+    cleaner.record_dropped("null_values", rows_before, len(dataframe))
+    return dataframe
+
+
+# Cleaners as they were before the table specs, keyed by the name of the method they are compared with
+REFERENCE_CLEANERS = {
+    "clean_user_data": reference_clean_user_data,
+    "clean_card_data": reference_clean_card_data,
+    "clean_store_data": reference_clean_store_data,
+    "clean_products_data": reference_clean_products_data,
+    "clean_orders_data": reference_clean_orders_data,
+    "clean_date_details_data": reference_clean_date_details_data,
+}
+
+
+def sqlite_connector(directory: str) -> DatabaseConnector:
+    """Return a connector to a new SQLite database in a directory, standing in for Postgres."""
+    credential_path = os.path.join(directory, "sqlite_creds.yaml")
+    with open(credential_path, "w") as credential_file:
+        yaml.safe_dump({
+            "RDS_USER": None,
+            "RDS_PASSWORD": None,
+            "RDS_HOST": None,
+            "RDS_PORT": None,
+            "RDS_DATABASE": os.path.join(directory, "benchmark.sqlite"),
+        }, credential_file)
+    return DatabaseConnector(credential_path, db_type="sqlite", db_api="pysqlite")
+
+
+class StoreApiHandler(BaseHTTPRequestHandler):
+    """Stand-in for the store API, serving the stores of its server after its latency."""
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if self.path == "/number_stores":
+            body = {"number_stores": len(self.server.stores)}
+        elif self.path.startswith("/store_details/") and self.server.available:
+            body = self.server.stores.iloc[int(self.path.rsplit("/", 1)[1])].to_dict()
+        else:
+            self.send_error(404)
+            return
+        content = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_store_api(stores: pd.DataFrame, latency: float = 0.0) -> ThreadingHTTPServer:
+    """Serve stores on a local port like the store API, until the server is shut down.
+
+    Args:
+        stores (pd.DataFrame): Stores to serve, one per row.
+        latency (float, optional): Seconds every response is delayed by, as if it crossed a network. Defaults to 0.0.
+
+    Returns:
+        ThreadingHTTPServer: Running server. Set `available` to False to answer 404 for every store.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StoreApiHandler)
+    server.stores = stores
+    server.latency = latency
+    server.available = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def store_api_config(server: ThreadingHTTPServer, **options) -> dict:
+    """Return the API configuration for a stand-in store API, see `DataExtractor.load_api_config`."""
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    return {
+        "header": {},
+        "retrieve_store_count_url": f"{url}/number_stores",
+        "retrieve_store_url": f"{url}/store_details/",
+        **options,
+    }
+
+
+def reference_retrieve_stores(config: dict) -> pd.DataFrame:
+    """Fetch the stores the way `retrieve_stores_data` did before it was concurrent, to compare with.
+
+    Stores are fetched one at a time, sleeping for `request_delay` after each one.
+    """
+    response = requests.get(config["retrieve_store_count_url"], headers=config["header"])
+    number_of_stores = int(response.json()["number_stores"])
+
+    store_jsons = []
+    for index in range(number_of_stores):
+        response = requests.get(config["retrieve_store_url"] + str(index), headers=config["header"])
+        store_jsons.append(response.json())
+        time.sleep(config["request_delay"])
+    return pd.DataFrame(store_jsons)
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import time
+
+import pandas as pd
+import pytest
+import requests
+import yaml
+
+from async_extraction import AsyncDataExtractor
+from data_extraction import DataExtractor
+from database_utils import DatabaseConnector, dispose_engines
+from pipeline_metrics import PipelineMetrics
+from tests.reference import SyntheticData, serve_store_api, sqlite_connector, store_api_config
+
+STORES = SyntheticData(seed=2).stores(5)
+PRODUCTS = SyntheticData(seed=2).products(1_000)
+DATE_DETAILS = SyntheticData(seed=2).date_details(1_000)
+ORDERS = SyntheticData(seed=2).orders(2_500)
+
+
+@pytest.fixture
+def store_api(tmp_path, monkeypatch):
+    """Serve the store API on a local port, with api_creds.yaml pointing at it in the working directory."""
+    server = serve_store_api(STORES)
+    with open(tmp_path / "api_creds.yaml", "w") as config_file:
+        yaml.safe_dump(store_api_config(
+            server, requests_per_second=100, max_concurrent_requests=4, max_retries=0
+        ), config_file)
+    monkeypatch.chdir(tmp_path)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    """Stand-in S3 bucket holding the products CSV and the date details JSON."""
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-1")
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket="data-handling", CreateBucketConfiguration={"LocationConstraint": "eu-west-1"})
+        client.put_object(Bucket="data-handling", Key="products.csv", Body=PRODUCTS.to_csv(index=False).encode())
+        client.put_object(Bucket="data-handling", Key="date_details.json", Body=DATE_DETAILS.to_json().encode())
+        yield "s3://data-handling"
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def rds(request, tmp_path_factory):
+    """Stand-in RDS database holding orders_table, in SQLite or in a local Postgres server."""
+    directory = tmp_path_factory.mktemp("rds")
+    if request.param == "sqlite":
+        connector = sqlite_connector(str(directory))
+        server = None
+    else:
+        pgserver = pytest.importorskip("pgserver")
+        pytest.importorskip("psycopg2")
+        server = pgserver.get_server(directory / "pgdata", cleanup_mode="stop")
+        credential_path = directory / "db_creds.yaml"
+        with open(credential_path, "w") as credential_file:
+            yaml.safe_dump({
+                "RDS_USER": "postgres",
+                "RDS_PASSWORD": None,
+                "RDS_HOST": str(directory / "pgdata"),
+                "RDS_PORT": None,
+                "RDS_DATABASE": "postgres",
+            }, credential_file)
+        connector = DatabaseConnector(str(credential_path))
+    # The index is written as the level_0 column, as in the real table
+    connector.upload_to_db(ORDERS.set_index("level_0"), "orders_table")
+    yield connector
+    dispose_engines()
+    if server is not None:
+        server.cleanup()
+
+
+@pytest.fixture
+def async_extractor(rds, store_api, s3_bucket, tmp_path):
+    async_extractor = AsyncDataExtractor(DataExtractor(rds, cache_dir=str(tmp_path / ".cache")))
+    yield async_extractor
+    async_extractor.close()
+
+
+def test_extracts_every_source_in_one_event_loop(async_extractor, s3_bucket):
+    async def read_chunks():
+        return [chunk async for chunk in async_extractor.read_rds_table_chunks("orders_table", chunksize=1_000)]
+
+    async def extract_all():
+        return await asyncio.gather(
+            read_chunks(),
+            async_extractor.read_rds_table("orders_table"),
+            async_extractor.retrieve_stores_data(),
+            async_extractor.extract_from_s3(f"{s3_bucket}/products.csv"),
+            async_extractor.extract_from_s3(f"{s3_bucket}/date_details.json", data_type="json"),
+        )
+
+    chunks, orders, stores, products, date_details = asyncio.run(extract_all())
+
+    assert len(orders) == len(ORDERS)
+    assert pd.concat(chunks).equals(orders)
+    assert stores["store_code"].tolist() == STORES["store_code"].tolist()
+    assert products["product_code"].tolist() == PRODUCTS["product_code"].tolist()
+    assert date_details["date_uuid"].tolist() == DATE_DETAILS["date_uuid"].tolist()
+
+    assert async_extractor.sources["orders_table"]["rows"] == 2 * len(ORDERS)
+    assert async_extractor.sources["stores_api"]["rows"] == len(STORES)
+    throughput = async_extractor.throughput()
+    assert set(throughput) == {
+        "orders_table", "stores_api", f"{s3_bucket}/products.csv", f"{s3_bucket}/date_details.json"
+    }
+    assert all(bytes_per_second > 0 for bytes_per_second in throughput.values())
+
+
+def test_prefetched_chunks_stay_in_order_and_bounded(async_extractor):
+    chunks, fill = async_extractor.prefetch_chunks(
+        "orders_table",
+        lambda: async_extractor.extractor.read_rds_table_chunks("orders_table", chunksize=500),
+        max_chunks=2,
+    )
+
+    received = []
+    fetched_ahead = []
+
+    def use_chunks():
+        # The chunks are used slowly by a thread outside the event loop, as the stages do
+        for chunk in chunks:
+            received.append(chunk)
+            time.sleep(0.05)
+            fetched_ahead.append(async_extractor.sources["orders_table"]["rows"] - 500 * len(received))
+
+    async def consume():
+        task = asyncio.create_task(fill)
+        await asyncio.to_thread(use_chunks)
+        await task
+
+    asyncio.run(consume())
+
+    assert [len(chunk) for chunk in received] == [500] * 5
+    # At most the two chunks waiting in the channel, and the one waiting to be put in it, are ahead
+    assert max(fetched_ahead) <= 3 * 500
+    assert pd.concat(received)["date_uuid"].tolist() == ORDERS["date_uuid"].tolist()
+
+
+def test_prefetch_raises_extraction_errors_in_the_waiting_thread(async_extractor, store_api):
+    store_api.available = False
+    future, fill = async_extractor.prefetch("stores_api", async_extractor.extractor.retrieve_stores_data)
+
+    asyncio.run(fill)
+
+    with pytest.raises(requests.HTTPError):
+        future.result()
+    assert "stores_api" not in async_extractor.sources
+
+
+def test_transferred_bytes_count_towards_the_stage_of_each_source(store_api, s3_bucket, tmp_path):
+    metrics = PipelineMetrics(output_dir=str(tmp_path / "metrics"))
+    extractor = DataExtractor(
+        DatabaseConnector(), cache_dir=str(tmp_path / ".cache"), on_transfer=metrics.add_transferred
+    )
+    async_extractor = AsyncDataExtractor(extractor)
+    # Stores are fetched before their stage starts, on other threads, as `run_async` does
+    future, fill = async_extractor.prefetch(
+        "stores_api", metrics.counting_transfers("dim_store_details", extractor.retrieve_stores_data)
+    )
+    asyncio.run(fill)
+    async_extractor.close()
+    with metrics.stage("dim_store_details"):
+        future.result()
+    with metrics.stage("dim_products"):
+        extractor.extract_from_s3(f"{s3_bucket}/products.csv")
+        # Served from the cache, so nothing more is downloaded
+        extractor.extract_from_s3(f"{s3_bucket}/products.csv")
+
+    store_bytes = len(json.dumps({"number_stores": len(STORES)}).encode()) + sum(
+        len(json.dumps(store).encode()) for store in STORES.to_dict("records")
+    )
+    assert metrics.stages["dim_store_details"]["transferred_bytes"] == {"extract": store_bytes}
+    assert metrics.stages["dim_products"]["transferred_bytes"] == {
+        "extract": len(PRODUCTS.to_csv(index=False).encode())
+    }
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from tests.reference import REFERENCE_CLEANERS, SyntheticData
+from data_cleaning import DataCleaning
+
+
+def generators(data: SyntheticData) -> dict:
+    """Generator of the raw data for each cleaner."""
+    return {
+        "clean_user_data": data.users,
+        "clean_card_data": data.cards,
+        "clean_store_data": data.stores,
+        "clean_products_data": data.products,
+        "clean_orders_data": data.orders,
+        "clean_date_details_data": data.date_details,
+    }
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("method", list(REFERENCE_CLEANERS))
+def test_spec_cleaners_match_the_cleaners_they_replaced(method, seed):
+    dataframe = generators(SyntheticData(seed))[method](5_000)
+    original = dataframe.copy()
+    spec_drops, reference_drops = [], []
+
+    cleaned = getattr(DataCleaning(on_drop=lambda rule, count: spec_drops.append((rule, count))), method)(dataframe)
+    expected = REFERENCE_CLEANERS[method](
+        dataframe.copy(), DataCleaning(on_drop=lambda rule, count: reference_drops.append((rule, count)))
+    )
+
+    pd.testing.assert_frame_equal(cleaned, expected)
+    assert spec_drops == reference_drops
+    # The spec cleaners never modify their input
+    pd.testing.assert_frame_equal(dataframe, original)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tests.reference import SyntheticData, reference_parse_dates, reference_parse_phones, reference_split_card_data
+from data_cleaning import DataCleaning
+
+# Weights in every shape convert_product_weights handles, including the ones it rejects
+EDGE_CASE_WEIGHTS = [
+    "100g", "1.2g", "0.5kg", "2KG", "500ml", "16oz", "12 x 125g", "3 x 2g", " 3 x  2g ", "12x100g",
+    "77g .", "5kg ", "  5kg", " 5kg", "9GO", "ABC", ".g", "1.2.3g", "5", "g", "", "5 lb", "40 x 1.5g",
+    np.nan, None, 12.5,
+]
+
+
+def scalar_weights(weights: pd.Series) -> pd.Series:
+    """Convert weights one at a time with the scalar converter, as floats with NaN for None."""
+    cleaner = DataCleaning()
+    return pd.Series([cleaner.convert_product_weights(weight) for weight in weights], dtype="float")
+
+
+@pytest.mark.parametrize("weight", EDGE_CASE_WEIGHTS)
+def test_weight_column_matches_scalar_converter(weight):
+    weights = pd.Series([weight], dtype="object")
+    vectorised = DataCleaning().convert_product_weights_column(weights)
+    pd.testing.assert_series_equal(vectorised, scalar_weights(weights), check_names=False)
+
+
+def test_weight_column_matches_scalar_converter_on_synthetic_products():
+    weights = SyntheticData(seed=1).products(20_000)["weight"]
+    vectorised = DataCleaning().convert_product_weights_column(weights)
+    pd.testing.assert_series_equal(vectorised.reset_index(drop=True), scalar_weights(weights), check_names=False)
+
+
+def test_weight_column_rejects_malformed_multipliers():
+    # The scalar converter raises on these, the column converter gives NaN
+    weights = pd.Series(["12 x 2 x 125g", "x 5g", "a x 5g"])
+    assert DataCleaning().convert_product_weights_column(weights).isna().all()
+
+
+def test_date_column_matches_row_wise_parser_on_synthetic_dates():
+    cleaner = DataCleaning()
+    dates = pd.Series(SyntheticData(seed=1).dates(20_000))
+    parsed = cleaner.parse_date_column(dates)
+    pd.testing.assert_series_equal(parsed, reference_parse_dates(dates, cleaner), check_names=False)
+
+
+def test_card_split_matches_row_wise_apply_on_synthetic_cards():
+    cards = SyntheticData(seed=1).cards(2_000)
+    split = DataCleaning.split_combined_card_data(cards)
+    pd.testing.assert_frame_equal(split, reference_split_card_data(cards))
+
+
+@pytest.mark.parametrize("phone_workers", [None, 2])
+def test_phone_numbers_match_row_wise_parser_on_synthetic_phones(phone_workers):
+    phones = SyntheticData(seed=1).phones(20_000)
+    # Values that cannot be parsed, and values that are not strings
+    phones.loc[:4, "phone_number"] = ["abc", "NULL", "ext 42", None, np.nan]
+    regions = phones["country_code"].replace({"GGB": "GB"})
+    cleaner = DataCleaning(phone_workers=phone_workers)
+    cleaner.min_phone_worker_numbers = 1_000
+
+    parsed = cleaner.parse_phone_numbers(phones["phone_number"], regions)
+
+    pd.testing.assert_series_equal(parsed, reference_parse_phones(phones["phone_number"], regions), check_names=False)
+    # Unparseable strings pass through as they are, so the user is not dropped
+    assert parsed[:3].tolist() == ["abc", "NULL", "ext 42"]
+    assert parsed[3:5].isna().all()
+    # Most numbers are parsed to the international format
+    assert parsed.str.startswith("+").mean() > 0.95
+
+
+def test_orders_keep_their_source_index_and_repeated_lines():
+    orders = SyntheticData(seed=1).orders(1_000)
+    orders["index"] += 5_000
+    repeated = pd.concat([orders, orders.assign(index=orders["index"] + 1_000)], ignore_index=True)
+    cleaned = DataCleaning().clean_orders_data(repeated)
+    assert len(cleaned) == 2_000
+    assert cleaned.index.name == "index"
+    assert cleaned.index.tolist() == repeated["index"].tolist()
+    assert "index" not in cleaned.columns
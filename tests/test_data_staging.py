@@ -0,0 +1,63 @@
+import os
+
+import pandas as pd
+
+from data_staging import DataStaging
+
+
+def stage_run(staging_dir: str, **kwargs) -> DataStaging:
+    """Start a run and save one artifact, so its directory exists."""
+    staging = DataStaging(staging_dir, **kwargs)
+    staging.cached("dim_users", "raw", lambda: pd.DataFrame({"user_uuid": ["a", "b"]}))
+    return staging
+
+
+def test_runs_started_together_get_their_own_directories(tmp_path):
+    runs = [stage_run(str(tmp_path)) for _ in range(5)]
+    assert len({staging.run_dir for staging in runs}) == 5
+    # Runs sort in the order they started, so resuming picks the latest
+    assert DataStaging(str(tmp_path)).list_runs() == [staging.run_id for staging in runs]
+    assert DataStaging(str(tmp_path), resume=True).run_id == runs[-1].run_id
+
+
+def test_prune_keeps_the_latest_runs(tmp_path):
+    runs = [stage_run(str(tmp_path)) for _ in range(5)]
+    removed = runs[-1].prune(keep_runs=2)
+    assert removed == [staging.run_id for staging in runs[:3]]
+    assert sorted(os.listdir(tmp_path)) == [staging.run_id for staging in runs[3:]]
+
+
+def test_prune_never_removes_the_resumed_run(tmp_path):
+    runs = [stage_run(str(tmp_path)) for _ in range(3)]
+    resumed = DataStaging(str(tmp_path), run_id=runs[0].run_id, resume=True)
+    resumed.prune(keep_runs=1)
+    assert os.listdir(tmp_path) == [runs[0].run_id]
+
+
+def test_staging_does_not_change_the_data_passed_on(tmp_path):
+    raw = pd.DataFrame({"staff_numbers": [3, "J78", None], "store_code": ["ST-1", "ST-2", None]})
+    staged = DataStaging(str(tmp_path)).cached("dim_store_details", "raw", lambda: raw.copy())
+    pd.testing.assert_frame_equal(staged, raw)
+
+    chunks = DataStaging(str(tmp_path)).cached_chunks("orders_table", "raw", lambda: [raw.copy(), raw.copy()])
+    for chunk in chunks:
+        pd.testing.assert_frame_equal(chunk, raw)
+
+
+def test_staging_reports_the_bytes_written_and_read(tmp_path):
+    transfers = []
+    staging = DataStaging(str(tmp_path), on_transfer=lambda kind, count: transfers.append((kind, count)))
+    staging.cached("dim_users", "raw", lambda: pd.DataFrame({"user_uuid": ["a", "b"]}))
+    list(staging.cached_chunks("orders_table", "raw", lambda: [pd.DataFrame({"index": [1]})] * 2))
+    resumed = DataStaging(
+        str(tmp_path), resume=True, on_transfer=lambda kind, count: transfers.append((kind, count))
+    )
+    resumed.cached("dim_users", "raw", lambda: None)
+
+    file_sizes = [
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(staging.run_dir) for name in names if name.endswith(".parquet")
+    ]
+    written = [count for kind, count in transfers if kind == "staging_write"]
+    assert len(written) == 3 and sum(written) == sum(file_sizes)
+    assert [kind for kind, _ in transfers].count("staging_read") == 1
@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from tests.reference import SyntheticData
+from data_cleaning import DataCleaning
+from partitioned_cleaning import PartitionedCleaner
+
+USERS = SyntheticData(seed=3).users(3_000)
+ORDERS = SyntheticData(seed=3).orders(3_000)
+
+
+def configured_cleaner(drops: list) -> DataCleaning:
+    """Cleaner with settings that differ from the defaults, which the workers have to clean with too."""
+    cleaner = DataCleaning(on_drop=lambda rule, count: drops.append((rule, count)), unique_cache_size=10)
+    cleaner.date_formats = [cleaner.date_format]
+    # Only UUIDs starting with a digit are valid, so about half of the users are dropped
+    cleaner.uuid_regex = r"^[0-9][0-9a-f]{7}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$"
+    cleaner.build_plans()
+    return cleaner
+
+
+@pytest.fixture(scope="module")
+def partitioned():
+    drops = []
+    with PartitionedCleaner(configured_cleaner(drops), workers=2, min_partition_rows=500) as partitioned_cleaner:
+        yield partitioned_cleaner, drops
+
+
+@pytest.mark.parametrize("method, dataframe", [("clean_user_data", USERS), ("clean_orders_data", ORDERS)])
+def test_partitioned_output_matches_cleaning_in_process(partitioned, method, dataframe):
+    partitioned_cleaner, partitioned_drops = partitioned
+    partitioned_drops.clear()
+    in_process_drops = []
+
+    cleaned = partitioned_cleaner.clean(method, dataframe.copy())
+    expected = getattr(configured_cleaner(in_process_drops), method)(dataframe.copy())
+
+    pd.testing.assert_frame_equal(cleaned, expected)
+    if method == "clean_user_data":
+        assert len(cleaned) < len(DataCleaning().clean_user_data(dataframe.copy()))
+
+    def totals(drops):
+        return pd.DataFrame(drops, columns=["rule", "count"]).groupby("rule")["count"].sum().to_dict()
+
+    assert totals(partitioned_drops) == totals(in_process_drops)
+
+
+def test_settings_recreate_the_cleaner():
+    cleaner = configured_cleaner([])
+    recreated = DataCleaning.from_settings(cleaner.settings())
+    assert recreated.date_formats == [cleaner.date_format]
+    assert recreated.user_plan.spec.columns["user_uuid"].pattern == cleaner.uuid_regex
+    assert recreated.unique_cache_size == 10
+    assert recreated.on_drop is None
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from stage_scheduler import StageScheduler
+
+
+def sleeping_stage(name: str, seconds: float, events: list):
+    """Return a stage recording when it starts and finishes, sleeping in between."""
+    def stage():
+        events.append((time.perf_counter(), "start", name))
+        time.sleep(seconds)
+        events.append((time.perf_counter(), "finish", name))
+    return stage
+
+
+def test_stage_starts_when_its_dependencies_finish_not_its_siblings():
+    events = []
+    scheduler = StageScheduler()
+    scheduler.add_stage("fast", sleeping_stage("fast", 0.1, events))
+    scheduler.add_stage("slow", sleeping_stage("slow", 1.0, events))
+    scheduler.add_stage("after_fast", sleeping_stage("after_fast", 0.1, events), depends_on=["fast"])
+
+    scheduler.run()
+
+    order = [(kind, name) for _, kind, name in sorted(events)]
+    assert order.index(("start", "after_fast")) == order.index(("finish", "fast")) + 1
+    assert order.index(("finish", "after_fast")) < order.index(("finish", "slow"))
+
+
+def test_critical_path_is_the_longest_chain():
+    events = []
+    scheduler = StageScheduler()
+    scheduler.add_stage("a", sleeping_stage("a", 0.1, events))
+    scheduler.add_stage("b", sleeping_stage("b", 0.4, events))
+    scheduler.add_stage("c", sleeping_stage("c", 0.4, events), depends_on=["a"])
+
+    start_time = time.perf_counter()
+    scheduler.run()
+    elapsed = time.perf_counter() - start_time
+
+    path, path_time = scheduler.critical_path()
+    assert path == ["a", "c"]
+    assert path_time == pytest.approx(0.5, abs=0.1)
+    # The run takes as long as its critical path, not as long as every stage
+    assert elapsed == pytest.approx(path_time, abs=0.1)
+
+
+def test_failed_stage_is_raised_and_its_dependents_are_not_run():
+    events = []
+
+    def fail():
+        raise RuntimeError("extract failed")
+
+    scheduler = StageScheduler()
+    scheduler.add_stage("failing", fail)
+    scheduler.add_stage("dependent", sleeping_stage("dependent", 0.0, events), depends_on=["failing"])
+
+    with pytest.raises(RuntimeError, match="extract failed"):
+        scheduler.run()
+    assert events == []